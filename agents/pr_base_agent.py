@@ -1,19 +1,27 @@
 # Standard library imports
+import asyncio
 import json
 from typing import List, Dict
 from typing_extensions import Optional, TypedDict
 from dataclasses import dataclass
 import pytest
 import sys
+import time
 
 # Local imports
-from utils import github_utils
-from utils.file_utils import update_file
-from prompts.review_prompt import generate_review_response
-from prompts.test_gating_prompt import generate_gating_response
-from prompts.test_case_update_prompt import generate_test_case_response
+from utils import github_utils, metrics, tracing
+from utils.file_filter import FILE_FILTER_ENABLED, get_file_classifier
+from utils.file_utils import LazyChangedFiles, get_blob_text, iter_changed_files, skipped_files
+from utils.inline_review import map_comments, submit_review
+from utils.context_packer import pack_context, PackedContext
+from prompts.review_prompt import generate_review_response, agenerate_review_response, stream_review_response, astream_review_response
+from prompts.test_gating_prompt import generate_gating_response, agenerate_gating_response
+from prompts.test_case_update_prompt import generate_test_case_response, agenerate_test_case_response
 from utils.logging_utils import log_info, log_error, log_debug
 from prompts.fix_test_prompt import generate_fix_response
+from utils.comment_updater import ThrottledCommentUpdater
+from utils.relevance_index import RelevanceIndex, TEST_INDEX_TOP_K, load_test_index
+from config.constants import REVIEW_INLINE_COMMENTS, REVIEW_STREAMING, REVIEW_STREAM_MIN_INTERVAL
 
 # Maximum file size threshold in bytes
 FILE_SIZE_THRESHOLD = 32000
@@ -38,6 +46,7 @@ class PRBaseAgent:
     def __init__(self):
         pass
 
+    @metrics.timed("agent_stage_seconds", stage="handle_pull_request")
     def handle_pull_request(self, repository, pull_number, head_ref):
         """
         Fetches files and commits for a pull request
@@ -48,16 +57,58 @@ class PRBaseAgent:
             head_ref: The head branch reference
             
         Returns:
-            Tuple of (files, commits)
+            Tuple of (files, commits); the file contents are downloaded as the files are first iterated
         """
         log_info(f"Fetching files and commits for PR #{pull_number}")
-        files = [update_file(f, repository, head_ref) for f in github_utils.get_pull_request_files(repository, pull_number)]
+        pr_files = github_utils.get_pull_request_files(repository, pull_number)
+        try:
+            # One tree request gives every blob size, so oversized files are never downloaded
+            sizes = github_utils.get_blob_sizes(repository, head_ref)
+        except Exception as ex:
+            log_error("Error fetching blob sizes, deciding after download", ex)
+            sizes = {}
+
+        def base_blobs():
+            base_sha = github_utils.get_pull_request(repository, pull_number).base.sha
+            return github_utils.get_tree_blobs(repository, base_sha)
+
+        # Lock files, generated and vendored code... are recognized from the file list, before any download
+        classifier = get_file_classifier(repository, head_ref) if FILE_FILTER_ENABLED else None
+        files = LazyChangedFiles(iter_changed_files(repository, pr_files, head_ref, sizes, base_blobs=base_blobs,
+                                                    classify=classifier.classify if classifier else None))
         commits = github_utils.get_pull_request_commits(repository, pull_number)
         return files, commits
 
+    @metrics.timed("agent_stage_seconds", stage="pack_context")
+    def pack_context(self, task_name, updated_files, existing_tests=None) -> PackedContext:
+        """
+        Fits changed files and existing tests into the token budget of a prompt
+
+        Args:
+            task_name: The prompt task the context is packed for
+            updated_files: Changed files from handle_pull_request
+            existing_tests: Existing test files, if the task uses them
+
+        Returns:
+            PackedContext with the files and tests to send to the prompt
+        """
+        packed = pack_context(task_name, updated_files, existing_tests)
+        for item in packed.dropped:
+            log_debug("Dropped %s of %s from '%s' prompt (%d tokens): %s", item.kind, item.filename, task_name, item.tokens, item.reason)
+        return packed
+
 class PRCommentAgent(PRBaseAgent):
     """Agent that analyzes PRs and posts review comments"""
+
+    # Hidden marker identifying the review comment, so re-reviews edit it instead of posting a new one
+    REVIEW_COMMENT_MARKER = "<!-- pr-agent:review -->"
+
+    def __init__(self, streaming: bool = REVIEW_STREAMING, inline_comments: bool = REVIEW_INLINE_COMMENTS):
+        super().__init__()
+        self.streaming = streaming
+        self.inline_comments = inline_comments
     
+    @metrics.timed("agent_stage_seconds", stage="analyze_code")
     def analyze_code(self, title: str, updated_files: List[FileChange], commit_messages: List[str]) :
         """
         Analyzes the code changes in the PR
@@ -74,6 +125,51 @@ class PRCommentAgent(PRBaseAgent):
         response = generate_review_response(title, updated_files, commit_messages)
         return response
 
+    @metrics.timed("agent_stage_seconds", stage="aanalyze_code")
+    async def aanalyze_code(self, title: str, updated_files: List[FileChange], commit_messages: List[str]):
+        """
+        Async variant of analyze_code
+        """
+        log_info(f"Analyzing code changes for PR: {title}")
+        return await agenerate_review_response(title, updated_files, commit_messages)
+
+    @metrics.timed("agent_stage_seconds", stage="stream_review")
+    def stream_review(self, comment, title: str, updated_files: List[FileChange], commit_messages: List[str]):
+        """
+        Analyzes the code changes while rendering the partial review into the comment at a throttled rate
+
+        Args:
+            comment: The placeholder comment to edit
+            title: PR title
+            updated_files: List of changed files
+            commit_messages: List of commit messages
+
+        Returns:
+            Analysis response object
+        """
+        log_info(f"Streaming code review for PR: {title}")
+        updater = ThrottledCommentUpdater(comment, github_utils.update_comment, REVIEW_STREAM_MIN_INTERVAL)
+        try:
+            return stream_review_response(title, updated_files, commit_messages,
+                                          lambda partial: updater.submit(self.render_partial_review(partial)))
+        finally:
+            updater.close()
+
+    @metrics.timed("agent_stage_seconds", stage="astream_review")
+    async def astream_review(self, comment, title: str, updated_files: List[FileChange], commit_messages: List[str]):
+        """
+        Async variant of stream_review
+        """
+        log_info(f"Streaming code review for PR: {title}")
+        updater = ThrottledCommentUpdater(comment, github_utils.update_comment, REVIEW_STREAM_MIN_INTERVAL)
+        try:
+            return await astream_review_response(title, updated_files, commit_messages,
+                                                 lambda partial: updater.submit(self.render_partial_review(partial)))
+        finally:
+            # close() may wait for an in-flight edit, keep that off the event loop
+            await asyncio.to_thread(updater.close)
+
+    @metrics.timed("agent_stage_seconds", stage="handle_pull_request_opened")
     def handle_pull_request_opened(self, payload):
         """
         Handles a pull request opened event
@@ -86,44 +182,116 @@ class PRCommentAgent(PRBaseAgent):
         pull_number = payload["pull_request"]["number"]
         title = payload["pull_request"]["title"]
         head_ref = payload["pull_request"]["head"]["ref"]
+        head_sha = payload["pull_request"]["head"].get("sha")
 
         log_info(f"Handling opened PR #{pull_number} in {owner}/{repo_name}")
 
         try:
             repository = github_utils.get_repository(owner, repo_name)
-            placeholder_comment = github_utils.post_comment(repository, pull_number, "Review in progress...")
+            placeholder_comment = github_utils.upsert_comment(repository, pull_number, self.REVIEW_COMMENT_MARKER,
+                                                              f"{self.REVIEW_COMMENT_MARKER}\nReview in progress...")
 
             updated_files, commit_messages = self.handle_pull_request(repository, pull_number, head_ref)
-            analysis = self.analyze_code(title, updated_files, commit_messages)
+            packed = self.pack_context("summarize_pr", updated_files)
+            if self.streaming:
+                analysis = self.stream_review(placeholder_comment, title, packed.files, commit_messages)
+            else:
+                analysis = self.analyze_code(title, packed.files, commit_messages)
 
-            self.update_comment_with_review(placeholder_comment, analysis)
+            posted = self.post_inline_review(repository, pull_number, head_sha, analysis, updated_files) if self.inline_comments else ()
+            self.update_comment_with_review(placeholder_comment, analysis, skipped_files(updated_files), posted)
             return True
         except Exception as e:
             log_error(f"Error in PR Comment Agent: {e}")
-            github_utils.update_comment(placeholder_comment, f"Error Generating Review")
+            github_utils.update_comment(placeholder_comment, f"{self.REVIEW_COMMENT_MARKER}\nError Generating Review")
             return False
 
-    def update_comment_with_review(self, comment, analysis):
+    @metrics.timed("agent_stage_seconds", stage="post_inline_review")
+    def post_inline_review(self, repository, pull_number, commit_sha, analysis, updated_files):
+        """
+        Posts the line comments of the review that can be placed on the diff as one pull request review
+
+        Args:
+            repository: The GitHub repository
+            pull_number: The PR number
+            commit_sha: Head commit the review was generated for
+            analysis: The analysis results
+            updated_files: Changed files from handle_pull_request
+
+        Returns:
+            Set of (file path, line, comment) keys of the posted comments
+        """
+        mapped, unmapped = map_comments(analysis.file_analyses, updated_files)
+        if unmapped:
+            log_info("%d line comments are not on the diff and stay in the summary comment", len(unmapped))
+        if not mapped:
+            return set()
+        return {c.key for c in submit_review(repository, pull_number, commit_sha, mapped)}
+
+    @metrics.timed("agent_stage_seconds", stage="update_comment_with_review")
+    def update_comment_with_review(self, comment, analysis, skipped=None, posted=()):
         """
         Updates the review comment with analysis results
         
         Args:
             comment: The comment to update
             analysis: The analysis results
+            skipped: List of (file path, reason) for the files left out of the review
+            posted: Keys of the line comments already posted inline, which are left out of the comment
         """
         log_info("Updating PR comment with review analysis")
-        summary = analysis.summary
-        analyses = "\n".join([f"### {f.file_path}\n - " + f.analysis for f in analysis.file_analyses])
-        suggestions = "\n".join([f"- {s}" for s in analysis.suggestions])
-
-        body = f"""# Pull Request Review\n## Summary\n{summary}\n\n## File Analyses\n{analyses}\n\n## Suggestions\n{suggestions}\n"""
+        posted = set(posted)
+        file_analyses = []
+        for f in analysis.file_analyses:
+            remaining = [c for c in f.comments if (f.file_path, c.line, c.comment) not in posted]
+            text = f.analysis + "".join(f"\n   - Line {c.line}: {c.comment}" for c in remaining)
+            file_analyses.append((f.file_path, text))
+        body = self.render_review(analysis.summary, file_analyses, analysis.suggestions, skipped=skipped)
+        if posted:
+            body += f"\n*{len(posted)} line comments were posted in the inline review.*\n"
         github_utils.update_comment(comment, body)
 
+    def render_review(self, summary: str, file_analyses, suggestions: List[str], in_progress: bool = False, skipped=None) -> str:
+        """
+        Renders the review comment body
+
+        Args:
+            summary: Review summary
+            file_analyses: List of (file path, analysis) tuples
+            suggestions: List of suggestions
+            in_progress: Marks the review as still being generated
+            skipped: List of (file path, reason) for the files left out of the review
+        """
+        analyses = "\n".join([f"### {file_path}\n - " + text for file_path, text in file_analyses])
+        suggestions = "\n".join([f"- {s}" for s in suggestions])
+
+        body = f"""{self.REVIEW_COMMENT_MARKER}\n# Pull Request Review\n## Summary\n{summary}\n\n## File Analyses\n{analyses}\n\n## Suggestions\n{suggestions}\n"""
+        if skipped:
+            body += "\n<details><summary>Skipped files ({})</summary>\n\n{}\n</details>\n".format(
+                len(skipped), "\n".join(f"- `{path}`: {reason}" for path, reason in skipped))
+        if in_progress:
+            body += "\n*Review in progress...*\n"
+        return body
+
+    def render_partial_review(self, partial: Dict) -> str:
+        """
+        Renders a partially generated review. While a single review call is streaming its file
+        analyses, the last one may be incomplete, so it is only shown once the suggestions start.
+        Sharded reviews only report complete analyses.
+        """
+        analyses = partial.get("file_analyses") or []
+        if "summary" in partial and "suggestions" not in partial:
+            analyses = analyses[:-1]
+        analyses = [a for a in analyses if a.get("file_path") and a.get("analysis")]
+        return self.render_review(partial.get("summary") or "", [(a["file_path"], a["analysis"]) for a in analyses],
+                                  partial.get("suggestions") or [], in_progress=True)
+
 class PRTestAgent(PRBaseAgent):
     """Agent that handles test generation for pull requests"""
     
     MAX_RETRIES = 3
 
+    @metrics.timed("agent_stage_seconds", stage="handle_pull_request_for_test_agent")
     def handle_pull_request_for_test_agent(self, payload):
         """
         Handles test generation for a pull request
@@ -144,15 +312,18 @@ class PRTestAgent(PRBaseAgent):
             placeholder_comment = github_utils.post_comment(repository, pull_number, "Test analysis in progress...")
 
             updated_files, commit_messages = self.handle_pull_request(repository, pull_number, head_ref)
-            existing_tests = self.get_existing_test_files(repository, head_ref)
+            test_index = self.get_test_index(repository, head_ref)
+            existing_tests = self.select_relevant_tests(test_index, updated_files)
 
-            gating_result = self.gating_step(title, updated_files, commit_messages, existing_tests)
+            gating_context = self.pack_context("test_gating", updated_files, existing_tests)
+            gating_result = self.gating_step(title, gating_context.files, commit_messages, gating_context.tests)
             if not gating_result.shouldGenerateTests:
                 log_info(f"Skipping test generation: {gating_result.reasoning}")
                 github_utils.update_comment(placeholder_comment, f"Skipping test generation: {gating_result.reasoning}")
                 return True
 
-            test_proposals = self.generate_test_cases(title, updated_files, commit_messages, existing_tests, gating_result.recommendations)
+            generation_context = self.pack_context("test_update", updated_files, existing_tests)
+            test_proposals = self.generate_test_cases(title, generation_context.files, commit_messages, generation_context.tests, gating_result.recommendations)
             self.commitTestChanges(repository, head_ref, test_proposals)
 
             test_results = self.test_and_fix_tests(repository, head_ref, test_proposals)
@@ -164,31 +335,52 @@ class PRTestAgent(PRBaseAgent):
             github_utils.update_comment(placeholder_comment, f"Error Generating Tests")
             return False
 
-    def get_existing_test_files(self, repository, ref, dir_path="tests"):
+    @metrics.timed("agent_stage_seconds", stage="get_test_index")
+    def get_test_index(self, repository, ref, dir_path="tests") -> RelevanceIndex:
         """
-        Recursively fetches all test files from a repository
+        Builds the relevance index over the repository's test files at a ref. The index is cached per
+        commit and only the test files that changed since the last indexed commit are downloaded.
         
         Args:
             repository: The GitHub repository
             ref: Branch reference
-            dir_path: Directory path to search for tests
+            dir_path: Directory containing the tests
             
         Returns:
-            List of test file contents
+            RelevanceIndex over the Python files in dir_path (empty on errors)
         """
-        log_info(f"Fetching existing test files from {dir_path}")
-        files = []
+        log_info(f"Indexing test files in {dir_path}")
+        prefix = dir_path.rstrip("/") + "/"
         try:
-            contents = repository.get_contents(dir_path)
-            for item in contents:
-                if item.type == "file":
-                    files.append(github_utils.getFileContent(repository, item.path, ref))
-                elif item.type == "folder":
-                    files.extend(self.get_existing_test_files(repository, ref, item.path))
+            commit = github_utils.get_commit_sha(repository, ref)
+
+            def list_blobs():
+                blobs = github_utils.get_tree_blobs(repository, commit)
+                return {path: sha for path, sha in blobs.items() if path.startswith(prefix) and path.endswith(".py")}
+
+            return load_test_index(repository.full_name, commit, list_blobs,
+                                   lambda path, sha: get_blob_text(repository, sha))
         except Exception as ex:
-            log_error("Error fetching tests", ex)
-        return files
-    
+            log_error("Error indexing tests", ex)
+            return RelevanceIndex()
+
+    def select_relevant_tests(self, test_index: RelevanceIndex, updated_files, k=TEST_INDEX_TOP_K):
+        """
+        Retrieves the existing tests most relevant to the changed files
+        
+        Args:
+            test_index: Index from get_test_index
+            updated_files: Changed files
+            k: Maximum number of tests to return
+            
+        Returns:
+            List of test files as {"filename", "content"} dicts
+        """
+        tests = test_index.top_k(updated_files, k)
+        log_info("Selected %d of %d existing test files: %s", len(tests), len(test_index.tests), [t['filename'] for t in tests])
+        return tests
+
+    @metrics.timed("agent_stage_seconds", stage="gating_step")
     def gating_step(self, title, updated_files, commit_messages, existing_tests):
         """
         Determines if test generation should proceed
@@ -206,6 +398,15 @@ class PRTestAgent(PRBaseAgent):
         response = generate_gating_response(title, updated_files, commit_messages, existing_tests)
         return response
 
+    @metrics.timed("agent_stage_seconds", stage="agating_step")
+    async def agating_step(self, title, updated_files, commit_messages, existing_tests):
+        """
+        Async variant of gating_step
+        """
+        log_info("Performing test generation gating step")
+        return await agenerate_gating_response(title, updated_files, commit_messages, existing_tests)
+
+    @metrics.timed("agent_stage_seconds", stage="generate_test_cases")
     def generate_test_cases(self, title, updated_files, commit_messages, existing_tests, recommendations):
         """
         Generates test cases for the changed files
@@ -224,6 +425,15 @@ class PRTestAgent(PRBaseAgent):
         response=generate_test_case_response(title, updated_files, commit_messages, existing_tests, recommendations)
         return response
 
+    @metrics.timed("agent_stage_seconds", stage="agenerate_test_cases")
+    async def agenerate_test_cases(self, title, updated_files, commit_messages, existing_tests, recommendations):
+        """
+        Async variant of generate_test_cases
+        """
+        log_info("Generating test cases")
+        return await agenerate_test_case_response(title, updated_files, commit_messages, existing_tests, recommendations)
+
+    @metrics.timed("agent_stage_seconds", stage="commitTestChanges")
     def commitTestChanges(self, repository, head_ref, new_test_proposals):
         """
         Commits generated test files to the repository
@@ -235,7 +445,7 @@ class PRTestAgent(PRBaseAgent):
         """
         log_info("Committing generated test files")
         for proposal in new_test_proposals.test_proposals:
-            log_debug(f"Processing test proposal: {proposal}")
+            log_debug("Processing test proposal: %s", proposal)
             filename = proposal.filename
             test_content = proposal.testContent
             actions = proposal.actions
@@ -256,6 +466,7 @@ class PRTestAgent(PRBaseAgent):
                     # Delete the old file
                     github_utils.delete_file(repository, old_file, f"Removed old file {old_file} after renaming to {filename}", file.sha, head_ref)
 
+    @metrics.timed("agent_stage_seconds", stage="test_and_fix_tests")
     def test_and_fix_tests(self, repository, head_ref, test_proposals):
         """
         Tests all test files and fixes them if they fail
@@ -280,8 +491,8 @@ class PRTestAgent(PRBaseAgent):
                     break
                     
                 # Attempt to fix the test
-                log_info(f"Attempting to fix {test_file}, attempt {current_retries}")
-                if self.fix_failed_test(test_file, result.error_message, repository, head_ref):
+                log_info("Attempting to fix %s, attempt %d", test_file, current_retries)
+                if self.fix_failed_test(test_file, result.error_message, repository, head_ref, attempt=current_retries):
                     result.retry_count = current_retries
                     test_results[test_file] = result
                 else:
@@ -301,10 +512,14 @@ class PRTestAgent(PRBaseAgent):
         """
         try:
             # Run pytest on the specific file and capture output
+            start = time.perf_counter()
             result = pytest.main(["-v", test_file_path, "-p", "no:warnings"])
             
             # pytest.ExitCode.OK is 0 (all tests passed)
             passed = result == pytest.ExitCode.OK
+            duration = time.perf_counter() - start
+            metrics.observe("pytest_run_seconds", duration, mode="run", outcome="passed" if passed else "failed")
+            tracing.add_span("pytest", duration, test_file=test_file_path, passed=passed)
             error_message = None if passed else self._get_test_error_output(test_file_path)
             
             return TestResult(
@@ -320,6 +535,7 @@ class PRTestAgent(PRBaseAgent):
                 error_message=str(e)
             )
 
+    @metrics.timed("pytest_run_seconds", mode="error_output")
     def _get_test_error_output(self, test_file_path: str) -> str:
         """
         Runs pytest with detailed output to get error messages
@@ -332,7 +548,8 @@ class PRTestAgent(PRBaseAgent):
             pytest.main(["-vv", test_file_path])
         return output.getvalue()
 
-    def fix_failed_test(self, test_file_path: str, error_message: str, repository, head_ref) -> bool:
+    @metrics.timed("agent_stage_seconds", stage="fix_failed_test")
+    def fix_failed_test(self, test_file_path: str, error_message: str, repository, head_ref, attempt: int = 1) -> bool:
         """
         Attempts to fix a failed test using the LLM
         
@@ -341,6 +558,7 @@ class PRTestAgent(PRBaseAgent):
             error_message: The error message from the test run
             repository: GitHub repository object
             head_ref: Branch reference
+            attempt: Which fix attempt this is for the test, later attempts use a stronger model
             
         Returns:
             Boolean indicating if fix was successful
@@ -350,7 +568,7 @@ class PRTestAgent(PRBaseAgent):
             file_content = github_utils.getFileContent(repository, test_file_path, head_ref)
             
             # Generate fixed test content using LLM
-            fixed_content = self.generate_test_fix(file_content, error_message)
+            fixed_content = self.generate_test_fix(file_content, error_message, attempt)
             
             if fixed_content:
                 # Update the test file with the fixed content
@@ -369,21 +587,24 @@ class PRTestAgent(PRBaseAgent):
             log_error(f"Error fixing test {test_file_path}: {str(e)}")
             return False
 
-    def generate_test_fix(self, original_content: str, error_message: str) -> str:
+    @metrics.timed("agent_stage_seconds", stage="generate_test_fix")
+    def generate_test_fix(self, original_content: str, error_message: str, attempt: int = 1) -> str:
         """
         Uses LLM to generate fixed test content
         
         Args:
             original_content: Original test file content
             error_message: Error message from the failed test
+            attempt: Which fix attempt this is for the test
             
         Returns:
             Fixed test content or None if unable to fix
         """
-        log_info(f"Generating test fix for {original_content}")
-        fixed_content = generate_fix_response(original_content, error_message)
+        log_info("Generating test fix (attempt %d, %d chars of test code)", attempt, len(original_content))
+        fixed_content = generate_fix_response(original_content, error_message, attempt)
         return fixed_content.fixed_content
     
+    @metrics.timed("agent_stage_seconds", stage="update_comment_with_test_results")
     def update_comment_with_test_results(self, placeholder_comment, head_ref, new_test_proposals, test_results: Dict[str, TestResult]):
         """
         Updates the PR comment with test generation and execution results
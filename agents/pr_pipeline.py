@@ -0,0 +1,164 @@
+import asyncio
+from typing import Any, Dict
+
+from utils import github_utils, profiling, tracing
+from utils.file_utils import skipped_files
+from utils.logging_utils import log_context, log_info, log_error
+from utils.model_router import repo_context
+from utils.pipeline_dag import DAGExecutor, RunReport, Stage
+from agents.pr_base_agent import PRCommentAgent, PRTestAgent
+
+
+class PRPipeline:
+    """
+    Runs the review and test generation agents for a pull request as a DAG of stages, so that
+    independent work (e.g. the review and the gating call) overlaps:
+
+        fetch_snapshot ──> review ───────────────────────────┐
+              │                                              v
+              └──────> gate ──> generate ──> run_fix ──> report
+        fetch_existing_tests ─┘
+    """
+
+    # Per-stage timeouts in seconds
+    STAGE_TIMEOUTS = {
+        "fetch_snapshot": 120,
+        "review": 600,
+        "fetch_existing_tests": 120,
+        "gate": 300,
+        "generate": 600,
+        "run_fix": 1800,
+        "report": 60,
+    }
+
+    def __init__(self, payload, comment_agent: PRCommentAgent = None, test_agent: PRTestAgent = None, generate_tests: bool = True):
+        """
+        Args:
+            payload: The webhook event payload
+            comment_agent: Agent used for the review stages
+            test_agent: Agent used for the test generation stages
+            generate_tests: Runs the test generation stages; re-reviews after a push only update the review
+        """
+        self.owner = payload["repository"]["owner"]["login"]
+        self.repo_name = payload["repository"]["name"]
+        self.pull_number = payload["pull_request"]["number"]
+        self.title = payload["pull_request"]["title"]
+        self.head_ref = payload["pull_request"]["head"]["ref"]
+        self.head_sha = payload["pull_request"]["head"].get("sha")
+        self.comment_agent = comment_agent or PRCommentAgent()
+        self.test_agent = test_agent or PRTestAgent()
+        self.generate_tests = generate_tests
+        self.repository = None
+        self.review_comment = None
+        self.test_comment = None
+
+    def build_stages(self):
+        """Declares the pipeline stages and their dependencies"""
+        timeouts = self.STAGE_TIMEOUTS
+        if not self.generate_tests:
+            return [
+                Stage("fetch_snapshot", self.fetch_snapshot, timeout=timeouts["fetch_snapshot"]),
+                Stage("review", self.review, deps=("fetch_snapshot",), timeout=timeouts["review"]),
+                Stage("report", self.report, deps=("fetch_snapshot", "review"), timeout=timeouts["report"], always_run=True),
+            ]
+        return [
+            Stage("fetch_snapshot", self.fetch_snapshot, timeout=timeouts["fetch_snapshot"]),
+            Stage("review", self.review, deps=("fetch_snapshot",), timeout=timeouts["review"]),
+            Stage("fetch_existing_tests", self.fetch_existing_tests, timeout=timeouts["fetch_existing_tests"]),
+            Stage("gate", self.gate, deps=("fetch_snapshot", "fetch_existing_tests"), timeout=timeouts["gate"]),
+            Stage("generate", self.generate, deps=("fetch_snapshot", "fetch_existing_tests", "gate"), timeout=timeouts["generate"]),
+            Stage("run_fix", self.run_fix, deps=("generate",), timeout=timeouts["run_fix"]),
+            Stage("report", self.report, deps=("fetch_snapshot", "review", "gate", "generate", "run_fix"), timeout=timeouts["report"], always_run=True),
+        ]
+
+    def fetch_snapshot(self, inputs: Dict[str, Any]):
+        files, commits = self.comment_agent.handle_pull_request(self.repository, self.pull_number, self.head_ref)
+        return {"files": files, "commits": commits}
+
+    async def review(self, inputs: Dict[str, Any]):
+        snapshot = inputs["fetch_snapshot"]
+        packed = self.comment_agent.pack_context("summarize_pr", snapshot["files"])
+        if self.comment_agent.streaming:
+            return await self.comment_agent.astream_review(self.review_comment, self.title, packed.files, snapshot["commits"])
+        return await self.comment_agent.aanalyze_code(self.title, packed.files, snapshot["commits"])
+
+    def fetch_existing_tests(self, inputs: Dict[str, Any]):
+        return self.test_agent.get_test_index(self.repository, self.head_ref)
+
+    def relevant_tests(self, inputs: Dict[str, Any]):
+        return self.test_agent.select_relevant_tests(inputs["fetch_existing_tests"], inputs["fetch_snapshot"]["files"])
+
+    async def gate(self, inputs: Dict[str, Any]):
+        snapshot = inputs["fetch_snapshot"]
+        packed = self.test_agent.pack_context("test_gating", snapshot["files"], self.relevant_tests(inputs))
+        return await self.test_agent.agating_step(self.title, packed.files, snapshot["commits"], packed.tests)
+
+    async def generate(self, inputs: Dict[str, Any]):
+        gating_result = inputs["gate"]
+        if not gating_result.shouldGenerateTests:
+            log_info("Skipping test generation: %s", gating_result.reasoning)
+            return None
+        snapshot = inputs["fetch_snapshot"]
+        packed = self.test_agent.pack_context("test_update", snapshot["files"], self.relevant_tests(inputs))
+        test_proposals = await self.test_agent.agenerate_test_cases(self.title, packed.files, snapshot["commits"], packed.tests, gating_result.recommendations)
+        await asyncio.to_thread(self.test_agent.commitTestChanges, self.repository, self.head_ref, test_proposals)
+        return test_proposals
+
+    def run_fix(self, inputs: Dict[str, Any]):
+        test_proposals = inputs["generate"]
+        if test_proposals is None:
+            return None
+        return self.test_agent.test_and_fix_tests(self.repository, self.head_ref, test_proposals)
+
+    def report(self, inputs: Dict[str, Any]):
+        """Updates both placeholder comments and returns which agents succeeded"""
+        review_success = "review" in inputs
+        if review_success:
+            try:
+                files = inputs.get("fetch_snapshot", {}).get("files", [])
+                posted = ()
+                if self.comment_agent.inline_comments:
+                    posted = self.comment_agent.post_inline_review(self.repository, self.pull_number, self.head_sha, inputs["review"], files)
+                self.comment_agent.update_comment_with_review(self.review_comment, inputs["review"], skipped_files(files), posted)
+            except Exception as e:
+                log_error(f"Error in PR Comment Agent: {e}")
+                review_success = False
+        if not review_success:
+            github_utils.update_comment(self.review_comment, f"{PRCommentAgent.REVIEW_COMMENT_MARKER}\nError Generating Review")
+        if not self.generate_tests:
+            return {"review": review_success, "tests": True}
+
+        gating_result = inputs.get("gate")
+        test_success = True
+        if gating_result is not None and not gating_result.shouldGenerateTests:
+            github_utils.update_comment(self.test_comment, f"Skipping test generation: {gating_result.reasoning}")
+        elif "run_fix" in inputs:
+            self.test_agent.update_comment_with_test_results(self.test_comment, self.head_ref, inputs["generate"], inputs["run_fix"])
+        else:
+            test_success = False
+            github_utils.update_comment(self.test_comment, "Error Generating Tests")
+        return {"review": review_success, "tests": test_success}
+
+    def run(self):
+        """
+        Runs the pipeline
+
+        Returns:
+            Tuple of (review succeeded, test generation succeeded, RunReport)
+        """
+        log_info("Running PR pipeline for PR #%s in %s/%s", self.pull_number, self.owner, self.repo_name)
+        full_name = f"{self.owner}/{self.repo_name}"
+        with tracing.start_trace("pr_pipeline", repo=full_name, pr=self.pull_number, head_sha=self.head_sha,
+                                 generate_tests=self.generate_tests) as root, \
+                log_context(repo=full_name, pr=self.pull_number, trace_id=getattr(root, "trace_id", None)):
+            self.repository = github_utils.get_repository(self.owner, self.repo_name)
+            # A re-review edits the review comment of the previous run
+            marker = PRCommentAgent.REVIEW_COMMENT_MARKER
+            self.review_comment = github_utils.upsert_comment(self.repository, self.pull_number, marker, f"{marker}\nReview in progress...")
+            if self.generate_tests:
+                self.test_comment = github_utils.post_comment(self.repository, self.pull_number, "Test analysis in progress...")
+
+            with repo_context(full_name), profiling.profile_run(full_name, self.pull_number):
+                report: RunReport = DAGExecutor(self.build_stages()).run_sync()
+        outcome = report.value("report", {"review": False, "tests": False})
+        return outcome["review"], outcome["tests"], report
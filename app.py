@@ -1,6 +1,12 @@
+import hmac
 import json
-from flask import Flask, request, jsonify
+from dataclasses import asdict
+from flask import Flask, Response, request, jsonify
+from config.constants import ADMIN_TOKEN, DELIVERY_CLAIM_SECONDS, DELIVERY_DEDUP_TTL_SECONDS
 from webhook.webhook_handler import process_webhook
+from utils import metrics, profiling
+from utils.logging_utils import log_error, log_info
+from utils.shared_store import get_shared_store
 
 app = Flask(__name__)
 
@@ -9,18 +15,68 @@ def home():
     return "Hello World"
 
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def is_admin_request() -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}")
+
+
+@app.route("/admin/profile", methods=["GET", "POST", "DELETE"])
+def admin_profile():
+    """
+    Arms profiling of the next pipeline runs (POST {"repo", "pr", "runs", "mode", "memory"}),
+    cancels pending requests (DELETE), and lists pending requests and profiled runs on disk.
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        try:
+            profile_request = profiling.request_profile(
+                repo=body.get("repo"),
+                pr=int(body["pr"]) if body.get("pr") is not None else None,
+                runs=int(body.get("runs", 1)),
+                mode=body.get("mode", profiling.MODE_SAMPLING),
+                memory=bool(body.get("memory", False)))
+        except (TypeError, ValueError) as error:
+            return jsonify({"message": str(error)}), 400
+        return jsonify(asdict(profile_request)), 201
+    if request.method == "DELETE":
+        profiling.cancel_requests()
+    return jsonify({"pending": [asdict(r) for r in profiling.pending_requests()], "artifacts": profiling.list_artifacts()})
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     data = request.json
     with open("data.json", "w") as f:
         json.dump(data, f, indent=4)
 
+    # Redeliveries may reach any worker, the claim on the delivery ID is shared by all of them
+    delivery = request.headers.get("X-GitHub-Delivery")
+    store = get_shared_store()
+    if delivery and not store.add("deliveries", delivery, DELIVERY_CLAIM_SECONDS):
+        log_info("Ignoring duplicate delivery %s", delivery)
+        return jsonify({"message": "Duplicate delivery"}), 200
+
     try:
         event = request.headers.get("X-GitHub-Event")
-        return process_webhook(event, data)
+        response = process_webhook(event, data)
     except Exception as error:
-        print("Error processing webhook:", error)
-        return jsonify({"message": "Internal Server Error"}), 500
+        log_error("Error processing webhook", error)
+        response = jsonify({"message": "Internal Server Error"}), 500
+    if delivery:
+        if response[1] >= 500:
+            # Let GitHub's redelivery of a failed delivery through
+            store.delete("deliveries", delivery)
+        else:
+            store.set("deliveries", delivery, "", DELIVERY_DEDUP_TTL_SECONDS)
+    return response
     
 
 if __name__ == '__main__':
@@ -0,0 +1,298 @@
+"""
+Reviews and generates tests for many open pull requests of a repository from the command line, e.g.
+when onboarding a repository with a backlog of open PRs.
+
+    python backlog.py owner/repo                            # every open PR, review and tests
+    python backlog.py owner/repo --prs 12,15 --mode review
+    python backlog.py owner/repo --pr-file prs.txt --concurrency 4
+    python backlog.py owner/repo --dry-run out/             # write comments and tests under out/
+
+PRs run on a bounded pool of threads sharing the agents and the process caches (blobs, LLM responses,
+per-file analyses, test index), and wait when few GitHub API requests are left before the limit
+resets. Progress goes to a state file: running the command again skips the PRs already processed at
+their current head commit and retries the others.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from agents.pr_base_agent import PRCommentAgent, PRTestAgent
+from agents.pr_pipeline import PRPipeline
+from config.constants import PROJECT_ROOT
+from utils import github_utils
+from utils.logging_utils import log_error, log_info
+
+MODES = ("review", "tests", "both")
+BACKLOG_CONCURRENCY = int(os.getenv("BACKLOG_CONCURRENCY", 2))
+# A PR is only started with at least this many API requests left, otherwise the run waits for the reset
+BACKLOG_MIN_RATE_REMAINING = int(os.getenv("BACKLOG_MIN_RATE_REMAINING", 500))
+BACKLOG_STATE_DIR = os.path.join(PROJECT_ROOT, ".cache", "backlog")
+
+
+class BacklogState:
+    """Outcome per PR, written to a JSON file after every PR so an interrupted run can resume"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.prs: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.prs = json.load(f).get("prs", {})
+
+    def is_done(self, number: int, head_sha: Optional[str]) -> bool:
+        entry = self.prs.get(str(number))
+        return entry is not None and entry.get("status") == "done" and entry.get("head_sha") == head_sha
+
+    def record(self, number: int, **fields):
+        with self._lock:
+            self.prs[str(number)] = {**self.prs.get(str(number), {}), **fields, "updated_at": time.time()}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"prs": self.prs}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+class RateLimitGate:
+    """Holds PRs back while the remaining API requests are below a threshold, until the limit resets"""
+
+    def __init__(self, min_remaining: int = BACKLOG_MIN_RATE_REMAINING):
+        self.min_remaining = min_remaining
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            remaining, reset_at = github_utils.get_rate_limit()
+            if remaining >= self.min_remaining:
+                return
+            delay = max(0.0, reset_at - time.time()) + 1
+            log_info("%d API requests left, waiting %.0fs for the rate limit to reset", remaining, delay)
+            time.sleep(delay)
+
+
+class LocalComment:
+    """Stands in for a PR comment in dry runs; every edit rewrites its file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.body = ""
+
+    def edit(self, body: str):
+        self.body = body
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(body)
+
+
+class DryRunWriter:
+    """
+    Redirects the writes of utils.github_utils (comments, reviews, test commits) to files under a
+    directory, while reads still go to GitHub:
+
+        <directory>/pr-<number>/comment-<n>.md, review-<n>.json
+        <directory>/branches/<branch>/<test file>
+    """
+
+    WRITES = ("post_comment", "update_comment", "upsert_comment", "create_review", "create_file", "update_file", "delete_file")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._comments: Dict[tuple, LocalComment] = {}
+        self._counts: Dict[tuple, int] = {}
+
+    def _next_path(self, pull_number: int, kind: str, extension: str) -> str:
+        with self._lock:
+            key = (pull_number, kind)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            return os.path.join(self.directory, f"pr-{pull_number}", f"{kind}-{self._counts[key]}.{extension}")
+
+    def post_comment(self, repository, pull_number: int, message: str):
+        comment = LocalComment(self._next_path(pull_number, "comment", "md"))
+        comment.edit(message)
+        return comment
+
+    def update_comment(self, comment, message: str):
+        if not isinstance(comment, LocalComment):
+            # An existing comment on GitHub is never edited in a dry run
+            comment = LocalComment(os.path.join(self.directory, "comments", f"{getattr(comment, 'id', id(comment))}.md"))
+        comment.edit(message)
+
+    def upsert_comment(self, repository, pull_number: int, marker: str, message: str):
+        with self._lock:
+            comment = self._comments.get((pull_number, marker))
+        if comment is None:
+            comment = self.post_comment(repository, pull_number, message)
+            with self._lock:
+                self._comments[(pull_number, marker)] = comment
+        else:
+            comment.edit(message)
+        return comment
+
+    def create_review(self, repository, pull_number: int, commit_sha, comments, body: str = ""):
+        path = self._next_path(pull_number, "review", "json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"commit": commit_sha, "body": body, "comments": comments}, f, indent=2)
+
+    def _branch_path(self, branch: str, filename: str) -> str:
+        path = os.path.join(self.directory, "branches", branch, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def create_file(self, repository, filename, comment, file_content, branch):
+        with open(self._branch_path(branch, filename), "w") as f:
+            f.write(file_content)
+
+    def update_file(self, repository, filename, comment, file_content, file_sha, branch):
+        self.create_file(repository, filename, comment, file_content, branch)
+
+    def delete_file(self, repository, filename, comment, file_sha, branch):
+        with self._lock, open(self._branch_path(branch, "DELETED.txt"), "a") as f:
+            f.write(f"{filename}\n")
+
+    @contextmanager
+    def install(self):
+        """Replaces the write functions of utils.github_utils for the duration of the context."""
+        originals = {name: getattr(github_utils, name) for name in self.WRITES}
+        try:
+            for name in self.WRITES:
+                setattr(github_utils, name, getattr(self, name))
+            yield self
+        finally:
+            for name, function in originals.items():
+                setattr(github_utils, name, function)
+
+
+class DryRunTestAgent(PRTestAgent):
+    """Generated tests are only written locally in dry runs, so there is nothing to run on the branch"""
+
+    def test_and_fix_tests(self, repository, head_ref, test_proposals):
+        return {}
+
+
+def read_pr_list(path: str) -> List[int]:
+    """Reads PR numbers or URLs, one per line; blank lines and # comments are ignored."""
+    numbers = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                numbers.append(int(re.sub(r"^.*/pull/", "", line).strip("/")))
+    return numbers
+
+
+def pull_request_payload(repository, pull) -> Dict:
+    """Builds the webhook payload the agents expect for a PR."""
+    owner, name = repository.full_name.split("/")
+    return {
+        "action": "opened",
+        "repository": {"owner": {"login": owner}, "name": name, "full_name": repository.full_name},
+        "pull_request": {"number": pull.number, "title": pull.title, "head": {"ref": pull.head.ref, "sha": pull.head.sha}},
+    }
+
+
+def run_pull_request(payload: Dict, mode: str, comment_agent, test_agent) -> Dict[str, bool]:
+    """Runs the agents of the mode on one PR and returns which succeeded."""
+    if mode == "tests":
+        return {"tests": test_agent.handle_pull_request_for_test_agent(payload)}
+    review_success, test_success, _ = PRPipeline(payload, comment_agent, test_agent, generate_tests=mode == "both").run()
+    return {"review": review_success, "tests": test_success} if mode == "both" else {"review": review_success}
+
+
+def run_backlog(repo: str, numbers: Optional[List[int]], mode: str, state: BacklogState, concurrency: int = BACKLOG_CONCURRENCY,
+                gate: RateLimitGate = None, comment_agent=None, test_agent=None) -> Dict[str, int]:
+    """
+    Runs the agents on the PRs of a repository, skipping the ones the state records as done
+
+    Args:
+        repo: Repository as "owner/name"
+        numbers: PRs to run, every open PR if None
+        mode: "review", "tests" or "both"
+        state: Progress of previous runs, updated as PRs finish
+        concurrency: PRs run at the same time
+        gate: Rate limit check done before each PR
+        comment_agent: Agent used for the reviews
+        test_agent: Agent used for the test generation
+
+    Returns:
+        Number of PRs done, failed and skipped
+    """
+    owner, name = repo.split("/")
+    repository = github_utils.get_repository(owner, name)
+    if numbers is None:
+        pulls = github_utils.get_open_pull_requests(repository)
+    else:
+        pulls = [github_utils.get_pull_request(repository, number) for number in numbers]
+    comment_agent = comment_agent or PRCommentAgent(streaming=False)
+    test_agent = test_agent or PRTestAgent()
+    gate = gate or RateLimitGate()
+
+    pending = [pull for pull in pulls if not state.is_done(pull.number, pull.head.sha)]
+    counts = {"done": 0, "failed": 0, "skipped": len(pulls) - len(pending)}
+    log_info("Backlog of %s: %d PRs to run, %d already done", repo, len(pending), counts["skipped"])
+
+    def run_one(pull):
+        gate.wait()
+        state.record(pull.number, status="running", head_sha=pull.head.sha, mode=mode)
+        started = time.perf_counter()
+        try:
+            outcome = run_pull_request(pull_request_payload(repository, pull), mode, comment_agent, test_agent)
+            status = "done" if all(outcome.values()) else "failed"
+            state.record(pull.number, status=status, seconds=round(time.perf_counter() - started, 1), error=None, **outcome)
+        except Exception as error:
+            log_error(f"Backlog run of PR #{pull.number} failed", error)
+            status = "failed"
+            state.record(pull.number, status=status, error=str(error))
+        return status
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="backlog") as executor:
+        futures = {executor.submit(run_one, pull): pull for pull in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            status = future.result()
+            counts[status] += 1
+            log_info("PR #%d %s (%d/%d)", futures[future].number, status, finished, len(pending))
+    return counts
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Review and generate tests for the open PRs of a repository")
+    parser.add_argument("repo", help="Repository as owner/name")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--prs", help="Comma separated PR numbers, instead of every open PR")
+    selection.add_argument("--pr-file", help="File with one PR number or URL per line")
+    parser.add_argument("--mode", choices=MODES, default="both", help="Agents to run on each PR")
+    parser.add_argument("--concurrency", type=int, default=BACKLOG_CONCURRENCY, help="PRs run at the same time")
+    parser.add_argument("--min-rate-remaining", type=int, default=BACKLOG_MIN_RATE_REMAINING,
+                        help="API requests that must be left to start a PR")
+    parser.add_argument("--state", help="Resumable state file, per repository under .cache/backlog by default")
+    parser.add_argument("--dry-run", metavar="DIR", help="Write comments, reviews and test files under DIR instead of GitHub")
+    args = parser.parse_args(argv)
+
+    numbers = None
+    if args.prs:
+        numbers = [int(n) for n in args.prs.split(",") if n.strip()]
+    elif args.pr_file:
+        numbers = read_pr_list(args.pr_file)
+    state_path = args.state or os.path.join(BACKLOG_STATE_DIR, args.repo.replace("/", "__") + (".dry-run" if args.dry_run else "") + ".json")
+    state = BacklogState(state_path)
+    gate = RateLimitGate(args.min_rate_remaining)
+
+    if args.dry_run:
+        with DryRunWriter(args.dry_run).install():
+            counts = run_backlog(args.repo, numbers, args.mode, state, args.concurrency, gate, test_agent=DryRunTestAgent())
+    else:
+        counts = run_backlog(args.repo, numbers, args.mode, state, args.concurrency, gate)
+    print(f"{counts['done']} done, {counts['failed']} failed, {counts['skipped']} skipped (state in {state_path})")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""Benchmark baselines: stored results per case and the regression check against them."""
+import json
+import os
+import sys
+from typing import Dict, List
+
+# Differences below these are noise, whatever the percentage
+MIN_SECONDS_DELTA = 0.005
+MIN_PEAK_MB_DELTA = 1.0
+
+
+def compare(results: Dict[str, Dict[str, float]], baselines: Dict[str, Dict[str, float]], tolerance_pct: float) -> List[str]:
+    """Returns a description of every metric that regressed beyond the tolerance."""
+    regressions = []
+    for case, measured in sorted(results.items()):
+        baseline = baselines.get(case)
+        if baseline is None:
+            continue
+        for metric, min_delta in (("seconds", MIN_SECONDS_DELTA), ("peak_mb", MIN_PEAK_MB_DELTA)):
+            if metric not in baseline:
+                continue
+            limit = baseline[metric] * (1 + tolerance_pct / 100)
+            if measured[metric] > limit and measured[metric] - baseline[metric] > min_delta:
+                change = (measured[metric] / baseline[metric] - 1) * 100 if baseline[metric] else float("inf")
+                regressions.append(f"{case} {metric}: {measured[metric]} vs baseline {baseline[metric]} (+{change:.0f}%)")
+    return regressions
+
+
+def load_baselines(path: str) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("results", {})
+
+
+def save_baselines(path: str, results: Dict[str, Dict[str, float]], repeat: int = None):
+    data = {"python": sys.version.split()[0], "repeat": repeat, "results": results}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -0,0 +1,60 @@
+"""
+Compares prompt building before and after the compact serializer on synthetic PRs.
+
+    python -m benchmarks.bench_prompt_serialization
+"""
+import time
+from langchain.prompts import PromptTemplate
+from benchmarks.synthetic import make_synthetic_pr
+from prompts.test_case_update_prompt import testUpdatePrompt, testUpdateInput, build_test_case_input
+from utils import context_packer
+from utils.context_packer import count_tokens
+from utils.prompt_serializer import CompiledTemplate, serialize_input
+
+PR_SIZES = (10, 100, 1000)
+REPEAT = 3
+
+
+def legacy_render(input_data):
+    """Prompt building as it was done before: a PromptTemplate per call formatting pydantic reprs."""
+    prompt = PromptTemplate(template=testUpdatePrompt, input_variables=input_data.keys())
+    return prompt.format(**input_data)
+
+
+COMPILED = CompiledTemplate(testUpdatePrompt)
+
+
+def compact_render(input_data):
+    return COMPILED.render(**serialize_input(testUpdateInput(**input_data)))
+
+
+def measure(render, input_data):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        text = render(input_data)
+        best = min(best, time.perf_counter() - start)
+    return text, best
+
+
+def run():
+    results = []
+    for size in PR_SIZES:
+        files, tests, commits = make_synthetic_pr(size)
+        input_data = build_test_case_input("Synthetic PR", files, commits, tests, ["Cover the new branches"])
+        for name, render in (("legacy", legacy_render), ("compact", compact_render)):
+            text, seconds = measure(render, input_data)
+            results.append({"files": size, "format": name, "tokens": count_tokens(text), "chars": len(text), "seconds": seconds})
+    return results
+
+
+def main():
+    if context_packer._get_encoding() is None:
+        print("tiktoken unavailable: token counts are estimated from characters")
+    print(f"{'files':>6} {'format':>8} {'tokens':>10} {'chars':>11} {'ms':>9}")
+    for r in run():
+        print(f"{r['files']:>6} {r['format']:>8} {r['tokens']:>10} {r['chars']:>11} {r['seconds'] * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmarks the PR pipeline on synthetic PRs against local stand-ins for GitHub and the LLM, and
+compares the results with stored baselines.
+
+    python -m benchmarks.bench_suite                      # run and compare with benchmarks/baselines.json
+    python -m benchmarks.bench_suite --update-baseline    # run and store the results as the new baselines
+    python -m benchmarks.bench_suite --sizes 10,100 --tolerance 30
+
+Exits with status 1 when a case is slower (or peaks higher in memory) than its baseline by more
+than the tolerance, in percent.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.baselines import compare, load_baselines, save_baselines
+from benchmarks.standins import FakeComment, FakeRepository, install_offline_environment, use_repository
+
+install_offline_environment(os.path.join(tempfile.gettempdir(), "pr-agent-bench"))
+
+from agents.pr_base_agent import PRCommentAgent, PRTestAgent  # noqa: E402
+from agents.pr_pipeline import PRPipeline  # noqa: E402
+from prompts.review_prompt import Analysis, CodeReviewOutput, build_file_changes  # noqa: E402
+from prompts.test_case_update_prompt import Action, Proposal, build_test_case_input, testUpdateOutput  # noqa: E402
+from utils.llm_registry import get_llm_handler  # noqa: E402
+
+PR_SIZES = (10, 100, 1000)
+REPEAT = int(os.getenv("BENCH_REPEAT", 3))
+REGRESSION_TOLERANCE_PCT = float(os.getenv("BENCH_REGRESSION_PCT", 25))
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+class OfflineTestAgent(PRTestAgent):
+    """Skips running the generated tests with pytest, which would measure pytest rather than the pipeline"""
+
+    def test_and_fix_tests(self, repository, head_ref, test_proposals):
+        return {}
+
+
+def make_payload(repository: FakeRepository, action: str = "opened") -> Dict:
+    owner, name = repository.full_name.split("/")
+    return {
+        "action": action,
+        "repository": {"owner": {"login": owner}, "name": name},
+        "pull_request": {"number": 1, "title": "Synthetic PR", "head": {"ref": "feature", "sha": "0" * 40}},
+    }
+
+
+def make_review(files: List[Dict]) -> CodeReviewOutput:
+    analyses = [Analysis(file_path=f["filename"], analysis=f"The change to {f['filename']} adds computed values. " * 5) for f in files]
+    return CodeReviewOutput(summary="Synthetic summary. " * 20, file_analyses=analyses, suggestions=[f"Suggestion {i}" for i in range(10)])
+
+
+def make_proposals(files: List[Dict]) -> testUpdateOutput:
+    proposals = []
+    for i, f in enumerate(files):
+        stem = os.path.splitext(os.path.basename(f["filename"]))[0]
+        # Every other proposal updates one of the existing test files of the synthetic repository
+        action = "update" if i % 2 and i < len(files) // 2 else "create"
+        filename = f"tests/unit/test_{stem}.py"
+        proposals.append(Proposal(filename=filename, testType="unit", testContent=f"def test_{stem}():\n    assert True\n" * 20,
+                                  actions=[Action(action=action)]))
+    return testUpdateOutput(test_proposals=proposals)
+
+
+def measure(func: Callable[[], object], repeat: int = REPEAT) -> Dict[str, float]:
+    """Best wall time over `repeat` calls, and the peak traced memory of one extra call."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(best, 6), "peak_mb": round(peak / 2 ** 20, 3)}
+
+
+def run_size(size: int, repeat: int = REPEAT) -> Dict[str, Dict[str, float]]:
+    repository = FakeRepository(size, full_name=f"bench/synthetic-{size}")
+    use_repository(repository)
+    comment_agent, test_agent = PRCommentAgent(streaming=False), OfflineTestAgent()
+    files, commits = comment_agent.handle_pull_request(repository, 1, "feature")
+    files = list(files)
+    tests = [{"filename": path, "content": text} for path, text in repository.files.items() if path.startswith("tests/")]
+    handler = get_llm_handler()
+    review = make_review(files)
+    proposals = make_proposals(files[:max(1, size // 2)])
+
+    def build_prompts():
+        handler.prepare_request("summarize_pr", title="Synthetic PR", commits=commits, changed_files=build_file_changes(files))
+        handler.prepare_request("test_update", **build_test_case_input("Synthetic PR", files, commits, tests[:8], ["Cover the new branches"]))
+
+    cases = {
+        # The files are produced lazily, len() includes their downloads in the measurement
+        "handle_pull_request": lambda: len(comment_agent.handle_pull_request(repository, 1, "feature")[0]),
+        "prompt_building": build_prompts,
+        "update_comment_with_review": lambda: comment_agent.update_comment_with_review(FakeComment(""), review),
+        "commitTestChanges": lambda: test_agent.commitTestChanges(repository, "feature", proposals),
+        "end_to_end": lambda: PRPipeline(make_payload(repository), comment_agent, test_agent).run(),
+    }
+    return {f"{name}/{size}": measure(func, repeat) for name, func in cases.items()}
+
+
+def run(sizes=PR_SIZES, repeat: int = REPEAT) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for size in sizes:
+        results.update(run_size(size, repeat))
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the PR pipeline on synthetic PRs")
+    parser.add_argument("--sizes", default=",".join(map(str, PR_SIZES)), help="Comma separated PR sizes in files")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Runs per case, the best one is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="JSON baseline file")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE_PCT, help="Allowed regression in percent")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baselines")
+    args = parser.parse_args(argv)
+
+    results = run([int(s) for s in args.sizes.split(",")], args.repeat)
+    baselines = load_baselines(args.baseline)
+    print(f"{'case':>34} {'ms':>10} {'baseline':>10} {'peak MB':>9}")
+    for case, measured in results.items():
+        baseline = baselines.get(case, {}).get("seconds")
+        baseline_ms = f"{baseline * 1000:.2f}" if baseline is not None else "-"
+        print(f"{case:>34} {measured['seconds'] * 1000:>10.2f} {baseline_ms:>10} {measured['peak_mb']:>9.2f}")
+
+    if args.update_baseline:
+        save_baselines(args.baseline, {**baselines, **results}, repeat=args.repeat)
+        print(f"Baselines written to {args.baseline}")
+        return 0
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Local stand-ins for GitHub and the LLM, so benchmarks exercise the real agents and pipeline offline.
+
+install_offline_environment() must run before any agent or utils.github_utils import: it points the
+caches at a scratch directory, selects the fake LLM backend and replaces the GitHub App token exchange.
+"""
+import base64
+import hashlib
+import os
+import sys
+import types
+from typing import Dict, List
+from github import UnknownObjectException
+from benchmarks.synthetic import make_synthetic_pr
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class FakeFile:
+    """A changed file as returned by PullRequest.get_files()"""
+
+    def __init__(self, data: Dict):
+        self.filename = data["filename"]
+        self.patch = data["patch"]
+        self.status = data["status"]
+        self.additions = data["additions"]
+        self.deletions = data["deletions"]
+        self.sha = _sha(data["content"] or "")
+
+
+class FakeContent:
+    def __init__(self, path: str, text: str):
+        self.path = path
+        self.sha = _sha(text)
+        self.content = base64.b64encode(text.encode()).decode()
+
+
+class FakeComment:
+    def __init__(self, body: str):
+        self.body = body
+        self.edits = 0
+
+    def edit(self, body: str):
+        self.body = body
+        self.edits += 1
+
+
+class FakeCommentList(list):
+    @property
+    def reversed(self):
+        return list(reversed(self))
+
+
+class FakeIssue:
+    def __init__(self):
+        self.comments = FakeCommentList()
+
+    def create_comment(self, body: str) -> FakeComment:
+        comment = FakeComment(body)
+        self.comments.append(comment)
+        return comment
+
+    def get_comments(self):
+        return self.comments
+
+
+class FakeCommit:
+    def __init__(self, message: str):
+        self.sha = _sha(message)
+        self.commit = types.SimpleNamespace(message=message)
+
+
+class FakePull:
+    def __init__(self, files: List[FakeFile], commits: List[str]):
+        self._files = files
+        self._commits = [FakeCommit(m) for m in commits]
+
+    def get_files(self):
+        return list(self._files)
+
+    def get_commits(self):
+        return list(self._commits)
+
+
+class FakeRepository:
+    """An in-memory repository holding one synthetic pull request (number 1)"""
+
+    def __init__(self, num_files: int, num_tests: int = None, seed: int = 0, full_name: str = "bench/synthetic"):
+        self.full_name = full_name
+        changed, tests, self.commit_messages = make_synthetic_pr(num_files, num_tests, seed=seed)
+        self.files: Dict[str, str] = {f["filename"]: f["content"] for f in changed}
+        self.files.update({t["filename"]: t["content"] for t in tests})
+        self.blobs: Dict[str, str] = {_sha(text): text for text in self.files.values()}
+        self.pull = FakePull([FakeFile(f) for f in changed], self.commit_messages)
+        self.issue = FakeIssue()
+        self.writes = 0
+
+    def get_pull(self, number: int) -> FakePull:
+        return self.pull
+
+    def get_issue(self, number: int) -> FakeIssue:
+        return self.issue
+
+    def get_contents(self, path: str, ref: str = None) -> FakeContent:
+        if path not in self.files:
+            raise UnknownObjectException(404, {"message": "Not Found"}, None)
+        return FakeContent(path, self.files[path])
+
+    def get_commit(self, ref: str):
+        return types.SimpleNamespace(sha=_sha("".join(sorted(self.files))))
+
+    def get_git_tree(self, sha: str, recursive: bool = False):
+        items = [types.SimpleNamespace(path=path, sha=_sha(text), type="blob", size=len(text.encode()))
+                 for path, text in self.files.items()]
+        return types.SimpleNamespace(tree=items)
+
+    def get_git_blob(self, sha: str):
+        return types.SimpleNamespace(content=base64.b64encode(self.blobs[sha].encode()).decode())
+
+    def create_file(self, path, message, content, branch=None):
+        self.files[path] = content
+        self.blobs[_sha(content)] = content
+        self.writes += 1
+
+    def update_file(self, path, message, content, sha=None, branch=None):
+        self.files[path] = content
+        self.blobs[_sha(content)] = content
+        self.writes += 1
+
+    def delete_file(self, path, message, sha, branch=None):
+        self.files.pop(path, None)
+        self.writes += 1
+
+
+class FakeGithub:
+    def __init__(self, repository: FakeRepository):
+        self.repository = repository
+
+    def get_repo(self, full_name: str) -> FakeRepository:
+        return self.repository
+
+
+def install_offline_environment(scratch_dir: str):
+    """Configures the process for offline benchmarking. Call before importing agents or utils.github_utils."""
+    os.makedirs(scratch_dir, exist_ok=True)
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "LLM_CACHE_ENABLED": "False",
+        "ANALYSIS_STORE_ENABLED": "False",
+        "TRACE_ENABLED": "False",
+        "REVIEW_STREAMING": "False",
+        "LOG_LEVEL": "WARNING",
+        "TEST_INDEX_DIR": os.path.join(scratch_dir, "test_index"),
+        "BLOB_CACHE_DIR": os.path.join(scratch_dir, "blobs"),
+        "SHARED_STORE_PATH": os.path.join(scratch_dir, "shared.sqlite3"),
+    })
+    auth = types.ModuleType("auth.github_auth")
+    auth.generate_installation_token = lambda: "offline-benchmark-token"
+    sys.modules["auth.github_auth"] = auth
+
+
+def use_repository(repository: FakeRepository):
+    """Routes utils.github_utils to the in-memory repository."""
+    from utils import github_utils
+    github_utils.g = FakeGithub(repository)
@@ -0,0 +1,67 @@
+import random
+from typing import Dict, List, Tuple
+
+WORDS = ["value", "result", "config", "handler", "request", "payload", "items", "index", "cache", "client"]
+
+
+def _make_function(rng: random.Random, name: str, lines: int) -> List[str]:
+    body = [f"def {name}({rng.choice(WORDS)}, {rng.choice(WORDS)}=None):", f'    """Compute the {rng.choice(WORDS)} for {name}"""']
+    for i in range(lines):
+        body.append(f"    {rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}.get(\"{rng.choice(WORDS)}\", {i})")
+    body.append(f"    return {rng.choice(WORDS)}")
+    return body
+
+
+def make_module(rng: random.Random, module_name: str, functions: int = 20, lines_per_function: int = 15) -> str:
+    lines = ["import os", "import json", ""]
+    for i in range(functions):
+        lines.extend(_make_function(rng, f"{module_name}_func_{i}", lines_per_function))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def make_patch(rng: random.Random, content: str, hunks: int = 3, added_lines: int = 10) -> str:
+    """Builds a unified diff patch whose hunks point into the given content."""
+    total = len(content.splitlines())
+    patch = []
+    for h in range(hunks):
+        start = max(1, (total // (hunks + 1)) * (h + 1))
+        patch.append(f"@@ -{start},3 +{start},{3 + added_lines} @@ def hunk_{h}():")
+        patch.append(" context line")
+        patch.extend(f"+    {rng.choice(WORDS)}_{h}_{i} = compute({i})" for i in range(added_lines))
+        patch.append(" context line")
+        patch.append(" context line")
+    return "\n".join(patch)
+
+
+def make_synthetic_pr(num_files: int, num_tests: int = None, functions: int = 20, seed: int = 0) -> Tuple[List[Dict], List[Dict], List[str]]:
+    """
+    Generates a deterministic synthetic PR.
+
+    Returns:
+        Tuple of (changed files as dicts with the keys of utils.file_utils.ChangedFile, existing test files, commit messages)
+    """
+    rng = random.Random(seed)
+    num_tests = num_files // 2 if num_tests is None else num_tests
+    files = []
+    for i in range(num_files):
+        module_name = f"mod{i}"
+        content = make_module(rng, module_name, functions=functions)
+        patch = make_patch(rng, content)
+        files.append({
+            "filename": f"pkg{i % 10}/{module_name}.py",
+            "patch": patch,
+            "status": "modified",
+            "additions": patch.count("\n+"),
+            "deletions": 0,
+            "excluded": False,
+            "content": content,
+        })
+    tests = []
+    for i in range(num_tests):
+        body = [f"from pkg{i % 10}.mod{i} import mod{i}_func_0", ""]
+        for t in range(10):
+            body.extend([f"def test_mod{i}_case_{t}():", f"    assert mod{i}_func_0({t}) is not None", ""])
+        tests.append({"filename": f"tests/unit/test_mod{i}.py", "content": "\n".join(body)})
+    commits = [f"Change {rng.choice(WORDS)} handling ({i})" for i in range(5)]
+    return files, tests, commits
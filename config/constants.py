@@ -33,8 +33,28 @@ WEBHOOK_DATA_FILE = os.path.join(PROJECT_ROOT, "data.json")
 FLASK_PORT = int(os.getenv("FLASK_PORT", 5000))
 FLASK_DEBUG = os.getenv("FLASK_DEBUG", "True").lower() in ("true", "1")
 
+# Review Streaming
+REVIEW_STREAMING = os.getenv("REVIEW_STREAMING", "True").lower() in ("true", "1")
+REVIEW_STREAM_MIN_INTERVAL = float(os.getenv("REVIEW_STREAM_MIN_INTERVAL", 3))
+
+# Inline Review Comments (posted as one pull request review, the rest stays in the summary comment)
+REVIEW_INLINE_COMMENTS = os.getenv("REVIEW_INLINE_COMMENTS", "False").lower() in ("true", "1")
+
+# Production Server (server.py)
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+WEB_THREADS = int(os.getenv("WEB_THREADS", 8))
+# Time in-flight requests get to finish on shutdown, in seconds
+WEB_DRAIN_TIMEOUT = float(os.getenv("WEB_DRAIN_TIMEOUT", 120))
+# GitHub redelivers webhooks; deliveries seen within this window are acknowledged without processing
+DELIVERY_DEDUP_TTL_SECONDS = int(os.getenv("DELIVERY_DEDUP_TTL_SECONDS", 24 * 3600))
+# A delivery is claimed for this long while it is processed, so a redelivery goes through if the worker dies
+DELIVERY_CLAIM_SECONDS = int(os.getenv("DELIVERY_CLAIM_SECONDS", 3600))
+
 # Authentication
 GITHUB_ACCESS_TOKEN = os.getenv("GITHUB_ACCESS_TOKEN", "your_default_token")
+# Bearer token for the /admin routes, which are disabled when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # Other Constants
 DEFAULT_ENCODING = "utf-8"
\ No newline at end of file
@@ -1,4 +1,5 @@
-from utils.llm_utils import LLMHandler
+from utils.llm_registry import get_llm_handler, register_task
+from utils.model_router import count_input_tokens, get_model_router
 from utils.logging_utils import log_error
 from pydantic import BaseModel
 from typing import Optional
@@ -26,28 +27,23 @@ class FixTestOutput(BaseModel):
 
 
 
+# Retries of the same failure must reach the model again, so fixes are never served from the cache
+register_task("fix_test", prompt_template=FixTestPrompt, input_model=FixTestInput, output_model=FixTestOutput, cache=False)
 
 
-def generate_fix_response(original_content: str, error_message: str):
+def generate_fix_response(original_content: str, error_message: str, attempt: int = 1):
     try:
-        openAI_config = {
-            "model": "gpt-4o-mini"
-        }
         input_data = {
             "test_content": original_content,
             "error_message": error_message
         }
         
-        openAI_handler = LLMHandler(model_config=openAI_config)
-        openAI_handler.set_task_config(
-            "fix_test", 
-            prompt_template=FixTestPrompt,
-            input_model=FixTestInput,
-            output_model=FixTestOutput
-        )
-        
-        response = openAI_handler.generate_response("fix_test", **input_data)
-        return response
+        # Later attempts at fixing the same test are routed to a stronger model
+        route = get_model_router().route("fix_test", count_input_tokens([original_content, error_message]), files=1, attempt=attempt)
+        openAI_handler = get_llm_handler(model_config=route.model_config)
+        with route.track() as result:
+            result["response"] = openAI_handler.generate_response("fix_test", **input_data)
+        return result["response"]
         
     except Exception as error:
         log_error(f"Error generating test fix: {error}")
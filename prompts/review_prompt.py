@@ -1,7 +1,26 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import BaseModel, ValidationError, Field
-from typing import Any, Dict, Type, List
+from typing import Any, Callable, Dict, Type, List
 from typing_extensions import TypedDict, Optional
-from utils.llm_utils import LLMHandler
+from utils import tracing
+from utils.analysis_store import get_analysis_store
+from utils.llm_cache import schema_version
+from utils.llm_registry import get_llm_handler, register_task
+from utils.context_packer import count_tokens
+from utils.model_router import count_input_tokens, current_repo, get_model_router
+from utils.logging_utils import log_info, log_error
+
+# PRs above either limit are reviewed in shards (map) and summarized in a final call (reduce)
+SINGLE_CALL_TOKEN_LIMIT = 24000
+SINGLE_CALL_MAX_FILES = 20
+SHARD_TOKEN_BUDGET = 16000
+REVIEW_SHARD_CONCURRENCY = 4
 
 class FileChange(TypedDict):
     filename: str
@@ -22,18 +41,53 @@ class CodeReviewInput(BaseModel):
     commits: List[str]
     changed_files: List[FileChangePrompt]
 
+class LineComment(BaseModel):
+    line: int = Field(..., description="Line number in the new version of the file, on a line shown in the patch")
+    comment: str = Field(..., description="The issue found on that line and how to fix it")
+
 class Analysis(BaseModel):
     file_path: str = Field(..., description="file_path")
     analysis: str = Field(..., description="Write analysis as regular paragraphs, not code blocks")
+    comments: List[LineComment] = Field(default_factory=list, description="Comments on specific changed lines, only for concrete issues")
 
 class CodeReviewOutput(BaseModel):
     summary: str = Field(..., description="Write a clear, concise paragraph summarizing the changes")
     file_analyses: List[Analysis]
     suggestions: List[str] = Field(..., description="List of suggestions as strings")
 
+class ShardReviewOutput(BaseModel):
+    file_analyses: List[Analysis]
+    suggestions: List[str] = Field(..., description="List of suggestions for these files as strings")
+
+class ReviewReduceInput(BaseModel):
+    title: str
+    commits: List[str]
+    file_analyses: List[Analysis]
+    suggestions: List[str]
+
+class ReviewReduceOutput(BaseModel):
+    summary: str = Field(..., description="Write a clear, concise paragraph summarizing the changes")
+    suggestions: List[str] = Field(..., description="Merged list of the most important suggestions, without duplicates")
+
 CodeReviewPrompt="""You are an expert code reviewer. Analyze these pull request changes and provide detailed feedback.
 Write your analysis in clear, concise paragraphs. Do not use code blocks for regular text.
 Format suggestions as single-line bullet points.
+Attach concrete issues on specific changed lines as line comments, using line numbers of the new version of the file.
+
+Context:
+PR Title: {title}
+Commit Messages: 
+{commits}
+
+Changed Files:
+{changed_files}
+"""
+
+CodeReviewShardPrompt="""You are an expert code reviewer. You are reviewing one part of a larger pull request.
+Analyze each of the changed files below and provide detailed feedback for every file.
+Write your analysis in clear, concise paragraphs. Do not use code blocks for regular text.
+Format suggestions as single-line bullet points.
+Attach concrete issues on specific changed lines as line comments, using line numbers of the new version of the file.
 
 Context:
 PR Title: {title}
@@ -44,28 +98,291 @@ Changed Files:
 {changed_files}
 """
 
-def generate_review_response(title: str, updated_files: List[FileChange], commit_messages: List[str]):
+CodeReviewReducePrompt="""You are an expert code reviewer. The files of a pull request were reviewed separately.
+Using the per-file analyses and suggestions below, write a clear, concise paragraph summarizing the pull request
+and return a merged list of the most important suggestions. Merge suggestions that say the same thing.
+
+Context:
+PR Title: {title}
+Commit Messages: 
+{commits}
+
+File Analyses:
+{file_analyses}
+
+Suggestions:
+{suggestions}
+"""
+
+register_task("summarize_pr", prompt_template=CodeReviewPrompt, input_model=CodeReviewInput, output_model=CodeReviewOutput)
+register_task("review_shard", prompt_template=CodeReviewShardPrompt, input_model=CodeReviewInput, output_model=ShardReviewOutput)
+register_task("review_reduce", prompt_template=CodeReviewReducePrompt, input_model=ReviewReduceInput, output_model=ReviewReduceOutput)
+
+# Stored per-file analyses are reused only while the prompts that wrote them are unchanged
+REVIEW_PROMPT_VERSION = hashlib.sha256(
+    f"{CodeReviewPrompt}\0{CodeReviewShardPrompt}\0{schema_version(Analysis)}".encode("utf-8")).hexdigest()[:12]
+
+def _file_tokens(file_change: FileChangePrompt) -> int:
+    return count_tokens(file_change.patch) + count_tokens(file_change.content)
+
+def route_files(task_name: str, file_changes: List[FileChangePrompt]):
+    """Picks the model for a review call from the size of its changed files."""
+    return get_model_router().route(task_name, sum(_file_tokens(f) for f in file_changes), files=len(file_changes))
+
+def route_reduce(file_analyses, suggestions: List[str]):
+    return get_model_router().route("review_reduce", count_input_tokens(file_analyses, suggestions), files=len(file_analyses))
+
+def shard_files(file_changes: List[FileChangePrompt], budget: int = None) -> List[List[FileChangePrompt]]:
+    """
+    Groups changed files into shards of at most `budget` tokens, keeping files of a directory together
+    where possible. A single file larger than the budget gets a shard of its own.
+    """
+    budget = budget or SHARD_TOKEN_BUDGET
+    shards = []
+    current, current_tokens = [], 0
+    for file_change in sorted(file_changes, key=lambda f: (os.path.dirname(f.filename), f.filename)):
+        tokens = _file_tokens(file_change)
+        if current and current_tokens + tokens > budget:
+            shards.append(current)
+            current, current_tokens = [], 0
+        current.append(file_change)
+        current_tokens += tokens
+    if current:
+        shards.append(current)
+    return shards
+
+def dedupe_suggestions(suggestions: List[str]) -> List[str]:
+    """Drops suggestions that only differ in case, whitespace or punctuation, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for suggestion in suggestions:
+        key = re.sub(r"[\W_]+", " ", suggestion).strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(suggestion.strip())
+    return unique
+
+def needs_sharding(file_changes: List[FileChangePrompt]) -> bool:
+    """Small PRs keep the single-call review."""
+    if len(file_changes) > SINGLE_CALL_MAX_FILES:
+        return True
+    return sum(_file_tokens(f) for f in file_changes) > SINGLE_CALL_TOKEN_LIMIT
+
+def _report_shard_progress(on_partial, shard_outputs, cached_analyses=()):
+    """Reports the reused analyses and those of the shards finished so far, in shard order."""
+    if on_partial is not None:
+        analyses = list(cached_analyses) + [a for output in shard_outputs if output is not None for a in output.file_analyses]
+        on_partial({"file_analyses": [a.model_dump() for a in analyses]})
+
+class _ShardedReview:
+    """
+    State of a map-reduce review of a large PR: the shards with their routes, the shard outputs
+    gathered so far and the reduce call. The sync and async drivers only differ in how they run the
+    shard calls concurrently.
+    """
+
+    def __init__(self, title: str, file_changes: List[FileChangePrompt], commit_messages: List[str],
+                 on_partial: Callable[[Dict[str, Any]], None] = None, cached_analyses: List[Analysis] = ()):
+        self.request = {"title": title, "commits": commit_messages}
+        self.shards = shard_files(file_changes)
+        log_info("Reviewing %d files in %d shards", len(file_changes), len(self.shards))
+        # Routed up front, the worker threads of the sync driver do not see the current repo context
+        self.routes = [route_files("review_shard", shard) for shard in self.shards]
+        self.outputs = [None] * len(self.shards)
+        self.on_partial = on_partial
+        self.cached_analyses = cached_analyses
+        self.file_analyses = []
+
+    def shard_call(self, index: int):
+        """Returns the route and input data of the call reviewing shard `index`."""
+        return self.routes[index], {**self.request, "changed_files": self.shards[index]}
+
+    def shard_done(self, index: int, output: ShardReviewOutput):
+        self.outputs[index] = output
+        _report_shard_progress(self.on_partial, self.outputs, self.cached_analyses)
+
+    def shard_failed(self, index: int, error: Exception):
+        log_error(f"Error reviewing shard {[f.filename for f in self.shards[index]]}", error)
+
+    def reduce_call(self):
+        """Combines the shard outputs and returns the route and input data of the reduce call."""
+        outputs = [output for output in self.outputs if output is not None]
+        if self.shards and not outputs:
+            raise RuntimeError("Every review shard failed")
+        self.file_analyses, suggestions = combine_shard_outputs(outputs, self.cached_analyses)
+        return route_reduce(self.file_analyses, suggestions), {**self.request, "file_analyses": self.file_analyses, "suggestions": suggestions}
+
+    def result(self, reduced: ReviewReduceOutput) -> CodeReviewOutput:
+        return CodeReviewOutput(summary=reduced.summary, file_analyses=self.file_analyses,
+                                suggestions=dedupe_suggestions(reduced.suggestions))
+
+def _call(task_name: str, route, input_data: Dict[str, Any], on_partial: Callable[[Dict[str, Any]], None] = None):
+    """Runs one review call on the routed model, streaming the partial output to on_partial if given."""
+    openAI_handler = get_llm_handler(model_config=route.model_config)
+    with route.track() as result:
+        if on_partial is None:
+            result["response"] = openAI_handler.generate_response(task_name, **input_data)
+        else:
+            result["response"] = openAI_handler.stream_response(task_name, on_partial, **input_data)
+    return result["response"]
+
+async def _acall(task_name: str, route, input_data: Dict[str, Any], on_partial: Callable[[Dict[str, Any]], None] = None):
+    """Async variant of _call."""
+    openAI_handler = get_llm_handler(model_config=route.model_config)
+    with route.track() as result:
+        if on_partial is None:
+            result["response"] = await openAI_handler.agenerate_response(task_name, **input_data)
+        else:
+            result["response"] = await openAI_handler.astream_response(task_name, on_partial, **input_data)
+    return result["response"]
+
+def generate_sharded_review_response(title: str, file_changes: List[FileChangePrompt], commit_messages: List[str],
+                                     on_partial: Callable[[Dict[str, Any]], None] = None,
+                                     cached_analyses: List[Analysis] = ()) -> CodeReviewOutput:
+    """
+    Reviews a large PR in shards with bounded concurrency (map), then writes the summary and
+    deduplicated suggestions from the combined analyses in a final call (reduce).
+    on_partial, if given, is called with the analyses gathered so far each time a shard finishes.
+    cached_analyses from an earlier review of unchanged files are merged in before the reduce call.
+    """
+    review = _ShardedReview(title, file_changes, commit_messages, on_partial, cached_analyses)
+
+    def review_shard(index):
+        try:
+            return _call("review_shard", *review.shard_call(index))
+        except Exception as error:
+            review.shard_failed(index, error)
+            return None
+
+    with ThreadPoolExecutor(max_workers=REVIEW_SHARD_CONCURRENCY) as executor:
+        futures = {executor.submit(tracing.wrap(review_shard), index): index for index in range(len(review.shards))}
+        for future in as_completed(futures):
+            review.shard_done(futures[future], future.result())
+    return review.result(_call("review_reduce", *review.reduce_call()))
+
+async def agenerate_sharded_review_response(title: str, file_changes: List[FileChangePrompt], commit_messages: List[str],
+                                            on_partial: Callable[[Dict[str, Any]], None] = None,
+                                            cached_analyses: List[Analysis] = ()) -> CodeReviewOutput:
+    """Async variant of generate_sharded_review_response, bounding concurrent shard calls with a semaphore."""
+    review = _ShardedReview(title, file_changes, commit_messages, on_partial, cached_analyses)
+    semaphore = asyncio.Semaphore(REVIEW_SHARD_CONCURRENCY)
+
+    async def review_shard(index):
+        async with semaphore:
+            try:
+                review.shard_done(index, await _acall("review_shard", *review.shard_call(index)))
+            except Exception as error:
+                review.shard_failed(index, error)
+
+    await asyncio.gather(*(review_shard(index) for index in range(len(review.shards))))
+    return review.result(await _acall("review_reduce", *review.reduce_call()))
+
+def combine_shard_outputs(shard_outputs: List[ShardReviewOutput], cached_analyses: List[Analysis] = ()):
+    """Concatenates the reused and shard analyses in path order and deduplicates the shard suggestions."""
+    file_analyses = list(cached_analyses) + [analysis for output in shard_outputs for analysis in output.file_analyses]
+    if cached_analyses:
+        file_analyses.sort(key=lambda a: a.file_path)
+    suggestions = dedupe_suggestions([s for output in shard_outputs for s in output.suggestions])
+    return file_analyses, suggestions
+
+def _load_analysis(file_path: str, stored: str) -> Analysis:
+    # Analyses are stored as JSON with their line comments; older entries hold only the text
     try:
-        file_changes= [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
-        
-        openAI_config = {
-            "model": "gpt-4o-mini"
-        }
-        input_data={
-            "title": title,
-            "commits":commit_messages,
-            "changed_files": file_changes
-            
-        }
-        print("a")
-        openAI_handler = LLMHandler(model_config=openAI_config)
-        print("b")
-        openAI_handler.set_task_config("summarize_pr", prompt_template=CodeReviewPrompt, input_model=CodeReviewInput, output_model=CodeReviewOutput) 
-        print("c")
-        response = openAI_handler.generate_response("summarize_pr", **input_data)
-        print("d")
+        return Analysis.model_validate_json(stored)
+    except ValidationError:
+        return Analysis(file_path=file_path, analysis=stored)
+
+def split_reviewed_files(updated_files: List[FileChange], file_changes: List[FileChangePrompt]):
+    """
+    Finds the files of the current repo whose blob was already reviewed with the current prompts.
+
+    Returns:
+        Tuple of (file changes that still need a review, stored analyses of the other files)
+    """
+    repo = current_repo.get()
+    store = get_analysis_store()
+    if repo is None or store is None:
+        return file_changes, []
+    blobs = {f["filename"]: f["sha"] for f in updated_files if f.get("sha")}
+    stored = store.get_many(repo, REVIEW_PROMPT_VERSION, blobs)
+    if stored:
+        log_info("Reusing %d stored file analyses, reviewing %d changed files", len(stored), len(file_changes) - len(stored))
+    cached_analyses = [_load_analysis(f.filename, stored[f.filename]) for f in file_changes if f.filename in stored]
+    return [f for f in file_changes if f.filename not in stored], cached_analyses
+
+def remember_analyses(updated_files: List[FileChange], response):
+    """Stores the per-file analyses of a finished review for later re-reviews and returns the response."""
+    repo = current_repo.get()
+    store = get_analysis_store()
+    if repo is None or store is None or not isinstance(response, CodeReviewOutput):
         return response
-    
+    blobs = {f["filename"]: f["sha"] for f in updated_files if f.get("sha")}
+    try:
+        store.put_many(repo, REVIEW_PROMPT_VERSION,
+                       [(a.file_path, blobs[a.file_path], a.model_dump_json()) for a in response.file_analyses if a.file_path in blobs])
     except Exception as error:
-        print("Error generating AI review:", error)
-        return {"summary": "Error", "fileAnalyses": [], "overallSuggestions": []}
\ No newline at end of file
+        log_error("Error storing file analyses", error)
+    return response
+
+def build_file_changes(updated_files: List[FileChange]) -> List[FileChangePrompt]:
+    return [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
+
+def review_fallback() -> CodeReviewOutput:
+    """The review returned when generating it failed, so callers can always read its fields."""
+    return CodeReviewOutput(summary="Error generating the review", file_analyses=[], suggestions=[])
+
+def _reviewed(func):
+    """
+    Decorator for the review entry points of a function or coroutine function: stores the per-file
+    analyses of a finished review for later re-reviews and returns review_fallback on any error.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(title, updated_files, commit_messages, *args):
+            try:
+                return remember_analyses(updated_files, await func(title, updated_files, commit_messages, *args))
+            except Exception as error:
+                log_error("Error generating AI review", error)
+                return review_fallback()
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(title, updated_files, commit_messages, *args):
+        try:
+            return remember_analyses(updated_files, func(title, updated_files, commit_messages, *args))
+        except Exception as error:
+            log_error("Error generating AI review", error)
+            return review_fallback()
+    return wrapper
+
+@_reviewed
+def generate_review_response(title: str, updated_files: List[FileChange], commit_messages: List[str],
+                             on_partial: Callable[[Dict[str, Any]], None] = None) -> CodeReviewOutput:
+    """
+    Reviews the PR in a single call, or in shards when it is large or parts of it were already reviewed.
+    on_partial, if given, is called with the partially parsed review (a dict with any of summary,
+    file_analyses and suggestions) as it arrives.
+    """
+    file_changes, cached_analyses = split_reviewed_files(updated_files, build_file_changes(updated_files))
+    if cached_analyses or needs_sharding(file_changes):
+        return generate_sharded_review_response(title, file_changes, commit_messages, on_partial, cached_analyses)
+    input_data = {"title": title, "commits": commit_messages, "changed_files": file_changes}
+    return _call("summarize_pr", route_files("summarize_pr", file_changes), input_data, on_partial)
+
+@_reviewed
+async def agenerate_review_response(title: str, updated_files: List[FileChange], commit_messages: List[str],
+                                    on_partial: Callable[[Dict[str, Any]], None] = None) -> CodeReviewOutput:
+    """Async variant of generate_review_response."""
+    file_changes, cached_analyses = split_reviewed_files(updated_files, build_file_changes(updated_files))
+    if cached_analyses or needs_sharding(file_changes):
+        return await agenerate_sharded_review_response(title, file_changes, commit_messages, on_partial, cached_analyses)
+    input_data = {"title": title, "commits": commit_messages, "changed_files": file_changes}
+    return await _acall("summarize_pr", route_files("summarize_pr", file_changes), input_data, on_partial)
+
+def stream_review_response(title: str, updated_files: List[FileChange], commit_messages: List[str], on_partial: Callable[[Dict[str, Any]], None]):
+    """Generates the review like generate_review_response, calling on_partial with the partial review as it arrives."""
+    return generate_review_response(title, updated_files, commit_messages, on_partial)
+
+async def astream_review_response(title: str, updated_files: List[FileChange], commit_messages: List[str], on_partial: Callable[[Dict[str, Any]], None]):
+    """Async variant of stream_review_response."""
+    return await agenerate_review_response(title, updated_files, commit_messages, on_partial)
@@ -1,7 +1,9 @@
 from pydantic import BaseModel, ValidationError, Field
 from typing import Any, Dict, Type, List
 from typing_extensions import TypedDict, Optional, Literal
-from utils.llm_utils import LLMHandler
+from utils.llm_registry import get_llm_handler, register_task
+from utils.model_router import count_input_tokens, get_model_router
+from utils.logging_utils import log_error
 
 class FileChange(TypedDict):
     filename: str
@@ -68,34 +70,52 @@ testUpdatePrompt = """
     - Follow best practices for structuring test functions (given/when/then, AAA - Arrange, Act, Assert).
     - Use pytest fixtures where appropriate for reusable setup/teardown logic.
 
-    Title: ${title}
+    Title: {title}
     Commits:
     {commits}
     Changed Files:
-    ${changed_files}
+    {changed_files}
     Existing Tests:
-    ${existing_tests}
+    {existing_tests}
     """
 
+register_task("test_update", prompt_template=testUpdatePrompt, input_model=testUpdateInput, output_model=testUpdateOutput)
+
+def build_test_case_input(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests, recommendations):
+    file_changes= [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
+    existing_tests= [ExistingFiles(filename=f["filename"], content=f["content"]) for f in existing_tests]
+    return {
+        "title": title,
+        "commits":commit_messages,
+        "changed_files": file_changes,
+        "existing_tests": existing_tests,
+        "recommendations": recommendations
+    }
+
+def route_test_case(input_data):
+    tokens = count_input_tokens(input_data["changed_files"], input_data["existing_tests"])
+    return get_model_router().route("test_update", tokens, files=len(input_data["changed_files"]))
+
 def generate_test_case_response(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests, recommendations):
     try:
-        file_changes= [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
-        existing_tests= [ExistingFiles(filename=f["filename"], content=f["content"]) for f in existing_tests]
-
-        openAI_config = {
-            "model": "gpt-4o-mini"
-        }
-        input_data={
-            "title": title,
-            "commits":commit_messages,
-            "changed_files": file_changes,
-            "existing_tests": existing_tests,
-            "recommendations": recommendations
-        }
-        openAI_handler = LLMHandler(model_config=openAI_config)
-        openAI_handler.set_task_config("summarize_pr", prompt_template=testUpdatePrompt, input_model=testUpdateInput, output_model=testUpdateOutput) 
-        response = openAI_handler.generate_response("summarize_pr", **input_data)
-        return response
+        input_data = build_test_case_input(title, updated_files, commit_messages, existing_tests, recommendations)
+        route = route_test_case(input_data)
+        openAI_handler = get_llm_handler(model_config=route.model_config)
+        with route.track() as result:
+            result["response"] = openAI_handler.generate_response("test_update", **input_data)
+        return result["response"]
+    except Exception as e:
+        log_error("Test Update step failed", e)
+        return testUpdateOutput(test_proposals=[])
+
+async def agenerate_test_case_response(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests, recommendations):
+    try:
+        input_data = build_test_case_input(title, updated_files, commit_messages, existing_tests, recommendations)
+        route = route_test_case(input_data)
+        openAI_handler = get_llm_handler(model_config=route.model_config)
+        with route.track() as result:
+            result["response"] = await openAI_handler.agenerate_response("test_update", **input_data)
+        return result["response"]
     except Exception as e:
-        print("Test Update step failed:", e)
+        log_error("Test Update step failed", e)
         return testUpdateOutput(test_proposals=[])
\ No newline at end of file
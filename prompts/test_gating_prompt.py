@@ -1,7 +1,9 @@
 from pydantic import BaseModel, ValidationError, Field
 from typing import Any, Dict, Type, List
 from typing_extensions import TypedDict, Optional
-from utils.llm_utils import LLMHandler
+from utils.llm_registry import get_llm_handler, register_task
+from utils.model_router import count_input_tokens, get_model_router
+from utils.logging_utils import log_error
 
 class FileChange(TypedDict):
     filename: str
@@ -46,24 +48,42 @@ Existing Tests:
 
 """
 
+register_task("test_gating", prompt_template=testGatingPrompt, input_model=testGatingInput, output_model=testGatingOutput)
+
+def build_gating_input(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests):
+    file_changes= [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
+    existing_tests= [ExistingFiles(filename=f["filename"], content=f["content"]) for f in existing_tests]
+    return {
+        "title": title,
+        "commits":commit_messages,
+        "changed_files": file_changes,
+        "existing_tests": existing_tests
+    }
+
+def route_gating(input_data):
+    tokens = count_input_tokens(input_data["changed_files"], input_data["existing_tests"])
+    return get_model_router().route("test_gating", tokens, files=len(input_data["changed_files"]))
+
 def generate_gating_response(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests):
     try:
-        file_changes= [FileChangePrompt(filename=f["filename"], patch=f["patch"], status=f["status"], content=f["content"]) for f in updated_files if f["excluded"] == False]
-        existing_tests= [ExistingFiles(filename=f["filename"], content=f["content"]) for f in existing_tests]
+        input_data = build_gating_input(title, updated_files, commit_messages, existing_tests)
+        route = route_gating(input_data)
+        openAI_handler = get_llm_handler(model_config=route.model_config)
+        with route.track() as result:
+            result["response"] = openAI_handler.generate_response("test_gating", **input_data)
+        return result["response"]
+    except Exception as e:
+        log_error("Gating step failed", e)
+        return testGatingOutput(shouldGenerateTests=False, reasoning=f"ERROR:{e}", recommendations=[])
 
-        openAI_config = {
-            "model": "gpt-4o-mini"
-        }
-        input_data={
-            "title": title,
-            "commits":commit_messages,
-            "changed_files": file_changes,
-            "existing_tests": existing_tests
-        }
-        openAI_handler = LLMHandler(model_config=openAI_config)
-        openAI_handler.set_task_config("summarize_pr", prompt_template=testGatingPrompt, input_model=testGatingInput, output_model=testGatingOutput) 
-        response = openAI_handler.generate_response("summarize_pr", **input_data)
-        return response
+async def agenerate_gating_response(title: str, updated_files: List[FileChange], commit_messages: List[str], existing_tests):
+    try:
+        input_data = build_gating_input(title, updated_files, commit_messages, existing_tests)
+        route = route_gating(input_data)
+        openAI_handler = get_llm_handler(model_config=route.model_config)
+        with route.track() as result:
+            result["response"] = await openAI_handler.agenerate_response("test_gating", **input_data)
+        return result["response"]
     except Exception as e:
-        print("Gating step failed:", e)
-        return testGatingOutput(shouldGenerateTests=False, reasoning=f"ERROR:{e}", recommendations="")
\ No newline at end of file
+        log_error("Gating step failed", e)
+        return testGatingOutput(shouldGenerateTests=False, reasoning=f"ERROR:{e}", recommendations=[])
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Production entry point. Preloads the app once, then forks worker processes that accept connections
+from a shared listening socket, each serving requests on a bounded pool of threads.
+
+    python server.py        # WEB_WORKERS processes x WEB_THREADS threads on WEB_HOST:FLASK_PORT
+
+Workers share their hot caches through files on the node rather than per-process copies: the
+installation token and webhook delivery IDs (utils.shared_store), blob contents (utils.blob_cache)
+and LLM responses (utils.llm_cache).
+
+SIGTERM or SIGINT drains the server: workers stop accepting connections, give in-flight requests up
+to WEB_DRAIN_TIMEOUT seconds to finish, then exit. Workers that die are replaced while it runs.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+from config.constants import FLASK_PORT, WEB_DRAIN_TIMEOUT, WEB_HOST, WEB_THREADS, WEB_WORKERS
+from utils.logging_utils import log_error, log_info, stop_logging
+
+# Workers dying sooner than this after their start are replaced after a pause, to avoid a fork loop
+MIN_WORKER_LIFETIME = 1.0
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug server that handles connections on a fixed pool of threads. The accept loop waits for
+    a free thread, so connections a busy worker cannot serve are left to the other workers.
+    """
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int, fd: int):
+        super().__init__(host, port, app, fd=fd)
+        self.threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Waits for the in-flight requests, after serve_forever has returned
+
+        Returns:
+            True if they all finished within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        for _ in range(self.threads):
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        self._executor.shutdown(wait=True)
+        return True
+
+
+def run_worker(listener: socket.socket, app, threads: int, drain_timeout: float):
+    """Serves requests in a forked worker until SIGTERM or SIGINT, then drains and exits."""
+    server = PooledWSGIServer(WEB_HOST, FLASK_PORT, app, threads, fd=listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, it cannot run on the thread serving
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    log_info("Worker %d serving with %d threads", os.getpid(), threads)
+    server.serve_forever()
+    if not server.drain(drain_timeout):
+        log_error(f"Worker {os.getpid()} stopped with requests still in flight after {drain_timeout}s")
+    log_info("Worker %d stopped", os.getpid())
+
+
+class Arbiter:
+    """Forks and supervises the workers, and forwards shutdown signals to them"""
+
+    def __init__(self, app, listener: socket.socket, workers: int = WEB_WORKERS, threads: int = WEB_THREADS,
+                 drain_timeout: float = WEB_DRAIN_TIMEOUT):
+        self.app = app
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.drain_timeout = drain_timeout
+        self.children = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, self.app, self.threads, self.drain_timeout)
+            except Exception as error:
+                log_error("Worker failed", error)
+                code = 1
+            finally:
+                # os._exit skips the atexit handlers, flush the log queue first
+                stop_logging()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            log_info("Draining %d workers", len(self.children))
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            log_error(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, replacing it")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn()
+        log_info("All workers stopped")
+        return 0
+
+
+def main() -> int:
+    # Preload: imports, prompt registries and models are set up once and shared copy-on-write
+    from app import app
+    listener = socket.create_server((WEB_HOST, FLASK_PORT), backlog=2048)
+    listener.set_inheritable(True)
+    log_info("Listening on %s:%d with %d workers x %d threads", WEB_HOST, FLASK_PORT, WEB_WORKERS, WEB_THREADS)
+    try:
+        return Arbiter(app, listener).run()
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+import os
+import shutil
+import tempfile
+
+# Every on-disk cache and store goes to a scratch directory, so the suite leaves the checkout clean.
+# Set when pytest loads this file, before the modules reading these paths at import are imported.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="pr-agent-tests-")
+
+for name, path in {
+    "LLM_CACHE_PATH": "llm_cache.sqlite3",
+    "SHARED_STORE_PATH": "shared.sqlite3",
+    "JOB_QUEUE_PATH": "jobs.sqlite3",
+    "ANALYSIS_STORE_PATH": "analyses.sqlite3",
+    "TRACE_EXPORT_PATH": "traces.jsonl",
+    "PROFILE_DIR": "profiles",
+    "BLOB_CACHE_DIR": "blobs",
+    "TEST_INDEX_DIR": "test_index",
+}.items():
+    os.environ[name] = os.path.join(SCRATCH_DIR, path)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
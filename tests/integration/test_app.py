@@ -4,7 +4,9 @@ from app import app
 
 
 @pytest.fixture
-def client():
+def client(tmp_path, monkeypatch):
+    # The webhook dumps each payload to data.json in the working directory
+    monkeypatch.chdir(tmp_path)
     with app.test_client() as client:
         yield client
 
@@ -43,3 +45,61 @@ def test_webhook_labeled(client):
     }
     response = client.post('/webhook', data=json.dumps(payload), content_type='application/json')
     assert response.status_code == 200
+
+
+def test_metrics_endpoint(client):
+    from utils import metrics
+    metrics.increment("test_requests_total")
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"test_requests_total 1" in response.data
+
+
+def test_admin_profile_requires_token(client, monkeypatch, tmp_path):
+    import app as app_module
+    from utils import profiling
+    from utils.shared_store import SharedStore
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "get_shared_store", lambda store=SharedStore(str(tmp_path / "shared.sqlite3")): store)
+
+    assert client.post('/admin/profile', json={"runs": 2}).status_code == 403
+
+    headers = {"Authorization": "Bearer secret"}
+    response = client.post('/admin/profile', json={"repo": "owner/repo", "pr": 3, "runs": 2}, headers=headers)
+    assert response.status_code == 201
+    assert response.get_json()["runs"] == 2
+    assert client.post('/admin/profile', json={"mode": "perf"}, headers=headers).status_code == 400
+    assert len(client.get('/admin/profile', headers=headers).get_json()["pending"]) == 1
+    assert client.delete('/admin/profile', headers=headers).get_json()["pending"] == []
+
+
+def test_webhook_redelivery_is_processed_once(client, monkeypatch, tmp_path):
+    import app as app_module
+    from utils.shared_store import SharedStore
+    monkeypatch.setattr(app_module, "get_shared_store", lambda store=SharedStore(str(tmp_path / "shared.sqlite3")): store)
+    processed = []
+    monkeypatch.setattr(app_module, "process_webhook", lambda event, data: processed.append(event) or ({"message": "OK!"}, 200))
+    headers = {"X-GitHub-Event": "ping", "X-GitHub-Delivery": "delivery-1"}
+
+    first = client.post('/webhook', data=json.dumps({"zen": "hi"}), content_type='application/json', headers=headers)
+    second = client.post('/webhook', data=json.dumps({"zen": "hi"}), content_type='application/json', headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == {"message": "Duplicate delivery"}
+    assert processed == ["ping"]
+
+
+def test_failed_delivery_can_be_redelivered(client, monkeypatch, tmp_path):
+    import app as app_module
+    from utils.shared_store import SharedStore
+    monkeypatch.setattr(app_module, "get_shared_store", lambda store=SharedStore(str(tmp_path / "shared.sqlite3")): store)
+    responses = iter([({"message": "PR review failed"}, 500), ({"message": "OK!"}, 200)])
+    monkeypatch.setattr(app_module, "process_webhook", lambda event, data: next(responses))
+    headers = {"X-GitHub-Event": "ping", "X-GitHub-Delivery": "delivery-2"}
+
+    first = client.post('/webhook', data=json.dumps({"zen": "hi"}), content_type='application/json', headers=headers)
+    second = client.post('/webhook', data=json.dumps({"zen": "hi"}), content_type='application/json', headers=headers)
+
+    assert (first.status_code, second.status_code) == (500, 200)
+    assert second.get_json() == {"message": "OK!"}
@@ -1,8 +1,16 @@
 import pytest
+from app import app
 from webhook.webhook_handler import process_webhook
 from unittest.mock import patch
 
 
+@pytest.fixture(autouse=True)
+def app_context():
+    # process_webhook builds its responses with jsonify
+    with app.app_context():
+        yield
+
+
 def test_process_webhook_pull_request_opened():
     event = "pull_request"
     data = {
@@ -10,10 +18,11 @@ def test_process_webhook_pull_request_opened():
         "repository": {},
         "pull_request": {}
     }
-    with patch('agents.pr_base_agent.PRCommentAgent.handle_pull_request_opened') as mock_handle_pr:
+    with patch('webhook.webhook_handler.PRPipeline') as mock_pipeline:
+        mock_pipeline.return_value.run.return_value = (True, True, None)
         response = process_webhook(event, data)
-        assert mock_handle_pr.called
-        assert response[0]['message'] == 'OK!'
+        assert mock_pipeline.return_value.run.called
+        assert response[0].get_json()['message'] == 'OK!'
         assert response[1] == 200
 
 
@@ -24,7 +33,22 @@ def test_process_webhook_failure():
         "repository": {},
         "pull_request": {}
     }
-    with patch('agents.pr_base_agent.PRCommentAgent.handle_pull_request_opened', side_effect=Exception('Failure')):
+    with patch('webhook.webhook_handler.PRPipeline') as mock_pipeline:
+        mock_pipeline.return_value.run.return_value = (False, True, None)
         response = process_webhook(event, data)
-        assert response[0]['message'] == 'PR review failed'
-        assert response[1] == 500
\ No newline at end of file
+        assert response[0].get_json()['message'] == 'PR review failed'
+        assert response[1] == 500
+
+
+def test_process_webhook_synchronize_only_re_reviews():
+    data = {
+        "action": "synchronize",
+        "repository": {},
+        "pull_request": {}
+    }
+    with patch('webhook.webhook_handler.PRPipeline') as mock_pipeline:
+        mock_pipeline.return_value.run.return_value = (True, True, None)
+        response = process_webhook("pull_request", data)
+        assert mock_pipeline.call_args.kwargs["generate_tests"] is False
+        assert response[0].get_json()['message'] == 'OK!'
+        assert response[1] == 200
@@ -0,0 +1,24 @@
+import time
+from utils.analysis_store import AnalysisStore
+
+
+def test_lookup_is_keyed_by_blob_and_prompt_version():
+    store = AnalysisStore(":memory:")
+    store.put_many("acme/app", "v1", [("a.py", "sha1", "looks good"), ("b.py", "sha2", "needs tests")])
+
+    assert store.get_many("acme/app", "v1", {"a.py": "sha1", "b.py": "changed"}) == {"a.py": "looks good"}
+    assert store.get_many("acme/app", "v2", {"a.py": "sha1"}) == {}
+    assert store.get_many("acme/other", "v1", {"a.py": "sha1"}) == {}
+
+
+def test_expired_and_least_recently_used_entries_are_evicted():
+    store = AnalysisStore(":memory:", ttl_seconds=0.05, max_entries=2)
+    store.put_many("acme/app", "v1", [("a.py", "1", "a"), ("b.py", "2", "b")])
+    time.sleep(0.01)
+    store.get_many("acme/app", "v1", {"a.py": "1"})
+    store.put_many("acme/app", "v1", [("c.py", "3", "c")])
+    assert store.get_many("acme/app", "v1", {"a.py": "1", "b.py": "2", "c.py": "3"}) == {"a.py": "a", "c.py": "c"}
+
+    time.sleep(0.06)
+    store.evict()
+    assert len(store) == 0
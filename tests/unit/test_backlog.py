@@ -0,0 +1,66 @@
+import json
+import os
+from types import SimpleNamespace
+import backlog
+from backlog import BacklogState, DryRunWriter, read_pr_list, run_backlog
+from utils import github_utils
+
+
+def pull(number, sha=None):
+    return SimpleNamespace(number=number, title=f"PR {number}", head=SimpleNamespace(ref=f"branch-{number}", sha=sha or f"sha-{number}"))
+
+
+class OpenGate:
+    def wait(self):
+        pass
+
+
+def test_read_pr_list(tmp_path):
+    path = tmp_path / "prs.txt"
+    path.write_text("12\n\n# skipped\nhttps://github.com/o/r/pull/15\n7  # trailing comment\n")
+    assert read_pr_list(str(path)) == [12, 15, 7]
+
+
+def test_run_backlog_resumes_from_state(tmp_path, monkeypatch):
+    repository = SimpleNamespace(full_name="o/r")
+    pulls = [pull(1), pull(2), pull(3, sha="new-head")]
+    monkeypatch.setattr(github_utils, "get_repository", lambda owner, name: repository)
+    monkeypatch.setattr(github_utils, "get_open_pull_requests", lambda repo: pulls)
+    runs = []
+
+    def run_pull_request(payload, mode, comment_agent, test_agent):
+        runs.append(payload["pull_request"]["number"])
+        if payload["pull_request"]["number"] == 2:
+            raise RuntimeError("boom")
+        return {"review": True}
+
+    monkeypatch.setattr(backlog, "run_pull_request", run_pull_request)
+    state_path = str(tmp_path / "state.json")
+    previous = BacklogState(state_path)
+    previous.record(1, status="done", head_sha="sha-1")
+    previous.record(3, status="done", head_sha="old-head")
+
+    counts = run_backlog("o/r", None, "review", BacklogState(state_path), concurrency=2, gate=OpenGate(),
+                         comment_agent=object(), test_agent=object())
+
+    assert counts == {"done": 1, "failed": 1, "skipped": 1}
+    assert sorted(runs) == [2, 3]
+    saved = json.load(open(state_path))["prs"]
+    assert saved["2"]["status"] == "failed" and saved["2"]["error"] == "boom"
+    assert saved["3"]["status"] == "done" and saved["3"]["head_sha"] == "new-head"
+
+
+def test_dry_run_writes_locally_and_restores_github_utils(tmp_path):
+    original = github_utils.post_comment
+    writer = DryRunWriter(str(tmp_path))
+    with writer.install():
+        comment = github_utils.upsert_comment(None, 4, "<!-- marker -->", "in progress")
+        github_utils.update_comment(comment, "final review")
+        assert github_utils.upsert_comment(None, 4, "<!-- marker -->", "again") is comment
+        github_utils.create_file(None, "tests/unit/test_a.py", "Add tests", "def test_a():\n    pass\n", "feature")
+        github_utils.create_review(None, 4, "abc", [{"path": "a.py", "position": 1, "body": "nit"}])
+
+    assert github_utils.post_comment is original
+    assert open(os.path.join(tmp_path, "pr-4", "comment-1.md")).read() == "again"
+    assert open(os.path.join(tmp_path, "branches", "feature", "tests", "unit", "test_a.py")).read().startswith("def test_a")
+    assert json.load(open(os.path.join(tmp_path, "pr-4", "review-1.json")))["comments"][0]["body"] == "nit"
@@ -0,0 +1,31 @@
+from benchmarks.baselines import compare, load_baselines, save_baselines
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baselines = {
+        "end_to_end/100": {"seconds": 1.0, "peak_mb": 50.0},
+        "prompt_building/100": {"seconds": 0.5, "peak_mb": 10.0},
+    }
+    results = {
+        "end_to_end/100": {"seconds": 1.3, "peak_mb": 52.0},
+        "prompt_building/100": {"seconds": 0.55, "peak_mb": 30.0},
+        "commitTestChanges/100": {"seconds": 9.0, "peak_mb": 1.0},
+    }
+
+    regressions = compare(results, baselines, tolerance_pct=25)
+
+    assert regressions == [
+        "end_to_end/100 seconds: 1.3 vs baseline 1.0 (+30%)",
+        "prompt_building/100 peak_mb: 30.0 vs baseline 10.0 (+200%)",
+    ]
+
+
+def test_compare_ignores_noise_on_tiny_cases():
+    assert compare({"render/10": {"seconds": 0.0002, "peak_mb": 0.02}}, {"render/10": {"seconds": 0.0001, "peak_mb": 0.01}}, 25) == []
+
+
+def test_baselines_round_trip(tmp_path):
+    path = str(tmp_path / "baselines.json")
+    assert load_baselines(path) == {}
+    save_baselines(path, {"end_to_end/10": {"seconds": 0.6, "peak_mb": 2.0}}, repeat=3)
+    assert load_baselines(path) == {"end_to_end/10": {"seconds": 0.6, "peak_mb": 2.0}}
@@ -0,0 +1,45 @@
+import time
+from unittest.mock import MagicMock
+from utils.comment_updater import ThrottledCommentUpdater
+
+
+def test_updates_are_throttled_and_coalesced():
+    update_fn = MagicMock()
+    updater = ThrottledCommentUpdater("comment", update_fn, min_interval=0.2)
+
+    updater.submit("one")
+    time.sleep(0.05)
+    for body in ["two", "three", "four"]:
+        updater.submit(body)
+    time.sleep(0.05)
+    assert [c.args[1] for c in update_fn.call_args_list] == ["one"]
+
+    time.sleep(0.25)
+    assert [c.args[1] for c in update_fn.call_args_list] == ["one", "four"]
+
+
+def test_close_drops_pending_and_writes_final_body():
+    update_fn = MagicMock()
+    updater = ThrottledCommentUpdater("comment", update_fn, min_interval=10)
+
+    updater.submit("one")
+    time.sleep(0.05)
+    updater.submit("two")
+    updater.close("final")
+    updater.submit("ignored")
+    time.sleep(0.05)
+
+    assert [c.args[1] for c in update_fn.call_args_list] == ["one", "final"]
+
+
+def test_identical_bodies_are_skipped_and_errors_swallowed():
+    update_fn = MagicMock(side_effect=[None, RuntimeError("rate limited")])
+    updater = ThrottledCommentUpdater("comment", update_fn, min_interval=0)
+
+    updater.submit("same")
+    time.sleep(0.05)
+    updater.submit("same")
+    time.sleep(0.05)
+    updater.close("different")
+
+    assert update_fn.call_count == 2
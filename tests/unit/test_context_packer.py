@@ -0,0 +1,101 @@
+import pytest
+from utils import context_packer
+from utils.context_packer import pack_context, extract_hunk_context, is_related_test
+
+
+@pytest.fixture(autouse=True)
+def char_token_estimate(monkeypatch):
+    monkeypatch.setattr(context_packer, "_get_encoding", lambda: None)
+
+
+def make_file(filename, lines=100, excluded=False):
+    content = "\n".join(f"line {i}" for i in range(1, lines + 1))
+    patch = "@@ -50,1 +50,2 @@\n line 49\n+line 50"
+    return {"filename": filename, "patch": patch, "status": "modified", "additions": 1, "deletions": 0,
+            "excluded": excluded, "content": content}
+
+
+def test_everything_fits_in_a_large_budget():
+    files = [make_file("pkg/b.py"), make_file("pkg/a.py")]
+    tests = [{"filename": "tests/test_a.py", "content": "from pkg.a import x"}]
+
+    packed = pack_context("summarize_pr", files, tests, budget=100000)
+
+    assert [f["filename"] for f in packed.files] == ["pkg/a.py", "pkg/b.py"]
+    assert packed.files[0]["content"] == files[1]["content"]
+    assert packed.tests == tests
+    assert packed.dropped == []
+
+
+def test_hunks_replace_content_when_budget_is_tight():
+    f = make_file("pkg/a.py", lines=2000)
+
+    packed = pack_context("summarize_pr", [f], budget=500)
+
+    content = packed.files[0]["content"]
+    assert content.startswith("# lines 30-71")
+    assert "line 1\n" not in content
+    assert [(d.kind, d.reason) for d in packed.dropped] == [("content", "over budget")]
+    assert packed.used_tokens <= 500
+
+
+def test_patches_are_truncated_deterministically():
+    f = make_file("pkg/a.py")
+    f["patch"] = "@@ -1,100 +1,100 @@\n" + "\n".join(f"+added {i}" for i in range(100))
+
+    first = pack_context("summarize_pr", [f], budget=50)
+    second = pack_context("summarize_pr", [f], budget=50)
+
+    assert first.files == second.files
+    assert first.files[0]["patch"].startswith("@@ -1,100 +1,100 @@")
+    assert first.dropped[0].reason == "truncated"
+
+
+def test_excluded_files_are_packed_with_patch_and_patchless_files_are_recorded():
+    big = {**make_file("big.py", excluded=True), "content": None}
+    binary = make_file("image.png")
+    binary["patch"] = None
+
+    packed = pack_context("summarize_pr", [big, binary], budget=1000)
+
+    # Files over the size threshold are never downloaded, they are reviewed from their patch only
+    assert [f["filename"] for f in packed.files] == ["big.py"]
+    assert packed.files[0]["patch"] == big["patch"]
+    assert packed.files[0]["content"] is None
+    assert [(d.filename, d.kind, d.reason) for d in packed.dropped] == [("image.png", "file", "no patch available")]
+
+
+def test_python_files_are_packed_as_changed_symbols():
+    content = "import os\n\n\ndef helper():\n    return 1\n\n\ndef changed():\n    return helper() + 1\n\n\ndef unrelated():\n    return 2\n"
+    content += "".join(f"\n\ndef unrelated_{i}():\n    return {i}\n" for i in range(200))
+    f = {"filename": "pkg/mod.py", "patch": "@@ -9,1 +9,1 @@\n-    return helper()\n+    return helper() + 1",
+         "status": "modified", "excluded": False, "content": content}
+
+    # The full content does not fit, so the file keeps its changed symbols
+    packed = pack_context("summarize_pr", [f], budget=1000)
+
+    excerpt = packed.files[0]["content"]
+    assert excerpt.startswith("# lines 8-9: def changed")
+    assert "def helper():  # line 4" in excerpt
+    assert "unrelated" not in excerpt
+
+
+def test_related_tests_are_packed_before_others():
+    files = [make_file("pkg/parser.py", lines=5)]
+    related = {"filename": "tests/unit/test_parser.py", "content": "x" * 200}
+    other = {"filename": "tests/unit/test_aaa.py", "content": "y" * 200}
+
+    packed = pack_context("test_gating", files, [other, related], budget=100)
+
+    assert packed.tests == [related]
+    assert packed.dropped[-1].filename == "tests/unit/test_aaa.py"
+
+
+def test_is_related_test_by_import():
+    files = [{"filename": "utils/file_utils.py"}]
+    assert is_related_test({"filename": "tests/test_misc.py", "content": "from utils.file_utils import read_json"}, files)
+    assert not is_related_test({"filename": "tests/test_misc.py", "content": "import json"}, files)
+
+
+def test_extract_hunk_context_without_content():
+    assert extract_hunk_context(None, "@@ -1 +1 @@") is None
@@ -0,0 +1,76 @@
+import difflib
+from utils.diff_utils import DiffLineIndex, changed_line_ranges, changed_lines, is_local_patch, local_diff_units, parse_hunks
+
+PATCH = """@@ -1,3 +1,4 @@
+ import os
++import sys
+ 
+ def a():
+@@ -40,2 +41,3 @@ def b():
+     x = 1
++    y = 2
+     return x"""
+
+
+def test_parse_hunks():
+    hunks = parse_hunks(PATCH)
+
+    assert [(h.old_start, h.old_count, h.new_start, h.new_count) for h in hunks] == [(1, 3, 1, 4), (40, 2, 41, 3)]
+    assert hunks[0].lines[1] == "+import sys"
+    assert hunks[1].new_end == 43
+
+
+def test_parse_hunks_without_counts():
+    hunks = parse_hunks("@@ -5 +5 @@\n-a\n+b")
+    assert (hunks[0].old_count, hunks[0].new_count) == (1, 1)
+
+
+def test_changed_line_ranges_merges_overlapping_context():
+    assert changed_line_ranges(PATCH) == [(1, 4), (41, 43)]
+    assert changed_line_ranges(PATCH, context=20) == [(1, 63)]
+    assert parse_hunks(None) == []
+
+
+def test_changed_lines_skip_context():
+    from utils.diff_utils import changed_lines
+    patch = "@@ -1,5 +1,5 @@\n a\n-b\n+B\n c\n-d\n e\n+f"
+    assert changed_lines(patch) == [2, 4, 5]
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+    return str(path)
+
+
+def test_local_diff_units_match_unified_diff(tmp_path):
+    old = [f"line {i}" for i in range(50)]
+    new = list(old)
+    new[10] = "changed 10"
+    new.insert(30, "inserted")
+    del new[45]
+    units = list(local_diff_units("a.py", write_lines(tmp_path / "old", old), write_lines(tmp_path / "new", new)))
+
+    expected = [line for line in difflib.unified_diff(old, new, lineterm="") if not line.startswith(("---", "+++"))]
+    actual = [line.split(" unit:")[0] if line.startswith("@@") else line for unit in units for line in unit.text.splitlines()]
+    assert actual == [line.rstrip() if line.startswith("@@") else line for line in expected]
+    assert changed_lines("\n".join(unit.text for unit in units)) == [11, 31, 46]
+
+
+def test_local_diff_splits_long_hunks_into_stable_units(tmp_path):
+    new_path = write_lines(tmp_path / "new", [f"x = {i}" for i in range(50)])
+    units = list(local_diff_units("big.py", None, new_path, max_unit_lines=20))
+
+    assert [unit.header.split(" unit:")[0] for unit in units] == ["@@ -0,0 +1,20 @@", "@@ -0,0 +21,20 @@", "@@ -0,0 +41,10 @@"]
+    assert [(h.new_start, h.new_count) for h in parse_hunks("\n".join(unit.text for unit in units))] == [(1, 20), (21, 20), (41, 10)]
+    assert [unit.id for unit in units] == [unit.id for unit in local_diff_units("big.py", None, new_path, max_unit_lines=20)]
+    assert len({unit.id for unit in units}) == 3
+
+
+def test_diff_line_index_positions():
+    index = DiffLineIndex(PATCH)
+    # Positions count from the line below the first header; later headers take a position
+    assert index.positions == {1: 1, 2: 2, 3: 3, 4: 4, 41: 6, 42: 7, 43: 8}
+    assert index.position(40) is None
+    assert index.position(40, tolerance=1) == 6
+    assert index.position(10, tolerance=3) is None
+    assert not is_local_patch(PATCH)
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from utils import file_filter
+from utils.file_filter import FileClassifier, get_file_classifier, glob_to_regex, parse_gitattributes, sniff_patch
+from utils.file_utils import iter_changed_files, skipped_files
+import re
+
+
+def test_glob_to_regex_follows_gitattributes_semantics():
+    assert re.fullmatch(glob_to_regex("*.min.js"), "static/js/app.min.js")
+    assert re.fullmatch(glob_to_regex("/docs/*.md"), "docs/a.md")
+    assert not re.fullmatch(glob_to_regex("/docs/*.md"), "src/docs/a.md")
+    assert re.fullmatch(glob_to_regex("**/vendor/**"), "vendor/lib/x.py")
+    assert re.fullmatch(glob_to_regex("**/vendor/**"), "web/vendor/x.js")
+    assert not re.fullmatch(glob_to_regex("**/vendor/**"), "src/vendors.py")
+
+
+def test_default_rules():
+    classifier = FileClassifier()
+    assert classifier.classify("package-lock.json") == "lock file"
+    assert classifier.classify("frontend/yarn.lock") == "lock file"
+    assert classifier.classify("third_party/lib/a.c") == "vendored"
+    assert classifier.classify("app/migrations/0002_auto.py") == "migration"
+    assert classifier.classify("tests/__snapshots__/view.test.js.snap") == "snapshot"
+    assert classifier.classify("proto/api_pb2.py") == "generated"
+    assert classifier.classify("docs/logo.png") == "binary"
+    assert classifier.classify("src/app.py") is None
+
+
+def test_gitattributes_hints_take_precedence():
+    rules = parse_gitattributes("# comment\napi/schema.py linguist-generated=true\n**/vendor/** -linguist-vendored\n*.svg binary\n")
+    classifier = FileClassifier(rules)
+    assert classifier.classify("api/schema.py") == "generated"
+    assert classifier.classify("vendor/patched.py") is None
+    assert classifier.classify("icons/a.svg") == "binary"
+
+
+def test_sniff_patch():
+    assert sniff_patch("@@ -0,0 +1,2 @@\n+// Code generated by protoc. DO NOT EDIT.\n+package api") == "generated"
+    assert sniff_patch("@@ -1 +1 @@\n-x\n+" + "a;" * 600) == "minified"
+    assert sniff_patch("@@ -1 +1 @@\n-x = 1\n+x = 2") is None
+    assert sniff_patch(None) is None
+
+
+def test_classifier_is_cached_per_repository(monkeypatch):
+    reads = []
+
+    def get_text_file(repository, path, ref):
+        reads.append(repository.full_name)
+        return "gen/** linguist-generated"
+
+    monkeypatch.setattr(file_filter.github_utils, "get_text_file", get_text_file)
+    monkeypatch.setattr(file_filter, "_classifiers", {})
+    repository = SimpleNamespace(full_name="o/r")
+    assert get_file_classifier(repository, "main").classify("gen/models.py") == "generated"
+    get_file_classifier(repository, "main")
+    assert reads == ["o/r"]
+
+
+def test_skipped_files_are_not_fetched(monkeypatch):
+    fetched = []
+    monkeypatch.setattr("utils.file_utils.get_blob_text", lambda repository, sha: fetched.append(sha) or "x = 1\n")
+    files = [SimpleNamespace(filename=name, sha=f"sha-{name}", patch="@@ -1 +1 @@\n+x", status="modified", additions=1, deletions=0)
+             for name in ("poetry.lock", "src/app.py")]
+
+    records = list(iter_changed_files(None, files, "head", classify=FileClassifier().classify))
+
+    assert fetched == ["sha-src/app.py"]
+    assert records[0].patch is None
+    assert skipped_files(records) == [("poetry.lock", "lock file")]
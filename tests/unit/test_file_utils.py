@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+import pytest
+from utils import file_utils
+from utils.file_utils import ChangedFile, FILE_SIZE_THRESHOLD, LazyChangedFiles, iter_changed_files, plan_content, skipped_files
+
+
+def pr_file(filename, status="modified", sha=None):
+    return SimpleNamespace(filename=filename, sha=sha or f"sha-{filename}", patch="@@ -1 +1 @@\n+x = 1", status=status,
+                           additions=1, deletions=0)
+
+
+@pytest.fixture
+def blobs(monkeypatch, tmp_path):
+    contents = {}
+    fetched = []
+
+    def get_blob_bytes(repository, sha):
+        fetched.append(sha)
+        return contents[sha].encode()
+
+    monkeypatch.setattr(file_utils.github_utils, "get_blob_bytes", get_blob_bytes)
+    monkeypatch.setattr(file_utils, "get_blob_cache", lambda: file_utils.BlobCache(str(tmp_path / "blobs")))
+    return contents, fetched
+
+
+def test_plan_content_uses_metadata_only():
+    assert plan_content("removed", 10, 1000) == "removed"
+    assert plan_content("modified", FILE_SIZE_THRESHOLD, 10 ** 6) == "excluded: over size threshold"
+    assert plan_content("modified", 4000, 999) == "over content budget"
+    assert plan_content("modified", 4000, 1000) is None
+    assert plan_content("added", None, 0) is None
+
+
+def test_only_files_that_fit_are_downloaded(blobs):
+    contents, fetched = blobs
+    contents.update({"sha-a.py": "a = 1\n" * 10, "sha-d.py": "d" * (FILE_SIZE_THRESHOLD + 1)})
+    files = [pr_file("a.py"), pr_file("big.py"), pr_file("gone.py", status="removed"), pr_file("d.py"), pr_file("late.py")]
+    sizes = {"a.py": 60, "big.py": FILE_SIZE_THRESHOLD * 2, "late.py": 8000}
+
+    records = list(iter_changed_files(None, files, "head", sizes, content_budget=1000))
+
+    assert fetched == ["sha-a.py", "sha-d.py"]
+    assert [r.skip_reason for r in records] == [None, "excluded: over size threshold", "removed",
+                                                "excluded: over size threshold", "over content budget"]
+    assert records[0].content == "a = 1\n" * 10
+    assert [r.excluded for r in records] == [False, True, False, True, False]
+    assert all(r.content is None for r in records[1:])
+
+
+def test_changed_file_reads_like_a_dict():
+    record = ChangedFile("a.py", "abc", "+x", "added", 1, 0, content="x")
+
+    assert record["filename"] == "a.py"
+    assert record.get("content") == "x"
+    assert record.get("missing", "default") == "default"
+    assert {**record, "content": None} == {"filename": "a.py", "sha": "abc", "patch": "+x", "status": "added",
+                                           "additions": 1, "deletions": 0, "excluded": False, "content": None,
+                                           "size": None, "skip_reason": None, "truncated_units": 0}
+    assert "skip_reason" in record and "missing" not in record
+    with pytest.raises(KeyError):
+        record["missing"]
+    assert not hasattr(record, "__dict__")
+
+
+def test_missing_patch_is_computed_from_cached_blobs(monkeypatch, tmp_path):
+    blobs = {"base": b"a = 1\nb = 2\n", "head": b"a = 1\nb = 3\n", "image": b"\x89PNG\0\0"}
+    fetched = []
+
+    def get_blob_bytes(repository, sha):
+        fetched.append(sha)
+        return blobs[sha]
+
+    monkeypatch.setattr(file_utils.github_utils, "get_blob_bytes", get_blob_bytes)
+    monkeypatch.setattr(file_utils, "get_blob_cache", lambda: file_utils.BlobCache(str(tmp_path)))
+    changed = SimpleNamespace(filename="a.py", sha="head", patch=None, status="modified", additions=1, deletions=1)
+    binary = SimpleNamespace(filename="logo.png", sha="image", patch=None, status="added", additions=0, deletions=0)
+
+    records = list(iter_changed_files(None, [changed, binary], "head", base_blobs=lambda: {"a.py": "base"}))
+
+    assert records[0].patch.splitlines()[1:] == [" a = 1", "-b = 2", "+b = 3"]
+    assert records[0].content == "a = 1\nb = 3\n"
+    assert records[1].patch is None and records[1].skip_reason == "binary"
+    # Served from the blob cache the second time
+    list(iter_changed_files(None, [changed], "head", base_blobs=lambda: {"a.py": "base"}))
+    assert sorted(fetched) == ["base", "head", "image"]
+
+
+def test_truncated_local_patch_is_reported(monkeypatch, tmp_path):
+    lines = [f"line {i} {'x' * 60}" for i in range(5000)]
+    blobs = {"base": "\n".join(lines).encode(),
+             "head": "\n".join(line + " changed" if i % 20 == 0 else line for i, line in enumerate(lines)).encode()}
+    monkeypatch.setattr(file_utils.github_utils, "get_blob_bytes", lambda repository, sha: blobs[sha])
+    monkeypatch.setattr(file_utils, "get_blob_cache", lambda: file_utils.BlobCache(str(tmp_path)))
+    changed = SimpleNamespace(filename="a.py", sha="head", patch=None, status="modified", additions=250, deletions=250)
+
+    [record] = iter_changed_files(None, [changed], "head", base_blobs=lambda: {"a.py": "base"})
+
+    assert 0 < len(record.patch) <= file_utils.LOCAL_DIFF_MAX_CHARS
+    assert record.truncated_units > 0
+    assert skipped_files([record]) == [("a.py", f"diff truncated, {record.truncated_units} hunks not reviewed")]
+
+
+def test_lazy_changed_files_are_produced_once_on_first_use():
+    produced = []
+
+    def records():
+        for name in ("a.py", "b.py"):
+            produced.append(name)
+            yield ChangedFile(name, None, "+x", "modified")
+
+    files = LazyChangedFiles(records())
+    assert produced == []
+
+    first = iter(files)
+    assert next(first).filename == "a.py"
+    assert produced == ["a.py"]
+    assert [f.filename for f in files] == ["a.py", "b.py"]
+    assert [f.filename for f in first] == ["b.py"]
+    assert len(files) == 2 and produced == ["a.py", "b.py"]
+
+
+def test_lazy_changed_files_repeat_the_source_error():
+    def records():
+        yield ChangedFile("a.py", None, "+x", "modified")
+        raise RuntimeError("rate limited")
+
+    files = LazyChangedFiles(records())
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            list(files)
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+from utils import inline_review
+from utils.inline_review import InlineComment, map_comments, submit_review
+
+PATCH = "@@ -1,2 +1,3 @@\n import os\n+import sys\n x = 1"
+
+
+def analysis(path, *comments):
+    return SimpleNamespace(file_path=path, comments=[SimpleNamespace(line=line, comment=text) for line, text in comments])
+
+
+def test_map_comments_uses_diff_positions():
+    files = [{"filename": "a.py", "patch": PATCH}, {"filename": "big.py", "patch": None}]
+    mapped, unmapped = map_comments([analysis("a.py", (2, "unused import"), (50, "far away")), analysis("big.py", (1, "no diff"))], files)
+
+    assert [(c.path, c.line, c.position) for c in mapped] == [("a.py", 2, 2)]
+    assert [(c.path, c.line) for c in unmapped] == [("a.py", 50), ("big.py", 1)]
+
+
+def test_submit_review_batches_and_reports_failures(monkeypatch):
+    calls = []
+
+    def create_review(repository, pull_number, commit_sha, comments, body=""):
+        calls.append(comments)
+        if len(calls) == 2:
+            raise RuntimeError("422 Unprocessable Entity")
+
+    monkeypatch.setattr(inline_review.github_utils, "create_review", create_review)
+    comments = [InlineComment("a.py", i, f"comment {i}", position=i) for i in range(1, 6)]
+
+    posted = submit_review(None, 1, "sha", comments, max_comments=2)
+
+    assert [len(batch) for batch in calls] == [2, 2, 1]
+    assert [c.line for c in posted] == [1, 2, 5]
+    assert calls[0][0] == {"path": "a.py", "position": 1, "body": "comment 1"}
@@ -0,0 +1,162 @@
+import threading
+import time
+from utils.job_queue import HashRing, JobQueue, QueueWorker, _hash, shard_key
+
+
+def payload(repo, installation=1):
+    owner, name = repo.split("/")
+    return {"installation": {"id": installation}, "repository": {"owner": {"login": owner}, "name": name}}
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def test_hash_ring_moves_only_the_keys_of_a_changed_node():
+    keys = [f"1/org/repo-{i}" for i in range(500)]
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+    assert all(after.node_for(k) == "d" for k in moved)
+    assert 50 < len(moved) < 200
+    assert HashRing([]).node_for("1/org/repo") is None
+
+
+def test_hash_ring_ranges_cover_the_keys_of_a_node():
+    ring = HashRing(["a", "b", "c"])
+
+    for i in range(200):
+        key = f"1/org/repo-{i}"
+        value = _hash(key)
+        owners = [node for node in "abc" if any((low is None or value >= low) and (high is None or value < high)
+                                              for low, high in ring.ranges_for(node))]
+        assert owners == [ring.node_for(key)]
+
+
+def test_jobs_are_leased_by_the_node_owning_the_repository(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.heartbeat("a")
+    queue.heartbeat("b")
+    ring = HashRing(["a", "b"])
+    repos = [f"org/repo-{i}" for i in range(20)]
+    for repo in repos:
+        queue.enqueue("pull_request", payload(repo))
+
+    leased_a = queue.lease("a", limit=100)
+    leased_b = queue.lease("b", limit=100)
+
+    assert {job.key for job in leased_a} == {shard_key(payload(r)) for r in repos if ring.node_for(shard_key(payload(r))) == "a"}
+    assert len(leased_a) + len(leased_b) == 20
+    assert queue.lease("a", limit=100) == []
+
+
+def test_jobs_of_other_nodes_do_not_starve_the_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.job_queue.LEASE_SCAN_LIMIT", 5)
+    queue = make_queue(tmp_path)
+    queue.heartbeat("a")
+    queue.heartbeat("b")
+    ring = HashRing(["a", "b"])
+    repos = [f"org/repo-{i}" for i in range(40)]
+    for repo in sorted(repos, key=lambda r: ring.node_for(shard_key(payload(r))) == "a"):
+        queue.enqueue("pull_request", payload(repo))
+
+    leased = queue.lease("a", limit=1)
+
+    assert [ring.node_for(job.key) for job in leased] == ["a"]
+
+
+def test_expired_leases_are_retried_and_fail_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.05, max_attempts=2)
+    queue.heartbeat("a")
+    job_id = queue.enqueue("pull_request", payload("org/repo"))
+
+    assert [job.attempts for job in queue.lease("a")] == [1]
+    assert queue.renew(job_id, "a")
+    assert not queue.renew(job_id, "b")
+    time.sleep(0.06)
+    assert [job.attempts for job in queue.lease("a")] == [2]
+    time.sleep(0.06)
+    assert queue.lease("a") == []
+    assert queue.counts() == {"failed": 1}
+
+
+def test_jobs_move_when_a_node_leaves(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.heartbeat("a")
+    queue.heartbeat("b")
+    for i in range(20):
+        queue.enqueue("pull_request", payload(f"org/repo-{i}"))
+    assert len(queue.lease("a", limit=100)) < 20
+
+    queue.leave("b")
+
+    assert len(queue.lease("a", limit=100)) > 0
+    assert queue.counts() == {"leased": 20}
+
+
+def test_queue_worker_runs_and_completes_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    done = []
+    worker = QueueWorker(queue, lambda job: done.append(job.key), node_id="a", poll_interval=0.01)
+    for i in range(3):
+        queue.enqueue("pull_request", payload(f"org/repo-{i}"))
+    queue.enqueue("pull_request", payload("org/broken"), key="broken")
+    original = worker.handler
+    worker.handler = lambda job: (_ for _ in ()).throw(RuntimeError("boom")) if job.key == "broken" else original(job)
+
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    deadline = time.time() + 5
+    while queue.counts().get("done", 0) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    thread.join()
+
+    assert sorted(done) == [f"1/org/repo-{i}" for i in range(3)]
+    assert queue.counts()["done"] == 3
+    assert queue.live_nodes() == []
+
+
+def test_progress_survives_retries_and_finished_jobs_are_pruned(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.05)
+    queue.heartbeat("a")
+    queue.enqueue("pull_request", payload("org/repo"))
+    [job] = queue.lease("a")
+    job.progress["tests"] = True
+    assert queue.save_progress(job)
+    queue.fail(job.id, "a", "boom")
+
+    [retry] = queue.lease("a")
+    assert retry.progress == {"tests": True}
+    queue.complete(retry.id, "a")
+    assert queue.prune(retention_seconds=60) == 0
+    assert queue.prune(retention_seconds=0) == 1
+    assert queue.counts() == {}
+
+
+def test_retries_of_a_failed_review_do_not_generate_tests_again(tmp_path, monkeypatch):
+    from webhook import job_worker
+    queue = make_queue(tmp_path, visibility_timeout=0.05)
+    monkeypatch.setattr(job_worker, "get_job_queue", lambda: queue)
+    runs = []
+
+    class FailingReview:
+        def __init__(self, payload, generate_tests):
+            runs.append(generate_tests)
+
+        def run(self):
+            return False, True, None
+
+    monkeypatch.setattr(job_worker, "PRPipeline", FailingReview)
+    queue.heartbeat("a")
+    queue.enqueue("pull_request", {**payload("org/repo"), "action": "opened"})
+
+    for _ in range(2):
+        [job] = queue.lease("a")
+        try:
+            job_worker.handle_job(job)
+        except RuntimeError:
+            queue.fail(job.id, "a", "PR review failed")
+
+    assert runs == [True, False]
@@ -0,0 +1,75 @@
+import asyncio
+import time
+import pytest
+from langchain.schema import HumanMessage, SystemMessage
+from utils.llm_backends import create_llm, available_backends, register_backend, CassetteMissError, FakeBackend
+from utils.llm_utils import LLMHandler
+from prompts.review_prompt import CodeReviewOutput, CodeReviewInput, CodeReviewPrompt, FileChangePrompt
+from prompts.test_gating_prompt import testGatingOutput
+from prompts.test_case_update_prompt import testUpdateOutput
+from prompts.fix_test_prompt import FixTestOutput
+
+
+def review_messages():
+    prompt = "Changed Files:\n## pkg/a.py (status: modified)\n--- patch\n+x\n\n## pkg/b.py (status: added)\n--- patch\n+y"
+    return [SystemMessage(content="You are a helpful assistant."), HumanMessage(content=prompt)]
+
+
+def test_builtin_backends_are_registered():
+    assert {"ChatOpenAI", "recording", "replay", "fake"} <= set(available_backends())
+    with pytest.raises(ValueError):
+        create_llm("missing", {})
+
+
+@pytest.mark.parametrize("output_model", [CodeReviewOutput, testGatingOutput, testUpdateOutput, FixTestOutput])
+def test_fake_backend_fills_every_output_model(output_model):
+    llm = create_llm("fake", {})
+
+    response = llm.with_structured_output(output_model).invoke(review_messages())
+
+    assert isinstance(response, output_model)
+
+
+def test_fake_backend_analyses_each_changed_file():
+    llm = create_llm("fake", {"overrides": {"summary": "All good"}})
+
+    response = llm.with_structured_output(CodeReviewOutput).invoke(review_messages())
+
+    assert response.summary == "All good"
+    assert [a.file_path for a in response.file_analyses] == ["pkg/a.py", "pkg/b.py"]
+
+
+def test_record_then_replay(tmp_path):
+    cassette_dir = str(tmp_path / "cassettes")
+    recorder = create_llm("recording", {"inner_backend": "fake", "cassette_dir": cassette_dir})
+    recorded = recorder.with_structured_output(testGatingOutput).invoke(review_messages())
+
+    replay = create_llm("replay", {"cassette_dir": cassette_dir, "latency_ms": 50})
+    start = time.perf_counter()
+    replayed = replay.with_structured_output(testGatingOutput).invoke(review_messages())
+
+    assert replayed == recorded
+    assert time.perf_counter() - start >= 0.05
+    assert asyncio.run(replay.with_structured_output(testGatingOutput).ainvoke(review_messages())) == recorded
+    with pytest.raises(CassetteMissError):
+        replay.with_structured_output(testGatingOutput).invoke([HumanMessage(content="other")])
+
+
+def test_handler_runs_offline_with_fake_backend():
+    handler = LLMHandler(llm_type="fake", model_config={"model": "gpt-4o-mini"})
+    handler.set_task_config("review", prompt_template=CodeReviewPrompt, input_model=CodeReviewInput, output_model=CodeReviewOutput)
+    changed = [FileChangePrompt(filename="pkg/a.py", patch="+x", status="modified", content=None)]
+
+    response = handler.generate_response("review", title="T", commits=["c"], changed_files=changed)
+
+    assert [a.file_path for a in response.file_analyses] == ["pkg/a.py"]
+
+
+def test_custom_backend_registration():
+    @register_backend("constant")
+    class ConstantBackend(FakeBackend):
+        def fill(self, schema, messages):
+            return {"fixed_content": "constant"}
+
+    llm = create_llm("constant", {})
+    assert llm.with_structured_output(FixTestOutput).invoke(review_messages()).fixed_content == "constant"
@@ -0,0 +1,91 @@
+import pytest
+from unittest.mock import MagicMock
+from pydantic import BaseModel
+from langchain.schema import HumanMessage, SystemMessage
+from utils import metrics
+from utils.llm_cache import LLMResponseCache, make_cache_key, canonicalize_messages
+from utils.llm_utils import LLMHandler
+
+
+class EchoInput(BaseModel):
+    text: str
+
+
+class EchoOutput(BaseModel):
+    text: str
+
+
+@pytest.fixture
+def cache(tmp_path):
+    metrics.reset()
+    return LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_entries=2)
+
+
+@pytest.fixture
+def handler(cache):
+    llm = MagicMock()
+    llm.with_structured_output.return_value.invoke.return_value = EchoOutput(text="hi")
+    handler = LLMHandler(model_config={"model": "gpt-4o-mini"}, llm=llm, response_cache=cache)
+    handler.set_task_config("echo", prompt_template="Say {text}", input_model=EchoInput, output_model=EchoOutput)
+    return handler
+
+
+def test_canonicalize_messages_ignores_whitespace_noise():
+    a = [SystemMessage(content="sys"), HumanMessage(content="line one  \r\nline two\n")]
+    b = [SystemMessage(content="sys"), HumanMessage(content="line one\nline two")]
+    assert canonicalize_messages(a) == canonicalize_messages(b)
+
+
+def test_cache_key_depends_on_task_backend_model_and_schema():
+    messages = [HumanMessage(content="hello")]
+    key = make_cache_key("review", "ChatOpenAI", "gpt-4o-mini", "v1", messages)
+    assert key == make_cache_key("review", "ChatOpenAI", "gpt-4o-mini", "v1", messages)
+    assert key != make_cache_key("gating", "ChatOpenAI", "gpt-4o-mini", "v1", messages)
+    assert key != make_cache_key("review", "fake", "gpt-4o-mini", "v1", messages)
+    assert key != make_cache_key("review", "ChatOpenAI", "gpt-4o", "v1", messages)
+    assert key != make_cache_key("review", "ChatOpenAI", "gpt-4o-mini", "v2", messages)
+
+
+def test_identical_requests_are_served_from_cache(handler, cache):
+    first = handler.generate_response("echo", text="hi")
+    second = handler.generate_response("echo", text="hi")
+
+    assert first == second == EchoOutput(text="hi")
+    assert handler.llm.with_structured_output.return_value.invoke.call_count == 1
+    assert cache.stats("echo") == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+
+def test_local_backend_responses_are_not_served_to_real_backend(handler, cache):
+    fake_llm = MagicMock()
+    fake_llm.with_structured_output.return_value.invoke.return_value = EchoOutput(text="fake")
+    fake = LLMHandler(llm_type="fake", model_config={"model": "gpt-4o-mini"}, llm=fake_llm, response_cache=cache)
+    fake.set_task_config("echo", prompt_template="Say {text}", input_model=EchoInput, output_model=EchoOutput)
+
+    assert fake.generate_response("echo", text="hi") == EchoOutput(text="fake")
+    assert handler.generate_response("echo", text="hi") == EchoOutput(text="hi")
+
+def test_bypassed_task_always_calls_llm(handler, cache):
+    cache.bypass("echo")
+    handler.generate_response("echo", text="hi")
+    handler.generate_response("echo", text="hi")
+
+    assert handler.llm.with_structured_output.return_value.invoke.call_count == 2
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("echo", "key", EchoOutput(text="old"), EchoOutput)
+    cache.ttl_seconds = -1
+    assert cache.get("echo", "key", EchoOutput) is None
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.set("echo", "a", EchoOutput(text="a"), EchoOutput)
+    cache.set("echo", "b", EchoOutput(text="b"), EchoOutput)
+    cache.get("echo", "a", EchoOutput)
+    cache.set("echo", "c", EchoOutput(text="c"), EchoOutput)
+
+    assert len(cache) == 2
+    assert cache.get("echo", "b", EchoOutput) is None
+    assert cache.get("echo", "a", EchoOutput).text == "a"
@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import MagicMock
+from pydantic import BaseModel
+from utils import llm_registry
+
+
+class EchoInput(BaseModel):
+    text: str
+
+
+class EchoOutput(BaseModel):
+    text: str
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch):
+    monkeypatch.setattr(llm_registry, "get_response_cache", lambda: None)
+    llm_registry.clear_registry()
+    yield
+    llm_registry.clear_registry()
+
+
+def test_get_llm_handler_is_pooled():
+    config = {"model": "gpt-4o-mini", "api_key": "test-key"}
+    first = llm_registry.get_llm_handler(model_config=config)
+    second = llm_registry.get_llm_handler(model_config=dict(config))
+    other = llm_registry.get_llm_handler(model_config={"model": "gpt-4o", "api_key": "test-key"})
+
+    assert first is second
+    assert first is not other
+
+
+def test_pooled_handlers_share_http_client():
+    first = llm_registry.get_llm_handler(model_config={"model": "gpt-4o-mini", "api_key": "test-key"})
+    second = llm_registry.get_llm_handler(model_config={"model": "gpt-4o", "api_key": "test-key"})
+    http_client, _ = llm_registry.get_http_clients()
+
+    assert first.model_config["http_client"] is http_client
+    assert second.model_config["http_client"] is http_client
+
+
+def test_registered_task_is_shared_and_bound_once():
+    llm_registry.register_task("echo", prompt_template="Say {text}", input_model=EchoInput, output_model=EchoOutput)
+    handler = llm_registry.get_llm_handler(model_config={"model": "gpt-4o-mini", "api_key": "test-key"})
+    handler.llm = MagicMock()
+    handler.llm.with_structured_output.return_value.invoke.return_value = EchoOutput(text="hi")
+
+    handler.generate_response("echo", text="hi")
+    response = handler.generate_response("echo", text="hi")
+
+    assert response.text == "hi"
+    assert llm_registry.get_task_config("echo")["prompt"].input_variables == ["text"]
+    handler.llm.with_structured_output.assert_called_once_with(EchoOutput, include_raw=True)
+    assert handler.llm.with_structured_output.return_value.invoke.call_count == 2
+
+
+def test_clear_registry_closes_both_http_clients():
+    sync_client, async_client = llm_registry.get_http_clients()
+
+    llm_registry.clear_registry()
+
+    assert sync_client.is_closed and async_client.is_closed
+    assert llm_registry.get_http_clients()[1] is not async_client
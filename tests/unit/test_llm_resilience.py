@@ -0,0 +1,112 @@
+import asyncio
+import time
+import pytest
+from utils import metrics
+from utils.llm_resilience import (CircuitBreaker, CircuitOpenError, DeadlineExceeded, LatencyTracker,
+                                  ResilientCaller, RetryPolicy, TaskPolicy)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def make_caller(**policy_kwargs):
+    policy = TaskPolicy(retry=RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01), **policy_kwargs)
+    return ResilientCaller("test", policies={"task": policy}, seed=0)
+
+
+def test_retries_retryable_errors():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimitError("slow down")
+        return "ok"
+
+    assert make_caller().call("task", fn) == "ok"
+    assert len(calls) == 3
+    assert metrics.get_counter("llm_retries_total", task="task") == 2
+
+
+def test_does_not_retry_other_errors():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad output")
+
+    caller = make_caller()
+    with pytest.raises(ValueError):
+        caller.call("task", fn)
+    assert len(calls) == 1
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_exceeded():
+    caller = make_caller(deadline=0.05)
+    with pytest.raises(DeadlineExceeded):
+        caller.call("task", lambda: time.sleep(0.5))
+    assert metrics.get_counter("llm_deadline_exceeded_total", task="task") == 1
+
+
+def test_circuit_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_hedges_slow_calls():
+    tracker = LatencyTracker(min_samples=3)
+    for _ in range(3):
+        tracker.record("task", 0.01)
+    caller = ResilientCaller("test", policies={"task": TaskPolicy(deadline=5, hedge=True)}, tracker=tracker)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    assert caller.call("task", fn) == "fast"
+    assert metrics.get_counter("llm_hedged_requests_total", task="task") == 1
+    assert metrics.get_counter("llm_hedge_wins_total", task="task") == 1
+
+
+def test_async_retries_and_deadline():
+    caller = make_caller(deadline=0.2)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert asyncio.run(caller.acall("task", flaky)) == "ok"
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(caller.acall("task", hang))
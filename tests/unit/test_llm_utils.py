@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from pydantic import BaseModel
+from typing import List
+from utils.llm_utils import LLMHandler
+
+
+class ReviewInput(BaseModel):
+    title: str
+
+
+class ReviewOutput(BaseModel):
+    summary: str
+    notes: List[str]
+
+
+PARTIALS = [{"summary": "Sho"}, {"summary": "Short"}, {"summary": "Short", "notes": ["a"]}]
+
+
+@pytest.fixture
+def handler():
+    llm = MagicMock()
+    handler = LLMHandler(model_config={"model": "gpt-4o-mini"}, llm=llm)
+    handler.set_task_config("review", prompt_template="Review {title}", input_model=ReviewInput, output_model=ReviewOutput)
+    return handler
+
+
+def test_generate_response_validates_input(handler):
+    with pytest.raises(ValueError):
+        handler.generate_response("review", title=None)
+    with pytest.raises(ValueError):
+        handler.generate_response("unknown", title="x")
+
+
+def test_stream_response_reports_partials(handler):
+    handler.llm.with_structured_output.return_value.stream.return_value = iter(PARTIALS)
+    partials = []
+
+    response = handler.stream_response("review", partials.append, title="PR")
+
+    assert partials == PARTIALS
+    assert response == ReviewOutput(summary="Short", notes=["a"])
+    handler.llm.with_structured_output.assert_called_once_with(ReviewOutput.model_json_schema())
+
+
+def test_astream_response_reports_partials(handler):
+    async def astream(messages):
+        for partial in PARTIALS:
+            yield partial
+
+    handler.llm.with_structured_output.return_value.astream = astream
+    partials = []
+
+    response = asyncio.run(handler.astream_response("review", partials.append, title="PR"))
+
+    assert len(partials) == 3
+    assert response.notes == ["a"]
+
+
+def test_agenerate_response(handler):
+    async def ainvoke(messages):
+        assert messages[-1].content == "Review PR"
+        return ReviewOutput(summary="s", notes=[])
+
+    handler.llm.with_structured_output.return_value.ainvoke = ainvoke
+
+    assert asyncio.run(handler.agenerate_response("review", title="PR")).summary == "s"
+
+
+
+def test_usage_metadata_is_recorded(handler):
+    from types import SimpleNamespace
+    from utils import metrics
+    metrics.reset()
+    raw = SimpleNamespace(usage_metadata={"input_tokens": 120, "output_tokens": 30})
+    parsed = ReviewOutput(summary="s", notes=[])
+    handler.llm.with_structured_output.return_value.invoke.return_value = {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+    assert handler.generate_response("review", title="x") == parsed
+    assert metrics.get_counter("llm_prompt_tokens_total", task="review", model="gpt-4o-mini") == 120
+    assert metrics.get_counter("llm_completion_tokens_total", task="review", model="gpt-4o-mini") == 30
+    assert metrics.get_histogram("llm_request_seconds", task="review", model="gpt-4o-mini", outcome="ok")["count"] == 1
@@ -1,5 +1,11 @@
+import io
+import json
+import logging
+import queue
 import pytest
 from utils.logging_utils import log_info, log_debug, log_error
+from utils.logging_utils import (ContextFilter, JsonFormatter, NonBlockingQueueHandler, RateLimitFilter,
+                                 log_context, truncate)
 
 class MockLogging:
     def info(self, message):
@@ -9,22 +15,79 @@ class MockLogging:
     def error(self, message):
         print(f"ERROR: {message}")
 
-@pytest.fixture(autouse=True)
+@pytest.fixture
 def mock_logging(mocker):
     mocker.patch('utils.logging_utils.logging', new=MockLogging())
 
+@pytest.mark.usefixtures("mock_logging")
 def test_log_info():
     log_info('This is an info message')  # Should output to the console
 
 
+@pytest.mark.usefixtures("mock_logging")
 def test_log_debug():
     log_debug('This is a debug message')  # Should output to the console
 
 
+@pytest.mark.usefixtures("mock_logging")
 def test_log_error():
     log_error('This is an error message', Exception('Test Exception'))  # Should output to the console
 
 
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("pr_agent", level, __file__, 1, msg, args, None)
+
+
+def test_truncate():
+    assert truncate("short", 10) == "short"
+    assert truncate("x" * 25, 10) == "x" * 10 + "... [truncated 15 chars]"
+
+
+def test_json_records_carry_the_logging_context():
+    record = make_record("Reviewed %d files", 3)
+    with log_context(repo="owner/repo", pr=7):
+        with log_context(stage="review"):
+            ContextFilter().filter(record)
+    data = json.loads(JsonFormatter().format(record))
+    assert data["message"] == "Reviewed 3 files"
+    assert data["level"] == "INFO"
+    assert (data["repo"], data["pr"], data["stage"]) == ("owner/repo", 7, "review")
+
+
+def test_rate_limit_samples_noisy_messages():
+    rate_limit = RateLimitFilter(limit=2, window=60)
+    passed = [rate_limit.filter(make_record("Retrying %s", i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_limit.filter(make_record("Retrying %s", 0, level=logging.ERROR))
+
+    rate_limit.window = 0
+    record = make_record("Retrying %s", 5)
+    assert rate_limit.filter(record)
+    assert record.suppressed == 3
+
+
+def test_queue_handler_truncates_and_never_blocks():
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue, max_message_chars=8)
+    handler.handle(make_record("%s", "y" * 20))
+    handler.handle(make_record("dropped"))
+
+    assert log_queue.get_nowait().getMessage() == "y" * 8 + "... [truncated 12 chars]"
+    assert handler.dropped == 1
+
+
+def test_formatting_is_lazy():
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted a disabled record")
+
+    logger = logging.getLogger("pr_agent.lazy")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    logger.propagate = False
+    logger.debug("Proposal: %s", Expensive())
+
+
 # Run the tests with:
 # pytest tests/unit/test_logging_utils.py
 
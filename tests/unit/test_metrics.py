@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_rendering():
+    metrics.observe("request_seconds", 0.3, buckets=(0.1, 0.5, 1), call="get_repo")
+    metrics.observe("request_seconds", 2, buckets=(0.1, 0.5, 1), call="get_repo")
+    metrics.increment("requests_total", call='say "hi"')
+
+    text = metrics.render_prometheus()
+
+    assert '# TYPE requests_total counter\nrequests_total{call="say \\"hi\\""} 1\n' in text
+    assert "# TYPE request_seconds histogram" in text
+    assert 'request_seconds_bucket{call="get_repo",le="0.1"} 0' in text
+    assert 'request_seconds_bucket{call="get_repo",le="0.5"} 1' in text
+    assert 'request_seconds_bucket{call="get_repo",le="1"} 1' in text
+    assert 'request_seconds_bucket{call="get_repo",le="+Inf"} 2' in text
+    assert 'request_seconds_sum{call="get_repo"} 2.3' in text
+    assert 'request_seconds_count{call="get_repo"} 2' in text
+
+
+def test_timed_records_outcome():
+    @metrics.timed("stage_seconds", stage="ok")
+    def works():
+        return 1
+
+    @metrics.timed("stage_seconds", stage="fails")
+    async def fails():
+        raise RuntimeError("boom")
+
+    assert works() == 1
+    with pytest.raises(RuntimeError):
+        asyncio.run(fails())
+
+    assert metrics.get_histogram("stage_seconds", stage="ok", outcome="ok")["count"] == 1
+    assert metrics.get_histogram("stage_seconds", stage="fails", outcome="error")["count"] == 1
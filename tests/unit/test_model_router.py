@@ -0,0 +1,67 @@
+import json
+from pydantic import BaseModel
+from utils import metrics
+from utils.model_router import ModelRouter, count_input_tokens, repo_context
+
+
+class Record(BaseModel):
+    filename: str
+    patch: str
+
+
+def test_gating_routes_by_size():
+    router = ModelRouter()
+    assert router.route("test_gating", 500, files=2).model == "gpt-4.1-nano"
+    assert router.route("test_gating", 500, files=10).model == "gpt-4o-mini"
+    assert router.route("test_gating", 500000, files=10).model == "gpt-4.1-mini"
+
+
+
+def test_oversized_review_shards_get_the_larger_context_window():
+    router = ModelRouter()
+    assert router.route("review_shard", 16000, files=5).model == "gpt-4o-mini"
+    assert router.route("review_shard", 150000, files=1).model == "gpt-4.1-mini"
+    assert router.route("review_reduce", 150000, files=400).model == "gpt-4.1-mini"
+
+def test_fix_retries_escalate():
+    router = ModelRouter()
+    assert router.route("fix_test", 100, attempt=1).model == "gpt-4o-mini"
+    assert router.route("fix_test", 100, attempt=2).model == "gpt-4o"
+
+
+def test_unknown_task_uses_default_model():
+    route = ModelRouter(default_model="base").route("other", 10)
+    assert route.model == "base"
+    assert route.reason == "no matching rule"
+
+
+def test_repo_rules_override_defaults(tmp_path):
+    path = tmp_path / "routing.json"
+    path.write_text(json.dumps({"repos": {"acme/app": {"summarize_pr": [{"model": "big", "model_config": {"temperature": 0}}]}}}))
+    router = ModelRouter.from_file(str(path))
+
+    assert router.route("summarize_pr", 10).model == "gpt-4o-mini"
+    with repo_context("acme/app"):
+        route = router.route("summarize_pr", 10)
+    assert route.model_config == {"temperature": 0, "model": "big"}
+
+
+def test_invalid_config_falls_back_to_defaults(tmp_path):
+    path = tmp_path / "routing.json"
+    path.write_text("{not json")
+    assert ModelRouter.from_file(str(path)).route("fix_test", 10).model == "gpt-4o-mini"
+
+
+def test_track_does_not_duplicate_the_llm_metrics():
+    route = ModelRouter().route("review_reduce", 42)
+    metrics.reset()
+    with route.track() as result:
+        result["response"] = Record(filename="a.py", patch="x")
+
+    # llm_utils records the latency and tokens of the call itself
+    assert metrics.snapshot() == {}
+
+
+def test_count_input_tokens():
+    assert count_input_tokens([Record(filename="a.py", patch="")], None) > 0
+    assert count_input_tokens(["abcd" * 10]) > 0
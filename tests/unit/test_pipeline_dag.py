@@ -0,0 +1,84 @@
+import asyncio
+import time
+import pytest
+from utils.pipeline_dag import DAGExecutor, Stage, STATUS_OK, STATUS_SKIPPED, STATUS_TIMEOUT, STATUS_FAILED
+
+
+def sleeper(seconds, value=None):
+    async def stage(inputs):
+        await asyncio.sleep(seconds)
+        return value if value is not None else inputs
+    return stage
+
+
+def test_independent_stages_overlap():
+    executor = DAGExecutor([
+        Stage("snapshot", sleeper(0.05, "files")),
+        Stage("review", sleeper(0.2, "review"), deps=("snapshot",)),
+        Stage("gate", sleeper(0.2, "gate"), deps=("snapshot",)),
+        Stage("report", lambda inputs: sorted(inputs), deps=("review", "gate")),
+    ])
+
+    start = time.perf_counter()
+    report = executor.run_sync()
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.4
+    assert report.value("report") == ["gate", "review"]
+    assert all(r.status == STATUS_OK for r in report.results.values())
+
+
+def test_critical_path_follows_slowest_dependency():
+    executor = DAGExecutor([
+        Stage("snapshot", sleeper(0.01, "files")),
+        Stage("tests", sleeper(0.1, "tests")),
+        Stage("review", sleeper(0.02, "review"), deps=("snapshot",)),
+        Stage("gate", sleeper(0.01, "gate"), deps=("snapshot", "tests")),
+    ])
+
+    report = executor.run_sync()
+
+    assert report.critical_path == ["tests", "gate"]
+    assert report.format_critical_path().startswith("tests (")
+
+
+def test_timeout_and_failure_skip_dependents():
+    def broken(inputs):
+        raise RuntimeError("boom")
+
+    executor = DAGExecutor([
+        Stage("slow", sleeper(1, "slow"), timeout=0.05),
+        Stage("broken", broken),
+        Stage("after_slow", sleeper(0, "x"), deps=("slow",)),
+        Stage("after_broken", sleeper(0, "x"), deps=("broken",)),
+        Stage("report", lambda inputs: sorted(inputs), deps=("slow", "after_broken"), always_run=True),
+    ])
+
+    report = executor.run_sync()
+
+    assert report.results["slow"].status == STATUS_TIMEOUT
+    assert report.results["broken"].status == STATUS_FAILED
+    assert report.results["after_slow"].status == STATUS_SKIPPED
+    assert report.results["after_broken"].status == STATUS_SKIPPED
+    assert report.value("report") == []
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        DAGExecutor([Stage("a", sleeper(0), deps=("missing",))])
+    with pytest.raises(ValueError):
+        DAGExecutor([Stage("a", sleeper(0), deps=("b",)), Stage("b", sleeper(0), deps=("a",))])
+
+
+def test_timeout_bounds_sync_stages():
+    executor = DAGExecutor([
+        Stage("blocking", lambda inputs: time.sleep(2), timeout=0.1),
+        Stage("report", lambda inputs: sorted(inputs), deps=("blocking",), always_run=True),
+    ])
+
+    start = time.perf_counter()
+    report = executor.run_sync()
+
+    assert time.perf_counter() - start < 1
+    assert report.results["blocking"].status == STATUS_TIMEOUT
+    assert report.value("report") == []
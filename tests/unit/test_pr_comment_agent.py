@@ -1,6 +1,7 @@
 import pytest
 from agents.pr_base_agent import PRCommentAgent
 from utils.github_utils import Github
+from prompts.review_prompt import CodeReviewOutput
 
 @pytest.fixture
 def mock_github_client(mocker):
@@ -22,7 +23,7 @@ def test_analyze_code(comment_agent):
     response = comment_agent.analyze_code(title, updated_files, commit_messages)
 
     assert response is not None
-    assert isinstance(response, dict)
+    assert isinstance(response, CodeReviewOutput)
 
 
 def test_handle_pull_request_opened(comment_agent, mock_github_client):
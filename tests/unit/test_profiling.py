@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import time
+import pytest
+from utils import profiling
+from utils.shared_store import SharedStore
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setattr(profiling, "get_shared_store", lambda: store)
+    return store
+
+
+def busy_work():
+    deadline = time.perf_counter() + 0.05
+    values = []
+    while time.perf_counter() < deadline:
+        values.append(sum(range(100)))
+    return values
+
+
+def test_runs_are_not_profiled_without_a_request(tmp_path):
+    directory = tmp_path / "profiles"
+    with profiling.profile_run("owner/repo", 1, directory=str(directory)) as profile_request:
+        assert profile_request is None
+    assert not directory.exists()
+
+
+def test_requests_match_repo_and_pr_for_the_next_runs():
+    profiling.request_profile(repo="owner/repo", pr=7, runs=2)
+
+    assert profiling.claim("owner/other", 7) is None
+    assert profiling.claim("owner/repo", 8) is None
+    assert profiling.claim("owner/repo", 7).runs == 1
+    assert profiling.claim("owner/repo", 7).runs == 0
+    assert profiling.claim("owner/repo", 7) is None
+    assert profiling.pending_requests() == []
+
+
+def _claim(results):
+    results.put(profiling.claim("owner/repo", 7) is not None)
+
+
+def test_requests_are_shared_by_worker_processes():
+    profiling.request_profile(repo="owner/repo", runs=2)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_claim, args=(results,)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(results.get() for _ in workers) == [False, True, True]
+    assert profiling.pending_requests() == []
+
+
+def test_invalid_requests_are_rejected():
+    with pytest.raises(ValueError):
+        profiling.request_profile(mode="perf")
+    with pytest.raises(ValueError):
+        profiling.request_profile(runs=0)
+
+
+@pytest.mark.parametrize("mode, artifact", [(profiling.MODE_CPROFILE, "profile.pstats"), (profiling.MODE_SAMPLING, "stacks.txt")])
+def test_profiled_runs_write_artifacts(tmp_path, mode, artifact):
+    directory = str(tmp_path / "profiles")
+    profiling.request_profile(repo="owner/repo", mode=mode, memory=True)
+
+    with profiling.profile_run("owner/repo", 3, directory=directory) as profile_request:
+        assert profile_request.mode == mode
+        busy_work()
+
+    [meta] = profiling.list_artifacts(directory)
+    assert (meta["repo"], meta["pr"], meta["mode"]) == ("owner/repo", 3, mode)
+    files = os.listdir(meta["path"])
+    assert artifact in files and "memory.txt" in files
+    if mode == profiling.MODE_SAMPLING:
+        with open(os.path.join(meta["path"], artifact)) as f:
+            assert "busy_work" in f.read()
+
+
+def test_retention_keeps_the_newest_runs(tmp_path):
+    directory = tmp_path / "profiles"
+    for name in ("20260101T000000-a", "20260102T000000-b", "20260103T000000-c"):
+        os.makedirs(directory / name)
+
+    profiling.enforce_retention(str(directory), keep=2)
+
+    assert sorted(os.listdir(directory)) == ["20260102T000000-b", "20260103T000000-c"]
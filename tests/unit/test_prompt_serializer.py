@@ -0,0 +1,48 @@
+import pytest
+from typing import List, Optional
+from pydantic import BaseModel
+from utils.prompt_serializer import CompiledTemplate, serialize_value, serialize_input
+
+
+class FileChangePrompt(BaseModel):
+    filename: str
+    patch: str
+    status: str
+    content: Optional[str]
+
+
+class PromptInput(BaseModel):
+    title: str
+    commits: List[str]
+    changed_files: List[FileChangePrompt]
+
+
+def test_compiled_template_renders_fields():
+    template = CompiledTemplate("Title: {title}\n{{literal}}\nCommits:\n{commits}\n{title}")
+
+    assert template.input_variables == ["title", "commits"]
+    assert template.render(title="T", commits="- a") == "Title: T\n{literal}\nCommits:\n- a\nT"
+    with pytest.raises(KeyError):
+        template.render(title="T")
+
+
+def test_compiled_template_rejects_format_specs():
+    with pytest.raises(ValueError):
+        CompiledTemplate("{value:>10}")
+
+
+def test_changed_files_are_rendered_raw():
+    change = FileChangePrompt(filename="pkg/a.py", patch="@@ -1 +1 @@\n-a\n+b", status="modified", content=None)
+
+    text = serialize_value([change, change])
+
+    assert text == ("## pkg/a.py (status: modified)\n--- patch\n@@ -1 +1 @@\n-a\n+b\n\n"
+                    "## pkg/a.py (status: modified)\n--- patch\n@@ -1 +1 @@\n-a\n+b")
+    assert "\\n" not in text
+
+
+def test_serialize_input_is_deterministic():
+    data = PromptInput(title="T", commits=["one", "two"], changed_files=[])
+
+    assert serialize_input(data) == {"title": "T", "commits": "- one\n- two", "changed_files": "(none)"}
+    assert serialize_input(data) == serialize_input(PromptInput(**data.model_dump()))
@@ -0,0 +1,68 @@
+from utils import relevance_index
+from utils.relevance_index import RelevanceIndex, load_test_index, split_identifier
+
+TESTS = {
+    "tests/unit/test_file_utils.py": ("1", "from utils.file_utils import update_file\n\ndef test_update_file_excludes_large():\n    pass\n"),
+    "tests/unit/test_github_utils.py": ("2", "from utils.github_utils import post_comment\n\ndef test_post_comment():\n    pass\n"),
+    "tests/unit/test_example.py": ("3", "def test_addition():\n    assert 1 + 1 == 2\n"),
+}
+
+
+def changed(filename, patch="+x = 1"):
+    return {"filename": filename, "patch": patch}
+
+
+def build_index(tests=TESTS, index=None):
+    index = index or RelevanceIndex()
+    fetched = index.update("c1", {path: sha for path, (sha, _) in tests.items()}, lambda path, sha: tests[path][1])
+    return index, fetched
+
+
+def test_split_identifier():
+    assert split_identifier("getFileContent") == ["getfilecontent", "get", "file", "content"]
+    assert split_identifier("update_file") == ["update_file", "update", "file"]
+    assert split_identifier("self") == []
+
+
+def test_top_k_ranks_tests_of_changed_modules():
+    index, _ = build_index()
+
+    tests = index.top_k([changed("utils/file_utils.py", "+def update_file(file):")], k=2)
+
+    assert tests[0]["filename"] == "tests/unit/test_file_utils.py"
+    assert "tests/unit/test_example.py" not in [t["filename"] for t in tests]
+
+
+def test_unrelated_change_returns_nothing():
+    index, _ = build_index()
+    assert index.top_k([changed("docs/readme.md", "+zzz")]) == []
+
+
+def test_update_only_fetches_changed_blobs():
+    index, fetched = build_index()
+    assert fetched == 3
+
+    tests = {**TESTS, "tests/unit/test_example.py": ("4", "def test_subtraction():\n    pass\n")}
+    del tests["tests/unit/test_github_utils.py"]
+    _, fetched = build_index(tests, index)
+
+    assert fetched == 1
+    assert sorted(index.tests) == ["tests/unit/test_example.py", "tests/unit/test_file_utils.py"]
+
+
+def test_index_is_cached_per_commit(tmp_path, monkeypatch):
+    monkeypatch.setattr(relevance_index, "TEST_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(relevance_index, "_indexes", {})
+    blobs = {path: sha for path, (sha, _) in TESTS.items()}
+    listed = []
+
+    def list_blobs():
+        listed.append(1)
+        return blobs
+
+    load_test_index("acme/app", "c1", list_blobs, lambda path, sha: TESTS[path][1])
+    monkeypatch.setattr(relevance_index, "_indexes", {})
+    index = load_test_index("acme/app", "c1", list_blobs, lambda path, sha: None)
+
+    assert len(listed) == 1
+    assert len(index.tests) == 3
@@ -0,0 +1,129 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from prompts import review_prompt
+from prompts.review_prompt import (Analysis, CodeReviewOutput, FileChangePrompt, LineComment, ReviewReduceOutput,
+                                   ShardReviewOutput, dedupe_suggestions, generate_review_response, shard_files,
+                                   agenerate_review_response)
+
+
+def make_file(filename, size=10):
+    return {"filename": filename, "patch": "+x\n" * size, "status": "modified", "excluded": False, "content": None}
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    handler = MagicMock()
+    monkeypatch.setattr(review_prompt, "get_llm_handler", lambda **kwargs: handler)
+    return handler
+
+
+def shard_response(task_name, changed_files=None, **kwargs):
+    if task_name == "review_shard":
+        return ShardReviewOutput(file_analyses=[Analysis(file_path=f.filename, analysis="ok") for f in changed_files],
+                                 suggestions=["Add tests.", "add tests"])
+    return ReviewReduceOutput(summary="Combined summary", suggestions=["Add tests", "Document the API"])
+
+
+def test_small_pr_uses_single_call(handler):
+    handler.generate_response.return_value = CodeReviewOutput(summary="s", file_analyses=[], suggestions=[])
+
+    generate_review_response("Title", [make_file("a.py")], ["commit"])
+
+    assert [c.args[0] for c in handler.generate_response.call_args_list] == ["summarize_pr"]
+
+
+def test_large_pr_is_sharded_and_reduced(handler, monkeypatch):
+    monkeypatch.setattr(review_prompt, "SHARD_TOKEN_BUDGET", 20)
+    handler.generate_response.side_effect = shard_response
+    files = [make_file(f"pkg{i % 3}/mod{i}.py", size=20) for i in range(30)]
+
+    response = generate_review_response("Title", files, ["commit"])
+
+    tasks = [c.args[0] for c in handler.generate_response.call_args_list]
+    assert tasks.count("review_shard") == 30
+    assert tasks[-1] == "review_reduce"
+    assert sorted(a.file_path for a in response.file_analyses) == sorted(f["filename"] for f in files)
+    assert response.summary == "Combined summary"
+    assert response.suggestions == ["Add tests", "Document the API"]
+
+
+def test_failed_shards_are_skipped(handler, monkeypatch):
+    monkeypatch.setattr(review_prompt, "SINGLE_CALL_MAX_FILES", 1)
+
+    def flaky(task_name, changed_files=None, **kwargs):
+        if task_name == "review_shard" and changed_files[0].filename.startswith("bad"):
+            raise RuntimeError("boom")
+        return shard_response(task_name, changed_files=changed_files, **kwargs)
+
+    monkeypatch.setattr(review_prompt, "SHARD_TOKEN_BUDGET", 1)
+    handler.generate_response.side_effect = flaky
+
+    response = generate_review_response("Title", [make_file("bad/a.py"), make_file("good/b.py")], [])
+
+    assert [a.file_path for a in response.file_analyses] == ["good/b.py"]
+
+
+def test_shard_files_groups_by_directory():
+    files = [FileChangePrompt(filename=name, patch="+x\n" * 8, status="modified", content=None)
+             for name in ["b/2.py", "a/1.py", "b/1.py", "a/2.py"]]
+
+    shards = shard_files(files, budget=12)
+
+    assert [[f.filename for f in shard] for shard in shards] == [["a/1.py", "a/2.py"], ["b/1.py", "b/2.py"]]
+
+
+def test_dedupe_suggestions():
+    assert dedupe_suggestions(["Add tests.", " add tests", "Rename x", ""]) == ["Add tests.", "Rename x"]
+
+
+def test_async_review_is_sharded_and_reduced(handler, monkeypatch):
+    monkeypatch.setattr(review_prompt, "SHARD_TOKEN_BUDGET", 1)
+    monkeypatch.setattr(review_prompt, "SINGLE_CALL_MAX_FILES", 1)
+
+    async def respond(task_name, **kwargs):
+        return shard_response(task_name, **kwargs)
+
+    handler.agenerate_response.side_effect = respond
+
+    response = asyncio.run(agenerate_review_response("Title", [make_file("a/x.py"), make_file("b/y.py")], []))
+
+    assert [a.file_path for a in response.file_analyses] == ["a/x.py", "b/y.py"]
+    assert handler.agenerate_response.call_args_list[-1].args[0] == "review_reduce"
+
+
+def test_re_review_only_sends_changed_blobs(handler, monkeypatch):
+    from utils.analysis_store import AnalysisStore
+    from utils.model_router import repo_context
+    store = AnalysisStore(":memory:")
+    monkeypatch.setattr(review_prompt, "get_analysis_store", lambda: store)
+    files = [{**make_file("a.py"), "sha": "1"}, {**make_file("b.py"), "sha": "2"}]
+
+    with repo_context("acme/app"):
+        handler.generate_response.side_effect = lambda task_name, **kwargs: CodeReviewOutput(
+            summary="first", suggestions=[], file_analyses=[
+                Analysis(file_path=f.filename, analysis="old", comments=[LineComment(line=3, comment="off by one")])
+                for f in kwargs["changed_files"]])
+        generate_review_response("Title", files, [])
+
+        handler.generate_response.reset_mock()
+        handler.generate_response.side_effect = shard_response
+        files[1]["sha"] = "3"
+        response = generate_review_response("Title", files, [])
+
+    shard_calls = [c for c in handler.generate_response.call_args_list if c.args[0] == "review_shard"]
+    assert [[f.filename for f in c.kwargs["changed_files"]] for c in shard_calls] == [["b.py"]]
+    assert [(a.file_path, a.analysis) for a in response.file_analyses] == [("a.py", "old"), ("b.py", "ok")]
+    assert response.summary == "Combined summary"
+    assert [(c.line, c.comment) for c in response.file_analyses[0].comments] == [(3, "off by one")]
+
+
+def test_failed_review_returns_typed_fallback(handler):
+    handler.generate_response.side_effect = RuntimeError("boom")
+    handler.astream_response.side_effect = RuntimeError("boom")
+
+    response = generate_review_response("Title", [make_file("a.py")], [])
+    streamed = asyncio.run(review_prompt.astream_review_response("Title", [make_file("a.py")], [], lambda partial: None))
+
+    assert response == streamed == review_prompt.review_fallback()
+    assert response.file_analyses == [] and response.suggestions == []
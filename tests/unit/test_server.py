@@ -0,0 +1,30 @@
+import socket
+import threading
+import time
+import urllib.request
+from server import PooledWSGIServer
+
+
+def slow_app(environ, start_response):
+    time.sleep(float(environ.get("QUERY_STRING") or 0))
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"done"]
+
+
+def test_shutdown_drains_in_flight_requests():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    server = PooledWSGIServer("127.0.0.1", port, slow_app, threads=2, fd=listener.fileno())
+    serving = threading.Thread(target=server.serve_forever)
+    serving.start()
+    responses = []
+    client = threading.Thread(target=lambda: responses.append(urllib.request.urlopen(f"http://127.0.0.1:{port}/?0.3").read()))
+    client.start()
+    time.sleep(0.1)
+
+    server.shutdown()
+    serving.join()
+    assert server.drain(timeout=5)
+    client.join()
+    assert responses == [b"done"]
+    listener.close()
@@ -0,0 +1,73 @@
+import multiprocessing
+import time
+from utils.shared_store import SharedStore
+
+
+def test_get_set_and_expiry(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.sqlite3"))
+    store.set("tokens", "default", "abc", ttl_seconds=60)
+    store.set("tokens", "old", "xyz", ttl_seconds=-1)
+
+    assert store.get("tokens", "default") == "abc"
+    assert store.get("tokens", "old") is None
+    assert store.get("other", "default") is None
+
+
+def test_add_claims_a_key_once(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.sqlite3"))
+
+    assert store.add("deliveries", "d1", ttl_seconds=60)
+    assert not store.add("deliveries", "d1", ttl_seconds=60)
+    assert store.add("deliveries", "d2", ttl_seconds=0.01)
+    time.sleep(0.02)
+    assert store.add("deliveries", "d2", ttl_seconds=60)
+
+
+def _claim(path, key, results):
+    results.put(SharedStore(path).add("deliveries", key, ttl_seconds=60))
+
+
+def test_store_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    store = SharedStore(path)
+    store.set("tokens", "default", "abc", ttl_seconds=60)
+    results = multiprocessing.get_context("fork").Queue()
+    workers = [multiprocessing.get_context("fork").Process(target=_claim, args=(path, "d1", results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(results.get() for _ in workers) == [False, False, False, True]
+    # The parent's connection is not reused by the forked processes and still works
+    assert store.get("tokens", "default") == "abc"
+
+
+def test_writes_purge_expired_entries(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.sqlite3"), purge_seconds=0)
+    store.add("deliveries", "d1", ttl_seconds=-1)
+    store.set("tokens", "default", "abc", ttl_seconds=60)
+
+    count = store._connection().execute("SELECT COUNT(*) FROM shared_entries").fetchone()[0]
+    assert count == 1
+
+
+def test_store_files_are_private(tmp_path):
+    path = tmp_path / "shared.sqlite3"
+    path.touch(mode=0o644)
+    SharedStore(str(path)).set("installation_token", "default", "secret", ttl_seconds=60)
+
+    for name in ("shared.sqlite3", "shared.sqlite3-wal"):
+        assert (tmp_path / name).stat().st_mode & 0o777 == 0o600
+
+
+def test_update_and_items(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.sqlite3"))
+    store.set("requests", "a", "2", ttl_seconds=60)
+
+    assert store.update("requests", "a", lambda value: str(int(value) - 1), ttl_seconds=60) == "1"
+    assert store.update("requests", "b", lambda value: "new" if value is None else value, ttl_seconds=120) == "new"
+    assert store.items("requests") == {"a": "1", "b": "new"}
+    assert store.update("requests", "a", lambda value: None, ttl_seconds=60) is None
+    store.clear("requests")
+    assert store.items("requests") == {}
@@ -0,0 +1,65 @@
+from utils.symbol_extractor import extract_changed_symbols
+
+SOURCE = '''import os
+
+LIMIT = 10
+
+
+class Agent:
+    """Does things"""
+    retries = 3
+
+    def run(self, x):
+        return self.step(x) + parse(x)
+
+    def step(self, x):
+        return x * 2
+
+
+def parse(x):
+    return int(x)
+
+
+def main():
+    return Agent().run(1)
+'''
+
+
+def patch_for(line, old="old"):
+    return f"@@ -{line},1 +{line},1 @@\n-{old}\n+new"
+
+
+def test_changed_method_with_callees_and_callers():
+    context = extract_changed_symbols(SOURCE, patch_for(14))
+
+    sections = context.split("\n...\n")
+    assert sections[0] == "# lines 13-14: def Agent.step\n    def step(self, x):\n        return x * 2"
+    assert sections[1] == "# Calling the changed code\ndef run(self, x):  # line 10"
+
+
+def test_changed_function_lists_callers_outside_the_class():
+    context = extract_changed_symbols(SOURCE, patch_for(18))
+
+    assert context.startswith("# lines 17-18: def parse")
+    assert "# Calling the changed code\ndef run(self, x):  # line 10" in context
+    assert "main" not in context
+
+
+def test_class_level_change_collapses_methods():
+    context = extract_changed_symbols(SOURCE, patch_for(8))
+
+    assert context.startswith("# lines 6-14: class Agent")
+    assert "    def run(self, x): ..." in context
+    assert "return x * 2" not in context
+    assert "# Calling the changed code\ndef main():  # line 21" in context
+
+
+def test_module_level_change_keeps_context_lines():
+    context = extract_changed_symbols(SOURCE, patch_for(3))
+
+    assert context.startswith("# lines 1-6\nimport os")
+
+
+def test_unparsable_content_returns_none():
+    assert extract_changed_symbols("def broken(:\n", patch_for(1)) is None
+    assert extract_changed_symbols(SOURCE, None) is None
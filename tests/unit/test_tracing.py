@@ -0,0 +1,135 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils import tracing
+from utils.trace_view import critical_path, load_traces, render, select_trace
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    exporter = tracing.JSONLExporter(str(tmp_path / "traces.jsonl"))
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+
+
+def read_spans(exporter):
+    with open(exporter.path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_nested_spans_are_exported_when_the_root_ends(exporter):
+    with tracing.start_trace("pr_pipeline", sample_rate=1.0, repo="owner/repo", pr=7) as root:
+        with tracing.span("stage:review", stage="review") as stage:
+            tracing.add_span("llm", 0.5, task="summarize_pr", prompt_tokens=120)
+            stage.set(outcome="ok")
+
+    spans = {s["name"]: s for s in read_spans(exporter)}
+    assert set(spans) == {"pr_pipeline", "stage:review", "llm"}
+    assert spans["pr_pipeline"]["parent_id"] is None
+    assert spans["stage:review"]["parent_id"] == root.span_id
+    assert spans["llm"]["parent_id"] == stage.span_id
+    assert spans["llm"]["attributes"] == {"task": "summarize_pr", "prompt_tokens": 120}
+    assert spans["llm"]["duration"] == pytest.approx(0.5)
+    assert {s["trace_id"] for s in spans.values()} == {root.trace_id}
+
+
+def test_errors_mark_the_span(exporter):
+    with pytest.raises(ValueError):
+        with tracing.start_trace("pr_pipeline", sample_rate=1.0):
+            with tracing.span("github", endpoint="get_repository"):
+                raise ValueError("boom")
+
+    spans = {s["name"]: s for s in read_spans(exporter)}
+    assert spans["github"]["status"] == "error"
+    assert spans["github"]["attributes"]["error"] == "ValueError: boom"
+
+
+def test_unsampled_traces_record_nothing(exporter):
+    with tracing.start_trace("pr_pipeline", sample_rate=0.0) as root:
+        with tracing.span("stage:review") as stage:
+            tracing.add_span("llm", 0.1)
+    assert not root.sampled and not stage.sampled
+    with tracing.span("outside") as outside:
+        assert not outside.sampled
+    assert not os.path.exists(exporter.path)
+
+
+def test_spans_propagate_to_threads_and_tasks(exporter):
+    @tracing.traced("github", endpoint="get_blob_content")
+    def fetch():
+        return threading.current_thread().name
+
+    async def stage():
+        with tracing.span("stage:fetch"):
+            await asyncio.gather(asyncio.to_thread(fetch), asyncio.to_thread(fetch))
+
+    with tracing.start_trace("pr_pipeline", sample_rate=1.0):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda f: f(), [tracing.wrap(fetch), tracing.wrap(fetch)]))
+        asyncio.run(stage())
+
+    spans = read_spans(exporter)
+    by_id = {s["span_id"]: s for s in spans}
+    parents = sorted(by_id[s["parent_id"]]["name"] for s in spans if s["name"] == "github")
+    assert parents == ["pr_pipeline", "pr_pipeline", "stage:fetch", "stage:fetch"]
+
+
+def test_trace_view_renders_the_critical_path(exporter):
+    with tracing.start_trace("pr_pipeline", sample_rate=1.0, repo="owner/repo", pr=7, head_sha="abcdef123"):
+        with tracing.span("stage:fetch_snapshot"):
+            pass
+        with tracing.span("stage:review"):
+            tracing.add_span("llm", 0.0, task="summarize_pr")
+    with tracing.start_trace("pr_pipeline", sample_rate=1.0, repo="owner/repo", pr=8):
+        pass
+
+    traces = load_traces(exporter.path)
+    spans = select_trace(traces, repo="owner/repo", pr=7)
+    assert [s["name"] for s in critical_path(spans)] == ["pr_pipeline", "stage:review", "llm"]
+
+    text = render(spans, width=20)
+    assert "owner/repo#7 head=abcdef1" in text
+    assert "llm task=summarize_pr" in text
+    assert text.index("stage:fetch_snapshot") < text.rindex("stage:review")
+    assert select_trace(traces, repo="owner/repo", pr=9) is None
+
+
+def test_export_file_is_rotated_by_size(tmp_path):
+    exporter = tracing.JSONLExporter(str(tmp_path / "traces.jsonl"), max_bytes=1, backups=2)
+    tracing.set_exporter(exporter)
+    try:
+        for name in ("first", "second", "third", "fourth"):
+            with tracing.start_trace(name, sample_rate=1.0):
+                pass
+    finally:
+        tracing.set_exporter(None)
+
+    assert sorted(os.listdir(tmp_path)) == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2", "traces.jsonl.lock"]
+    assert [json.loads(line)["name"] for line in open(exporter.path)] == ["fourth"]
+    assert [json.loads(line)["name"] for line in open(f"{exporter.path}.2")] == ["second"]
+
+
+def _export_traces(path, count):
+    tracing.set_exporter(tracing.JSONLExporter(path, max_bytes=300, backups=1000))
+    for index in range(count):
+        with tracing.start_trace(f"run-{os.getpid()}-{index}", sample_rate=1.0):
+            pass
+
+
+def test_worker_processes_rotate_without_losing_spans(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_export_traces, args=(path, 100)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    names = [json.loads(line)["name"] for name in os.listdir(tmp_path) if not name.endswith(".lock")
+             for line in open(tmp_path / name)]
+    assert len(names) == len(set(names)) == 400
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from config.constants import PROJECT_ROOT
+from utils import metrics
+
+ANALYSIS_STORE_PATH = os.getenv("ANALYSIS_STORE_PATH", os.path.join(PROJECT_ROOT, ".cache", "analyses.sqlite3"))
+ANALYSIS_STORE_ENABLED = os.getenv("ANALYSIS_STORE_ENABLED", "True").lower() in ("true", "1")
+ANALYSIS_STORE_TTL_SECONDS = int(os.getenv("ANALYSIS_STORE_TTL_SECONDS", 30 * 24 * 3600))
+ANALYSIS_STORE_MAX_ENTRIES = int(os.getenv("ANALYSIS_STORE_MAX_ENTRIES", 50000))
+
+
+class AnalysisStore:
+    """
+    Disk-backed store of per-file review analyses keyed by (repo, path, blob SHA, prompt version),
+    so a re-review only sends the files whose content changed since the last run.
+    """
+
+    def __init__(self, path: str = ANALYSIS_STORE_PATH, ttl_seconds: int = ANALYSIS_STORE_TTL_SECONDS,
+                 max_entries: int = ANALYSIS_STORE_MAX_ENTRIES):
+        """
+        Args:
+            path: SQLite file backing the store (":memory:" for a process-local store).
+            ttl_seconds: Analyses older than this are removed.
+            max_entries: Least recently used analyses are evicted above this size.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS file_analyses (
+                repo TEXT NOT NULL,
+                path TEXT NOT NULL,
+                blob_sha TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (repo, path, blob_sha, prompt_version))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_file_analyses_accessed ON file_analyses (accessed_at)")
+
+    def get_many(self, repo: str, prompt_version: str, blobs: Dict[str, str]) -> Dict[str, str]:
+        """
+        Looks up the analyses of several files
+
+        Args:
+            repo: Repository ("owner/repo")
+            prompt_version: Version of the prompts that produced the analyses
+            blobs: Blob SHA per file path
+
+        Returns:
+            Analysis text per path, for the paths that were found
+        """
+        now = time.time()
+        found = {}
+        with self._lock, self._conn:
+            for path, blob_sha in blobs.items():
+                row = self._conn.execute(
+                    "SELECT analysis, created_at FROM file_analyses WHERE repo = ? AND path = ? AND blob_sha = ? AND prompt_version = ?",
+                    (repo, path, blob_sha, prompt_version)).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    continue
+                found[path] = row[0]
+            if found:
+                self._conn.executemany(
+                    "UPDATE file_analyses SET accessed_at = ? WHERE repo = ? AND path = ? AND blob_sha = ? AND prompt_version = ?",
+                    [(now, repo, path, blobs[path], prompt_version) for path in found])
+        metrics.increment("analysis_store_hits_total", len(found))
+        metrics.increment("analysis_store_misses_total", len(blobs) - len(found))
+        return found
+
+    def put_many(self, repo: str, prompt_version: str, entries: Iterable[Tuple[str, str, str]]):
+        """Stores (path, blob SHA, analysis) entries for a repository."""
+        now = time.time()
+        rows = [(repo, path, blob_sha, prompt_version, analysis, now, now) for path, blob_sha, analysis in entries]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_analyses (repo, path, blob_sha, prompt_version, analysis, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.evict()
+
+    def evict(self):
+        """Removes expired analyses, then the least recently used ones above max_entries."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_analyses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM file_analyses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM file_analyses WHERE rowid IN (SELECT rowid FROM file_analyses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_analyses")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM file_analyses").fetchone()[0]
+
+
+_analysis_store = None
+_analysis_store_lock = threading.Lock()
+
+
+def get_analysis_store() -> Optional[AnalysisStore]:
+    """Returns the process-wide analysis store, or None when incremental reviews are disabled."""
+    global _analysis_store
+    if not ANALYSIS_STORE_ENABLED:
+        return None
+    if _analysis_store is None:
+        with _analysis_store_lock:
+            if _analysis_store is None:
+                _analysis_store = AnalysisStore()
+    return _analysis_store
+
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's SQLite connection, it opens its own
+    global _analysis_store
+    _analysis_store = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,137 @@
+import os
+import subprocess
+import threading
+import uuid
+from typing import Callable, Optional
+from config.constants import PROJECT_ROOT
+from utils import metrics
+from utils.logging_utils import log_error
+
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache", "blobs"))
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", 512 * 2 ** 20))
+# Optional local (bare) clone of the repositories, read with `git cat-file` before asking the API
+BLOB_MIRROR_PATH = os.getenv("BLOB_MIRROR_PATH")
+
+# Bytes sniffed for NUL characters when deciding whether a blob is binary
+BINARY_SNIFF_BYTES = 8000
+
+
+class BlobCache:
+    """
+    Content-addressed disk cache of git blobs. Blobs are immutable, so entries never go stale; the
+    least recently used ones are evicted above max_bytes. Callers read blobs from disk line by line
+    instead of holding whole files in memory.
+    """
+
+    def __init__(self, directory: str = BLOB_CACHE_DIR, max_bytes: int = BLOB_CACHE_MAX_BYTES, mirror: Optional[str] = BLOB_MIRROR_PATH):
+        """
+        Args:
+            directory: Directory holding the blobs, sharded by the first two characters of the SHA
+            max_bytes: Total size above which the least recently used blobs are removed
+            mirror: Local git repository tried before fetching from the API
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.directory, sha[:2], sha)
+
+    def path(self, sha: str, fetch: Callable[[str], bytes]) -> str:
+        """
+        Returns the path of a blob on disk, reading it from the mirror or calling fetch(sha) on a miss.
+        """
+        path = self._blob_path(sha)
+        if os.path.exists(path):
+            os.utime(path)
+            metrics.increment("blob_cache_hits_total")
+            return path
+        metrics.increment("blob_cache_misses_total")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if not self._read_mirror(sha, tmp_path):
+                data = fetch(sha)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                del data
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._added(os.path.getsize(path))
+        return path
+
+    def read_text(self, sha: str, fetch: Callable[[str], bytes]) -> Optional[str]:
+        """Returns a blob decoded as UTF-8, or None for binary content."""
+        with open(self.path(sha, fetch), "rb") as f:
+            data = f.read()
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+
+    def _read_mirror(self, sha: str, tmp_path: str) -> bool:
+        if not self.mirror:
+            return False
+        try:
+            with open(tmp_path, "wb") as f:
+                subprocess.run(["git", "-C", self.mirror, "cat-file", "blob", sha], stdout=f, stderr=subprocess.DEVNULL, check=True, timeout=60)
+            return True
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".tmp"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry[1] for entry in self._entries())
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Removes the least recently used blobs until the cache is under 90% of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as error:
+                log_error(f"Error evicting blob {path}", error)
+        self._total_bytes = total
+
+
+def is_binary(path: str) -> bool:
+    """Sniffs the beginning of a file for NUL bytes, as git does."""
+    with open(path, "rb") as f:
+        return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+
+_blob_cache = None
+_blob_cache_lock = threading.Lock()
+
+
+def get_blob_cache() -> BlobCache:
+    global _blob_cache
+    if _blob_cache is None:
+        with _blob_cache_lock:
+            if _blob_cache is None:
+                _blob_cache = BlobCache()
+    return _blob_cache
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Callable, Optional
+from utils.logging_utils import log_error
+
+# Minimum seconds between two edits of the same comment
+DEFAULT_MIN_INTERVAL = 3.0
+
+
+class ThrottledCommentUpdater:
+    """
+    Edits a comment at most once per `min_interval` seconds. Bodies submitted in between are
+    coalesced, so only the latest one is written. Edits happen on a timer thread, which keeps
+    `submit` cheap enough to call from a streaming loop or an event loop.
+    """
+
+    def __init__(self, comment, update_fn: Callable, min_interval: float = DEFAULT_MIN_INTERVAL):
+        """
+        Args:
+            comment: The comment to edit
+            update_fn: Function called as update_fn(comment, body) to edit the comment
+            min_interval: Minimum seconds between two edits
+        """
+        self.comment = comment
+        self.min_interval = min_interval
+        self.update_fn = update_fn
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Optional[str] = None
+        self._last_body: Optional[str] = None
+        self._last_update = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self.update_count = 0
+
+    def submit(self, body: str):
+        """Queues a new body, replacing any body that has not been written yet."""
+        with self._lock:
+            if self._closed or body == self._last_body:
+                return
+            self._pending = body
+            if self._timer is None:
+                delay = max(0.0, self._last_update + self.min_interval - time.monotonic())
+                self._timer = threading.Timer(delay, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                body, self._pending = self._pending, None
+                if body is None or self._closed:
+                    return
+            self._write(body)
+
+    def _write(self, body: str):
+        try:
+            self.update_fn(self.comment, body)
+            self.update_count += 1
+        except Exception as e:
+            log_error("Error updating streamed comment", e)
+        with self._lock:
+            self._last_body = body
+            self._last_update = time.monotonic()
+
+    def close(self, final_body: str = None):
+        """
+        Stops the updater: drops pending bodies, waits for an in-flight edit and then
+        writes `final_body`, if given, immediately.
+        """
+        with self._lock:
+            self._closed = True
+            self._pending = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._flush_lock:
+            if final_body is not None and final_body != self._last_body:
+                self._write(final_body)
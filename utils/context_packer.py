@@ -0,0 +1,221 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from utils.diff_utils import changed_line_ranges
+from utils.logging_utils import log_info
+from utils.symbol_extractor import extract_changed_symbols
+
+# Per-task prompt budgets in tokens, leaving room for the template and the structured output
+TASK_TOKEN_BUDGETS = {
+    "summarize_pr": 240000,  # split into shards by prompts.review_prompt when large
+    "test_gating": 30000,
+    "test_update": 60000,
+}
+DEFAULT_TOKEN_BUDGET = 30000
+
+# Lines of surrounding context kept around each changed hunk
+HUNK_CONTEXT_LINES = 20
+
+# Item ranks, lower ranks are packed first
+RANK_PATCH = 0
+RANK_HUNKS = 1
+RANK_CONTENT = 2
+RANK_RELATED_TEST = 3
+RANK_OTHER_TEST = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken is optional (and needs its BPE files), fall back to a character estimate
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Counts the tokens in a piece of text, estimating 4 characters per token without tiktoken."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class DroppedItem:
+    """An item the packer left out of the prompt"""
+    filename: str
+    kind: str
+    tokens: int
+    reason: str
+
+
+@dataclass
+class PackedContext:
+    """Result of packing changed files and tests into a token budget"""
+    files: List[Dict]
+    tests: List[Dict]
+    dropped: List[DroppedItem] = field(default_factory=list)
+    used_tokens: int = 0
+    budget: int = 0
+
+
+def extract_hunk_context(content: str, patch: str, context: int = HUNK_CONTEXT_LINES) -> Optional[str]:
+    """
+    Returns the changed regions of a file with surrounding context, each region prefixed by its line range
+    """
+    if not content or not patch:
+        return None
+    lines = content.splitlines()
+    excerpts = []
+    for start, end in changed_line_ranges(patch, context):
+        end = min(end, len(lines))
+        if start > end:
+            continue
+        excerpts.append(f"# lines {start}-{end}\n" + "\n".join(lines[start - 1:end]))
+    return "\n...\n".join(excerpts) or None
+
+
+def extract_change_context(filename: str, content: str, patch: str) -> Optional[str]:
+    """
+    Returns the changed symbols of a Python file (see utils.symbol_extractor), falling back to the
+    changed regions with surrounding context for other files and for code that does not parse.
+    """
+    if filename.endswith(".py"):
+        symbols = extract_changed_symbols(content, patch)
+        if symbols:
+            return symbols
+    return extract_hunk_context(content, patch)
+
+
+def _module_stem(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def is_related_test(test: Dict, changed_files: List[Dict]) -> bool:
+    """A test is related to the change when its name or imports mention a changed module."""
+    test_stem = _module_stem(test["filename"])
+    content = test.get("content") or ""
+    import_lines = [line for line in content.splitlines() if line.lstrip().startswith(("import ", "from "))]
+    for f in changed_files:
+        stem = _module_stem(f["filename"])
+        if not stem or stem == "__init__":
+            continue
+        if test_stem in (f"test_{stem}", f"{stem}_test"):
+            return True
+        module = os.path.splitext(f["filename"])[0].replace("/", ".")
+        if any(module in line or f" {stem}" in line for line in import_lines):
+            return True
+    return False
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Keeps whole lines from the start of the text until the token budget is spent."""
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = count_tokens(line + "\n")
+        if used + cost > tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def pack_context(task_name: str, updated_files: List[Dict], existing_tests: List[Dict] = None, budget: int = None) -> PackedContext:
+    """
+    Packs changed files and existing tests into the token budget of a task.
+
+    Items are ranked: patches first, then the changed symbols (or hunks with surrounding context),
+    then full file content (replacing the excerpts of that file), then related tests and finally the
+    remaining tests. Within a rank items are taken in filename order, so the result is deterministic.
+    Files excluded for their size come without content and are packed with their patch only.
+
+    Args:
+        task_name: Task the prompt is built for, selects the budget
+        updated_files: Changed files (utils.file_utils.ChangedFile records or dicts with the same keys)
+        existing_tests: Existing test files as {"filename", "content"} dicts
+        budget: Overrides the task budget
+
+    Returns:
+        PackedContext with the files and tests to send and the items that were dropped
+    """
+    budget = budget or TASK_TOKEN_BUDGETS.get(task_name, DEFAULT_TOKEN_BUDGET)
+    existing_tests = existing_tests or []
+    dropped = []
+    used = 0
+
+    candidates = []
+    for f in sorted(updated_files, key=lambda f: f["filename"]):
+        if not f.get("patch"):
+            dropped.append(DroppedItem(f["filename"], "file", 0, f.get("skip_reason") or "no patch available"))
+        else:
+            candidates.append(f)
+
+    # Rank 0: patches, truncated on line boundaries when the budget runs out
+    packed = {}
+    for f in candidates:
+        cost = count_tokens(f["patch"])
+        if used + cost <= budget:
+            patch = f["patch"]
+        else:
+            patch = _truncate_to_tokens(f["patch"], budget - used)
+            if not patch:
+                dropped.append(DroppedItem(f["filename"], "patch", cost, "over budget"))
+                continue
+            dropped.append(DroppedItem(f["filename"], "patch", cost - count_tokens(patch), "truncated"))
+            cost = count_tokens(patch)
+        used += cost
+        packed[f["filename"]] = {**f, "patch": patch, "content": None, "excluded": False}
+
+    # Rank 1: changed symbols, or changed hunks with surrounding context
+    hunk_costs = {}
+    for f in candidates:
+        if f["filename"] not in packed:
+            continue
+        hunks = extract_change_context(f["filename"], f.get("content"), f["patch"])
+        if not hunks:
+            continue
+        cost = count_tokens(hunks)
+        if used + cost <= budget:
+            used += cost
+            hunk_costs[f["filename"]] = cost
+            packed[f["filename"]]["content"] = hunks
+        else:
+            dropped.append(DroppedItem(f["filename"], "hunks", cost, "over budget"))
+
+    # Rank 2: full content replaces the hunk excerpts of a file
+    for f in candidates:
+        if f["filename"] not in packed or not f.get("content"):
+            continue
+        cost = count_tokens(f["content"]) - hunk_costs.get(f["filename"], 0)
+        if used + cost <= budget:
+            used += cost
+            packed[f["filename"]]["content"] = f["content"]
+        else:
+            dropped.append(DroppedItem(f["filename"], "content", cost, "over budget"))
+
+    # Ranks 3 and 4: related tests, then every other test
+    files = list(packed.values())
+    ranked_tests = sorted(existing_tests, key=lambda t: (RANK_RELATED_TEST if is_related_test(t, files) else RANK_OTHER_TEST, t["filename"]))
+    tests = []
+    for test in ranked_tests:
+        cost = count_tokens(test.get("content"))
+        if used + cost <= budget:
+            used += cost
+            tests.append(test)
+        else:
+            dropped.append(DroppedItem(test["filename"], "test", cost, "over budget"))
+
+    if dropped:
+        log_info("Context packer for '%s' used %d/%d tokens and dropped %d items", task_name, used, budget, len(dropped))
+    return PackedContext(files=files, tests=tests, dropped=dropped, used_tokens=used, budget=budget)
@@ -0,0 +1,255 @@
+import bisect
+import difflib
+import hashlib
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+
+@dataclass
+class Hunk:
+    """A single hunk of a unified diff"""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    header: str
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def new_end(self) -> int:
+        """Last line of the hunk in the post-change file"""
+        return self.new_start + max(self.new_count, 1) - 1
+
+
+def parse_hunks(patch: str) -> List[Hunk]:
+    """
+    Parses a unified diff patch (as returned by the GitHub files API) into hunks
+
+    Args:
+        patch: The patch text
+
+    Returns:
+        List of hunks in patch order
+    """
+    hunks = []
+    if not patch:
+        return hunks
+    for line in patch.splitlines():
+        match = HUNK_HEADER_RE.match(line)
+        if match:
+            old_start, old_count, new_start, new_count, _ = match.groups()
+            hunks.append(Hunk(
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+                header=line,
+            ))
+        elif hunks:
+            hunks[-1].lines.append(line)
+    return hunks
+
+
+def changed_line_ranges(patch: str, context: int = 0) -> List[Tuple[int, int]]:
+    """
+    Returns the merged, 1-based inclusive line ranges of the post-change file touched by the patch
+
+    Args:
+        patch: The patch text
+        context: Number of surrounding lines to add on each side of a hunk
+    """
+    ranges = []
+    for hunk in parse_hunks(patch):
+        start = max(1, hunk.new_start - context)
+        end = hunk.new_end + context
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def changed_lines(patch: str) -> List[int]:
+    """
+    Returns the sorted 1-based lines of the post-change file that were added, plus the line following
+    each deletion, leaving out the unchanged context lines of the hunks
+
+    Args:
+        patch: The patch text
+    """
+    lines = set()
+    for hunk in parse_hunks(patch):
+        line_number = hunk.new_start
+        for line in hunk.lines:
+            if line.startswith("+"):
+                lines.add(line_number)
+                line_number += 1
+            elif line.startswith("-"):
+                lines.add(max(1, line_number))
+            elif not line.startswith("\\"):
+                line_number += 1
+    return sorted(lines)
+
+
+class DiffLineIndex:
+    """
+    Maps the lines of the post-change file a patch shows (added and context lines) to their diff
+    position, the line offset below the first hunk header that review comments are anchored to
+    """
+
+    def __init__(self, patch: Optional[str]):
+        self.positions: Dict[int, int] = {}
+        position, line_number = None, 0
+        for line in (patch or "").splitlines():
+            match = HUNK_HEADER_RE.match(line)
+            if match:
+                # Only the first header is position 0, later ones take a position like any line
+                position = 0 if position is None else position + 1
+                line_number = int(match.group(3))
+                continue
+            if position is None:
+                continue
+            position += 1
+            if line.startswith(("+", " ")):
+                self.positions[line_number] = position
+                line_number += 1
+        self._lines = sorted(self.positions)
+
+    def position(self, line: int, tolerance: int = 0) -> Optional[int]:
+        """
+        Returns the diff position of a line, or of the closest line the patch shows within tolerance
+        lines of it, or None
+        """
+        if line in self.positions:
+            return self.positions[line]
+        index = bisect.bisect_left(self._lines, line)
+        candidates = [n for n in self._lines[max(0, index - 1):index + 1] if abs(n - line) <= tolerance]
+        if not candidates:
+            return None
+        return self.positions[min(candidates, key=lambda n: (abs(n - line), n))]
+
+
+def is_local_patch(patch: Optional[str]) -> bool:
+    """True for patches computed by local_diff_units rather than returned by GitHub"""
+    match = HUNK_HEADER_RE.match(patch or "")
+    return match is not None and match.group(5).startswith(" unit:")
+
+
+# Lines of unchanged context around locally computed hunks, as in `git diff`
+LOCAL_DIFF_CONTEXT = 3
+# Locally computed hunks longer than this are split into several units
+DIFF_UNIT_MAX_LINES = int(os.getenv("DIFF_UNIT_MAX_LINES", 300))
+
+
+@dataclass
+class DiffUnit:
+    """A reviewable part of a locally computed diff: a hunk, or a piece of a very long one"""
+    id: str  # stable across runs for the same change to the same path
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def header(self) -> str:
+        return f"@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@ unit:{self.id}"
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+
+def _line_hashes(path: Optional[str]) -> List[int]:
+    if path is None:
+        return []
+    with open(path, "rb") as f:
+        return [hash(line.rstrip(b"\r\n")) for line in f]
+
+
+class _LineReader:
+    """Reads 1-based line ranges of a file in increasing order without loading the file"""
+
+    def __init__(self, path: Optional[str]):
+        self._file = open(path, "rb") if path is not None else None
+        self._next = 1
+
+    def lines(self, start: int, end: int) -> Iterator[str]:
+        """Yields lines start..end-1."""
+        while self._next < start:
+            self._file.readline()
+            self._next += 1
+        while self._next < end:
+            self._next += 1
+            yield self._file.readline().rstrip(b"\r\n").decode("utf-8", errors="replace")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _group_lines(group, old: _LineReader, new: _LineReader) -> Iterator[Tuple[str, str]]:
+    for tag, i1, i2, j1, j2 in group:
+        if tag == "equal":
+            for text in new.lines(j1 + 1, j2 + 1):
+                yield " ", text
+            continue
+        if tag in ("replace", "delete"):
+            for text in old.lines(i1 + 1, i2 + 1):
+                yield "-", text
+        if tag in ("replace", "insert"):
+            for text in new.lines(j1 + 1, j2 + 1):
+                yield "+", text
+
+
+def local_diff_units(filename: str, old_path: Optional[str], new_path: Optional[str], context: int = LOCAL_DIFF_CONTEXT,
+                     max_unit_lines: int = DIFF_UNIT_MAX_LINES) -> Iterator[DiffUnit]:
+    """
+    Computes the unified diff of two files on disk, for files the GitHub API returns no patch for.
+    Lines are matched by hash and the hunk lines are streamed from disk, so neither version is held
+    in memory as text. Hunks longer than max_unit_lines are split into several units.
+
+    Args:
+        filename: Path of the file in the repository, part of the unit IDs
+        old_path: File with the base version, None for added files
+        new_path: File with the head version, None for removed files
+        context: Unchanged lines kept around each change
+        max_unit_lines: Maximum number of diff lines per unit
+
+    Yields:
+        DiffUnit in file order
+    """
+    matcher = difflib.SequenceMatcher(None, _line_hashes(old_path), _line_hashes(new_path))
+    old, new = _LineReader(old_path), _LineReader(new_path)
+    seen = Counter()
+
+    def unit(lines, old_start, old_count, new_start, new_count):
+        digest = hashlib.sha1("\n".join([filename] + lines).encode("utf-8", errors="replace")).hexdigest()[:12]
+        seen[digest] += 1
+        unit_id = digest if seen[digest] == 1 else f"{digest}-{seen[digest]}"
+        # Unified diffs number an empty side from the line before it
+        return DiffUnit(unit_id, old_start if old_count else old_start - 1, old_count,
+                        new_start if new_count else new_start - 1, new_count, lines)
+
+    try:
+        for group in matcher.get_grouped_opcodes(context):
+            old_start, new_start = group[0][1] + 1, group[0][3] + 1
+            lines, old_count, new_count = [], 0, 0
+            for prefix, text in _group_lines(group, old, new):
+                lines.append(prefix + text)
+                old_count += prefix != "+"
+                new_count += prefix != "-"
+                if len(lines) >= max_unit_lines:
+                    yield unit(lines, old_start, old_count, new_start, new_count)
+                    old_start, new_start = old_start + old_count, new_start + new_count
+                    lines, old_count, new_count = [], 0, 0
+            if lines:
+                yield unit(lines, old_start, old_count, new_start, new_count)
+    finally:
+        old.close()
+        new.close()
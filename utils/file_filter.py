@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from utils import github_utils
+from utils.logging_utils import log_debug, log_error
+
+FILE_FILTER_ENABLED = os.getenv("FILE_FILTER_ENABLED", "True").lower() in ("true", "1")
+# How long the rules read from a repository's .gitattributes are reused
+FILE_FILTER_CACHE_SECONDS = float(os.getenv("FILE_FILTER_CACHE_SECONDS", 600))
+
+# Path rules in .gitattributes glob syntax, by skip reason. Patterns without a slash match the file
+# name in any directory.
+DEFAULT_RULES: Dict[str, Tuple[str, ...]] = {
+    "lock file": ("package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+                  "uv.lock", "Cargo.lock", "Gemfile.lock", "composer.lock", "go.sum", "*.lockb"),
+    "vendored": ("**/vendor/**", "**/node_modules/**", "**/third_party/**", "**/bower_components/**"),
+    "minified": ("*.min.js", "*.min.mjs", "*.min.css", "*.js.map", "*.css.map"),
+    "migration": ("**/migrations/**", "**/db/migrate/**", "**/alembic/versions/**"),
+    "snapshot": ("*.snap", "*.ambr", "**/__snapshots__/**"),
+    "generated": ("*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*", "*.g.dart"),
+    "binary": ("*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.webp", "*.bmp", "*.pdf", "*.zip", "*.gz", "*.tgz", "*.tar",
+               "*.jar", "*.whl", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.so", "*.dylib", "*.dll", "*.exe", "*.pyc"),
+}
+
+# .gitattributes attributes mapped to skip reasons
+GITATTRIBUTES_REASONS = {"linguist-generated": "generated", "linguist-vendored": "vendored", "binary": "binary"}
+
+# Markers tools write at the top of generated files, looked for in the first added lines of a patch
+GENERATED_MARKERS = re.compile(r"@generated|DO NOT EDIT|Code generated by|auto-generated|autogenerated", re.IGNORECASE)
+GENERATED_SNIFF_LINES = 5
+# Added lines longer than this are only found in minified or generated files
+MINIFIED_LINE_CHARS = 1000
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translates a .gitattributes pattern into a regular expression matching repository paths.
+    A pattern without a slash matches the file name in any directory, "**" spans directories.
+    """
+    pattern = pattern.strip()
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.lstrip("/")
+    parts, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(parts)
+
+
+def parse_gitattributes(text: str) -> List[Tuple[re.Pattern, str, bool]]:
+    """
+    Reads the attributes that mark files as generated, vendored or binary
+
+    Args:
+        text: Content of a .gitattributes file
+
+    Returns:
+        List of (path regex, skip reason, set) in file order; set is False for "-attr" or "attr=false"
+    """
+    rules = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        for attribute in fields[1:]:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name in GITATTRIBUTES_REASONS:
+                is_set = not attribute.startswith(("-", "!")) and value.lower() not in ("false", "0")
+                rules.append((re.compile(glob_to_regex(fields[0])), GITATTRIBUTES_REASONS[name], is_set))
+    return rules
+
+
+def sniff_patch(patch: Optional[str]) -> Optional[str]:
+    """Recognizes generated and minified files from the added lines of their patch."""
+    if not patch:
+        return None
+    added = 0
+    for line in patch.splitlines():
+        if not line.startswith("+"):
+            continue
+        if len(line) > MINIFIED_LINE_CHARS:
+            return "minified"
+        if added < GENERATED_SNIFF_LINES and GENERATED_MARKERS.search(line):
+            return "generated"
+        added += 1
+    return None
+
+
+class FileClassifier:
+    """
+    Decides from the PR file list alone which files are not worth reviewing: lock files, vendored,
+    minified, generated and binary files, migrations and test snapshots. The default path rules are
+    compiled into a single regular expression; rules from the repository's .gitattributes come
+    first, and can also bring a file back (e.g. "-linguist-generated").
+    """
+
+    _default_pattern = None
+
+    def __init__(self, attribute_rules: List[Tuple[re.Pattern, str, bool]] = None):
+        self.attribute_rules = attribute_rules or []
+
+    @classmethod
+    def default_pattern(cls) -> re.Pattern:
+        if cls._default_pattern is None:
+            groups = [f"(?P<r{i}>{'|'.join(glob_to_regex(p) for p in patterns)})" for i, patterns in enumerate(DEFAULT_RULES.values())]
+            cls._default_pattern = re.compile("|".join(groups))
+        return cls._default_pattern
+
+    def classify(self, filename: str, patch: Optional[str] = None) -> Optional[str]:
+        """
+        Args:
+            filename: Path of the file in the repository
+            patch: The file's patch from the PR file list, sniffed for generated or minified content
+
+        Returns:
+            The reason to skip the file, or None to review it
+        """
+        decided = {}
+        # The last matching line wins, as in git
+        for regex, reason, is_set in self.attribute_rules:
+            if regex.fullmatch(filename):
+                decided[reason] = is_set
+        for reason, is_set in decided.items():
+            if is_set:
+                return reason
+        match = self.default_pattern().fullmatch(filename)
+        if match is not None:
+            reason = list(DEFAULT_RULES)[int(match.lastgroup[1:])]
+            if decided.get(reason) is not False:
+                return reason
+        if decided.get("generated") is False:
+            return None
+        return sniff_patch(patch)
+
+
+_classifiers: Dict[str, Tuple[float, FileClassifier]] = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_file_classifier(repository, ref: str) -> FileClassifier:
+    """
+    Returns the classifier for a repository, reading its .gitattributes at most every
+    FILE_FILTER_CACHE_SECONDS
+
+    Args:
+        repository: The GitHub repository
+        ref: Reference the .gitattributes file is read at
+    """
+    now = time.monotonic()
+    with _classifiers_lock:
+        cached = _classifiers.get(repository.full_name)
+    if cached is not None and now - cached[0] < FILE_FILTER_CACHE_SECONDS:
+        return cached[1]
+    try:
+        text = github_utils.get_text_file(repository, ".gitattributes", ref)
+    except Exception as error:
+        log_error(f"Error reading .gitattributes of {repository.full_name}", error)
+        text = None
+    classifier = FileClassifier(parse_gitattributes(text) if text else [])
+    log_debug("Loaded %d .gitattributes rules for %s", len(classifier.attribute_rules), repository.full_name)
+    with _classifiers_lock:
+        _classifiers[repository.full_name] = (now, classifier)
+    return classifier
@@ -1,7 +1,20 @@
 import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from utils import github_utils
+from utils.blob_cache import BlobCache, get_blob_cache, is_binary
+from utils.diff_utils import local_diff_units
 from utils.github_utils import getFileContent
+from utils.logging_utils import log_error
 
 FILE_SIZE_THRESHOLD = 32000
+# Total size of the file contents downloaded for a PR, in tokens (estimated at 4 bytes per token).
+# Nothing beyond it could be sent to a prompt, so memory stays bounded by the largest prompt budget.
+CONTENT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", 240000))
+BYTES_PER_TOKEN = 4
+# Size cap of a patch computed locally for a file the PR files API returned no patch for
+LOCAL_DIFF_MAX_CHARS = int(os.getenv("LOCAL_DIFF_MAX_CHARS", 64000))
 
 def read_json(file_path: str):
     """Read JSON data from a file."""
@@ -13,17 +26,230 @@ def write_json(file_path: str, data):
     with open(file_path, "w") as f:
         json.dump(data, f, indent=4)
 
-def update_file(file, repository, ref):
-    """Extract file details, including content and exclusion logic."""
-    content = getFileContent(repository, file, ref)
-    exclude = content and len(content) >= FILE_SIZE_THRESHOLD
-
-    return {
-        "filename": file.filename,
-        "patch": file.patch,
-        "status": file.status,
-        "additions": file.additions,
-        "deletions": file.deletions,
-        "excluded": exclude,
-        "content": content
-    }
+
+class ChangedFile:
+    """
+    Compact record of a changed file. Supports the read-only mapping access the prompt builders use
+    (f["patch"], f.get("content"), {**f}), so it can stand in for plain file dicts.
+    """
+    __slots__ = ("filename", "sha", "patch", "status", "additions", "deletions", "excluded", "content", "size", "skip_reason",
+                 "truncated_units")
+
+    FIELDS = __slots__
+
+    def __init__(self, filename: str, sha: Optional[str], patch: Optional[str], status: str, additions: int = 0,
+                 deletions: int = 0, excluded: bool = False, content: Optional[str] = None, size: Optional[int] = None,
+                 skip_reason: Optional[str] = None, truncated_units: int = 0):
+        self.filename = filename
+        self.sha = sha
+        self.patch = patch
+        self.status = status
+        self.additions = additions
+        self.deletions = deletions
+        self.excluded = excluded
+        self.content = content
+        self.size = size
+        self.skip_reason = skip_reason
+        # Diff units left out of a locally computed patch cut at LOCAL_DIFF_MAX_CHARS
+        self.truncated_units = truncated_units
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def __contains__(self, key) -> bool:
+        return key in self.FIELDS
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __repr__(self):
+        return f"ChangedFile({self.filename!r}, status={self.status!r}, size={self.size}, excluded={self.excluded}, skip_reason={self.skip_reason!r})"
+
+
+def plan_content(status: str, size: Optional[int], budget_left: int) -> Optional[str]:
+    """
+    Decides from metadata alone whether a file's content is worth downloading
+
+    Args:
+        status: The file's status in the PR
+        size: Blob size in bytes at the head commit, None if unknown
+        budget_left: Content tokens still available for the PR
+
+    Returns:
+        None to download the content, otherwise the reason for skipping it
+    """
+    if status == "removed":
+        return "removed"
+    if size is None:
+        return None
+    if size >= FILE_SIZE_THRESHOLD:
+        return "excluded: over size threshold"
+    if size // BYTES_PER_TOKEN > budget_left:
+        return "over content budget"
+    return None
+
+
+def get_blob_text(repository, sha: str) -> Optional[str]:
+    """Reads a blob as text through the blob cache shared by the worker processes, None for binary blobs."""
+    return get_blob_cache().read_text(sha, lambda blob_sha: github_utils.get_blob_bytes(repository, blob_sha))
+
+
+def build_local_patch(repository, file, base_sha: Optional[str], cache: BlobCache = None,
+                      max_chars: int = LOCAL_DIFF_MAX_CHARS) -> Tuple[Optional[str], int]:
+    """
+    Computes the patch of a PR file from its base and head blobs, for files the PR files API returned
+    no patch for (large diffs). The blobs go through the disk blob cache and the diff is streamed from
+    it, so neither version is held in memory as text.
+
+    Args:
+        repository: The GitHub repository
+        file: A file from github_utils.get_pull_request_files
+        base_sha: Blob SHA of the file at the base commit, None for added files
+        cache: Blob cache, the shared one by default
+        max_chars: Size at which the patch is cut, at a unit boundary
+
+    Returns:
+        Tuple of (the patch, or None for binary files and files without changes; number of units
+        left out because the patch reached max_chars)
+    """
+    cache = cache or get_blob_cache()
+    fetch = lambda sha: github_utils.get_blob_bytes(repository, sha)
+    head_path = cache.path(file.sha, fetch) if file.sha and file.status != "removed" else None
+    base_path = cache.path(base_sha, fetch) if base_sha else None
+    if any(path is not None and is_binary(path) for path in (base_path, head_path)):
+        return None, 0
+    units, size, left_out = [], 0, 0
+    for unit in local_diff_units(file.filename, base_path, head_path):
+        text = unit.text
+        # Later units are counted, not kept, so the review can say how much of the diff it covers
+        if left_out or size + len(text) > max_chars:
+            left_out += 1
+            continue
+        units.append(text)
+        size += len(text) + 1
+    return "\n".join(units) or None, left_out
+
+
+def iter_changed_files(repository, pr_files: Iterable, ref: str, sizes: Dict[str, int] = None,
+                       content_budget: int = CONTENT_TOKEN_BUDGET,
+                       base_blobs: Callable[[], Dict[str, str]] = None,
+                       classify: Callable[[str, Optional[str]], Optional[str]] = None) -> Iterator[ChangedFile]:
+    """
+    Yields a ChangedFile per PR file, downloading content only for the files that can make it into a
+    prompt: not removed, under FILE_SIZE_THRESHOLD and within the PR's content budget. Files whose
+    size is unknown are downloaded and checked afterwards. Files without a patch
+    get one computed locally when base_blobs is given. Files the classifier rejects (lock files,
+    generated or vendored code...) are yielded without their patch and never fetched.
+
+    Args:
+        repository: The GitHub repository
+        pr_files: Files from github_utils.get_pull_request_files
+        ref: Head reference the content is read at
+        sizes: Blob size per path at the head commit (github_utils.get_blob_sizes)
+        content_budget: Content tokens downloaded at most for the PR
+        base_blobs: Returns the blob SHA per path at the base commit; only called if a patch is missing
+        classify: Returns the reason to skip a file from its path and patch (FileClassifier.classify)
+    """
+    sizes = sizes or {}
+    budget_left = content_budget
+    base_shas = None
+    for file in pr_files:
+        size = sizes.get(file.filename)
+        record = ChangedFile(file.filename, file.sha, file.patch, file.status, file.additions, file.deletions, size=size)
+        reason = classify(file.filename, file.patch) if classify is not None and file.status != "removed" else None
+        if reason is not None:
+            record.patch, record.skip_reason = None, reason
+            yield record
+            continue
+        if record.patch is None and file.status != "removed" and base_blobs is not None:
+            try:
+                if base_shas is None:
+                    base_shas = base_blobs()
+                base_path = getattr(file, "previous_filename", None) or file.filename
+                record.patch, record.truncated_units = build_local_patch(
+                    repository, file, None if file.status == "added" else base_shas.get(base_path))
+                if record.patch is None:
+                    record.skip_reason = "binary"
+            except Exception as error:
+                log_error(f"Error computing the diff of {file.filename}", error)
+            if record.skip_reason is not None:
+                yield record
+                continue
+        record.skip_reason = plan_content(file.status, size, budget_left)
+        record.excluded = record.skip_reason == "excluded: over size threshold"
+        if record.skip_reason is None:
+            try:
+                content = get_blob_text(repository, file.sha) if file.sha else getFileContent(repository, file, ref)
+            except Exception as error:
+                log_error(f"Error fetching content of {file.filename}", error)
+                content = None
+            if content is not None and len(content) >= FILE_SIZE_THRESHOLD:
+                record.excluded = True
+                record.skip_reason = "excluded: over size threshold"
+            elif content is not None:
+                record.content = content
+                budget_left -= len(content) // BYTES_PER_TOKEN
+        yield record
+
+
+class LazyChangedFiles:
+    """
+    Re-iterable view of iter_changed_files. Records are produced (and their content downloaded) as the
+    first consumer reaches them, and kept for the other consumers: the review and test generation
+    stages read the same files concurrently.
+    """
+
+    def __init__(self, records: Iterator[ChangedFile]):
+        self._source = records
+        self._records: List[ChangedFile] = []
+        self._lock = threading.Lock()
+        self._exhausted = False
+        self._error: Optional[BaseException] = None
+
+    def _fetch(self, index: int) -> bool:
+        """Makes record `index` available; False once the source is exhausted."""
+        with self._lock:
+            while index >= len(self._records):
+                if self._error is not None:
+                    # Every consumer sees the failure, not a silently shorter list
+                    raise self._error
+                if self._exhausted:
+                    return False
+                try:
+                    self._records.append(next(self._source))
+                except StopIteration:
+                    self._exhausted = True
+                except Exception as error:
+                    self._error = error
+            return True
+
+    def __iter__(self) -> Iterator[ChangedFile]:
+        index = 0
+        while index < len(self._records) or self._fetch(index):
+            yield self._records[index]
+            index += 1
+
+    def __len__(self) -> int:
+        """Number of changed files; produces the remaining records."""
+        for _ in self:
+            pass
+        return len(self._records)
+
+
+def skipped_files(files: Iterable) -> List[Tuple[str, str]]:
+    """Returns (filename, reason) for the changed files left out of the review, entirely or in part."""
+    skipped = []
+    for f in files:
+        if f.get("skip_reason") and not f.get("patch") and f.get("status") != "removed":
+            skipped.append((f["filename"], f.get("skip_reason")))
+        elif f.get("truncated_units") and f.get("patch"):
+            skipped.append((f["filename"], f"diff truncated, {f.get('truncated_units')} hunks not reviewed"))
+    return skipped
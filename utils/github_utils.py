@@ -1,36 +1,126 @@
 import json
 import base64
-from github import Github
+import os
+import threading
+import time
+from github import Auth, Github, UnknownObjectException
 from auth.github_auth import generate_installation_token
+from utils import metrics, tracing
+from utils.shared_store import get_shared_store
 
-# Initialize GitHub Client
-installation_token = generate_installation_token()
-g = Github(installation_token)
+# Installation tokens expire after an hour. Workers share one through the shared store, replaced this often.
+INSTALLATION_TOKEN_TTL_SECONDS = int(os.getenv("INSTALLATION_TOKEN_TTL_SECONDS", 50 * 60))
+# How long a process reuses the token before reading the shared store again
+INSTALLATION_TOKEN_LOCAL_SECONDS = 60
 
+
+class SharedInstallationAuth(Auth.Auth):
+    """Authenticates requests with the installation token shared by the worker processes of the node"""
+
+    token_type = "token"
+
+    def __init__(self):
+        self._token = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def token(self) -> str:
+        if self._token is None or time.monotonic() - self._read_at > INSTALLATION_TOKEN_LOCAL_SECONDS:
+            with self._lock:
+                if self._token is None or time.monotonic() - self._read_at > INSTALLATION_TOKEN_LOCAL_SECONDS:
+                    store = get_shared_store()
+                    token = store.get("installation_token", "default")
+                    if token is None:
+                        token = generate_installation_token()
+                        store.set("installation_token", "default", token, INSTALLATION_TOKEN_TTL_SECONDS)
+                    self._token, self._read_at = token, time.monotonic()
+        return self._token
+
+    @property
+    def _masked_token(self) -> str:
+        return "token (installation token removed)"
+
+
+# Initialize GitHub Client; the installation token is exchanged on the first request
+g = Github(auth=SharedInstallationAuth())
+
+@metrics.timed("github_request_seconds", call="get_repository")
+@tracing.traced("github", endpoint="get_repository")
 def get_repository(owner: str, repo_name: str):
     """Fetch the repository object."""
     return g.get_repo(f"{owner}/{repo_name}")
 
+@metrics.timed("github_request_seconds", call="get_pull_request")
+@tracing.traced("github", endpoint="get_pull_request")
 def get_pull_request(repository, pull_number: int):
     """Fetch the pull request object."""
     return repository.get_pull(pull_number)
 
+@metrics.timed("github_request_seconds", call="get_open_pull_requests")
+@tracing.traced("github", endpoint="get_open_pull_requests")
+def get_open_pull_requests(repository):
+    """Fetch the open PRs of a repository, oldest first."""
+    return list(repository.get_pulls(state="open", sort="created", direction="asc"))
+
+@metrics.timed("github_request_seconds", call="get_pull_request_files")
+@tracing.traced("github", endpoint="get_pull_request_files")
 def get_pull_request_files(repository, pull_number: int):
     """Fetch the files modified in a PR."""
-    return get_pull_request(repository, pull_number).get_files()
+    # Fetch every page here, so the request time is attributed to this call
+    return list(get_pull_request(repository, pull_number).get_files())
 
+@metrics.timed("github_request_seconds", call="get_pull_request_commits")
+@tracing.traced("github", endpoint="get_pull_request_commits")
 def get_pull_request_commits(repository, pull_number: int):
     """Fetch the commit messages of a PR."""
     return [commit.commit.message for commit in get_pull_request(repository, pull_number).get_commits()]
 
+def get_rate_limit():
+    """Return the remaining core API requests and the epoch time the limit resets at, from the last response."""
+    remaining, _ = g.rate_limiting
+    return remaining, g.rate_limiting_resettime
+
+@metrics.timed("github_request_seconds", call="post_comment")
+@tracing.traced("github", endpoint="post_comment")
 def post_comment(repository, pull_number: int, message: str):
     """Post a comment on a PR."""
     return repository.get_issue(pull_number).create_comment(message)
 
+@metrics.timed("github_request_seconds", call="update_comment")
+@tracing.traced("github", endpoint="update_comment")
 def update_comment(comment, message: str):
     """Update an existing comment."""
     comment.edit(message)
 
+@metrics.timed("github_request_seconds", call="find_comment")
+@tracing.traced("github", endpoint="find_comment")
+def find_comment(repository, pull_number: int, marker: str):
+    """Return the most recent PR comment whose body contains the marker, or None."""
+    for comment in repository.get_issue(pull_number).get_comments().reversed:
+        if marker in (comment.body or ""):
+            return comment
+    return None
+
+def upsert_comment(repository, pull_number: int, marker: str, message: str):
+    """Edit the PR comment carrying the marker, or post it if there is none yet."""
+    comment = find_comment(repository, pull_number, marker)
+    if comment is None:
+        return post_comment(repository, pull_number, message)
+    update_comment(comment, message)
+    return comment
+
+@metrics.timed("github_request_seconds", call="create_review")
+@tracing.traced("github", endpoint="create_review")
+def create_review(repository, pull_number: int, commit_sha, comments, body: str = ""):
+    """Post inline comments as a single pull request review."""
+    pull = get_pull_request(repository, pull_number)
+    if commit_sha:
+        return pull.create_review(commit=repository.get_commit(commit_sha), body=body, event="COMMENT", comments=comments)
+    return pull.create_review(body=body, event="COMMENT", comments=comments)
+
+@metrics.timed("github_request_seconds", call="getFileContent")
+@tracing.traced("github", endpoint="getFileContent")
 def getFileContent(repository, file, ref):
     if file.status == "removed":
         return None
@@ -43,14 +133,55 @@ def getFileContent(repository, file, ref):
     
     return None
 
+@metrics.timed("github_request_seconds", call="get_text_file")
+@tracing.traced("github", endpoint="get_text_file")
+def get_text_file(repository, path: str, ref: str):
+    """Fetch a file by path as text, or return None if it does not exist at the ref."""
+    try:
+        return base64.b64decode(repository.get_contents(path, ref).content).decode("utf-8")
+    except UnknownObjectException:
+        return None
+
+@metrics.timed("github_request_seconds", call="get_commit_sha")
+@tracing.traced("github", endpoint="get_commit_sha")
+def get_commit_sha(repository, ref: str) -> str:
+    """Resolve a branch, tag or SHA to a commit SHA."""
+    return repository.get_commit(ref).sha
+
+@metrics.timed("github_request_seconds", call="get_tree_blobs")
+@tracing.traced("github", endpoint="get_tree_blobs")
+def get_tree_blobs(repository, commit_sha: str):
+    """Return the blob SHA of every file in the commit's tree, by path."""
+    tree = repository.get_git_tree(commit_sha, recursive=True)
+    return {item.path: item.sha for item in tree.tree if item.type == "blob"}
+
+@metrics.timed("github_request_seconds", call="get_blob_sizes")
+@tracing.traced("github", endpoint="get_blob_sizes")
+def get_blob_sizes(repository, ref: str):
+    """Return the size in bytes of every file in the ref's tree, by path (partial for truncated trees)."""
+    tree = repository.get_git_tree(ref, recursive=True)
+    return {item.path: item.size for item in tree.tree if item.type == "blob" and item.size is not None}
+
+@metrics.timed("github_request_seconds", call="get_blob_bytes")
+@tracing.traced("github", endpoint="get_blob_bytes")
+def get_blob_bytes(repository, blob_sha: str) -> bytes:
+    """Fetch a blob by SHA as raw bytes."""
+    return base64.b64decode(repository.get_git_blob(blob_sha).content)
+
+@metrics.timed("github_request_seconds", call="create_file")
+@tracing.traced("github", endpoint="create_file")
 def create_file(repository, filename, comment, file_content, branch):
     """Create a new file in the repository."""
     repository.create_file(filename, comment, file_content, branch=branch)
 
+@metrics.timed("github_request_seconds", call="update_file")
+@tracing.traced("github", endpoint="update_file")
 def update_file(repository, filename, comment, file_content, file_sha, branch):
     """Update an existing file in the repository."""
     repository.update_file(filename, comment, file_content, sha=file_sha, branch=branch)
 
+@metrics.timed("github_request_seconds", call="delete_file")
+@tracing.traced("github", endpoint="delete_file")
 def delete_file(repository, filename, comment, file_sha, branch):
     """Delete a file from the repository."""
     repository.delete_file(filename, comment, file_sha, branch)
@@ -0,0 +1,82 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils import github_utils
+from utils.diff_utils import DiffLineIndex, is_local_patch
+from utils.logging_utils import log_error, log_info
+
+# Comments per review request. GitHub rejects or times out on very large reviews, so bigger batches are split.
+INLINE_REVIEW_MAX_COMMENTS = int(os.getenv("INLINE_REVIEW_MAX_COMMENTS", 100))
+# GitHub's limit on the size of a comment body
+MAX_COMMENT_CHARS = 65536
+# A comment on a line the patch does not show moves to the closest shown line this near
+LINE_TOLERANCE = int(os.getenv("INLINE_REVIEW_LINE_TOLERANCE", 3))
+
+
+@dataclass
+class InlineComment:
+    path: str
+    line: int
+    body: str
+    position: Optional[int] = None
+
+    @property
+    def key(self) -> Tuple[str, int, str]:
+        return self.path, self.line, self.body
+
+    def to_api(self) -> Dict:
+        return {"path": self.path, "position": self.position, "body": self.body[:MAX_COMMENT_CHARS]}
+
+
+def map_comments(file_analyses: Iterable, files: Iterable) -> Tuple[List[InlineComment], List[InlineComment]]:
+    """
+    Anchors the line comments of the review to diff positions, through one line index per file
+
+    Args:
+        file_analyses: Analysis objects of the review
+        files: Changed files from handle_pull_request, whose patches the positions refer to
+
+    Returns:
+        Tuple of (comments with a position, comments that cannot be placed on the diff)
+    """
+    patches = {f["filename"]: f["patch"] for f in files if f.get("patch") and not is_local_patch(f["patch"])}
+    indexes: Dict[str, DiffLineIndex] = {}
+    mapped, unmapped = [], []
+    for analysis in file_analyses:
+        for line_comment in analysis.comments:
+            comment = InlineComment(analysis.file_path, line_comment.line, line_comment.comment)
+            if analysis.file_path in patches:
+                if analysis.file_path not in indexes:
+                    indexes[analysis.file_path] = DiffLineIndex(patches[analysis.file_path])
+                comment.position = indexes[analysis.file_path].position(comment.line, LINE_TOLERANCE)
+            (mapped if comment.position is not None else unmapped).append(comment)
+    return mapped, unmapped
+
+
+def submit_review(repository, pull_number: int, commit_sha: Optional[str], comments: List[InlineComment],
+                  max_comments: int = INLINE_REVIEW_MAX_COMMENTS) -> List[InlineComment]:
+    """
+    Posts the comments as a pull request review, in a single request unless there are more than
+    max_comments
+
+    Args:
+        repository: The GitHub repository
+        pull_number: The PR number
+        commit_sha: Commit the positions refer to, the PR head if None
+        comments: Comments with a diff position
+        max_comments: Comments per review request
+
+    Returns:
+        The comments that were posted; the others belong in the summary comment
+    """
+    posted = []
+    for start in range(0, len(comments), max_comments):
+        batch = comments[start:start + max_comments]
+        try:
+            github_utils.create_review(repository, pull_number, commit_sha, [c.to_api() for c in batch])
+            posted.extend(batch)
+        except Exception as error:
+            log_error(f"Error posting {len(batch)} inline review comments", error)
+    if posted:
+        log_info("Posted %d inline review comments on PR #%d", len(posted), pull_number)
+    return posted
@@ -0,0 +1,355 @@
+import bisect
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from config.constants import PROJECT_ROOT
+from utils import metrics
+from utils.logging_utils import log_context, log_error, log_info
+
+# Webhook jobs go through the queue and are run by the node owning their repository
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "False").lower() in ("true", "1")
+# SQLite file shared by the nodes (on a shared volume); stands in for a networked queue
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(PROJECT_ROOT, ".cache", "jobs.sqlite3"))
+# A leased job becomes visible to other nodes again when its lease is not renewed for this long
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Nodes that have not sent a heartbeat for this long leave the hash ring, and their repositories move
+NODE_HEARTBEAT_TTL = float(os.getenv("NODE_HEARTBEAT_TTL", 30))
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Finished (done or failed) jobs are deleted after this long
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+HASH_RING_REPLICAS = 64
+# Leasable jobs of the node examined per lease call
+LEASE_SCAN_LIMIT = 500
+# Seconds between prunes of the finished jobs by each consuming node
+PRUNE_INTERVAL = 3600
+
+
+def shard_key(payload: Dict) -> str:
+    """Jobs of one repository share a key, so they run on the node keeping its caches warm."""
+    installation = (payload.get("installation") or {}).get("id", "")
+    repository = payload.get("repository") or {}
+    full_name = repository.get("full_name") or f"{(repository.get('owner') or {}).get('login', '')}/{repository.get('name', '')}"
+    return f"{installation}/{full_name}"
+
+
+def _hash(value: str) -> int:
+    # 63 bits, so hashes fit in a SQLite integer
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big") >> 1
+
+
+class HashRing:
+    """Consistent hash ring: adding or removing a node only moves the keys of that node"""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = HASH_RING_REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+    def ranges_for(self, node: str) -> List[Tuple[Optional[int], Optional[int]]]:
+        """
+        The key hash ranges owned by a node, as (low, high) with low inclusive and high exclusive;
+        None leaves a side open (the range wrapping around the ring is split in two).
+        """
+        ranges = []
+        for i, owner in enumerate(self._nodes):
+            if owner != node:
+                continue
+            if i == 0:
+                ranges.extend([(None, self._hashes[0]), (self._hashes[-1], None)])
+            else:
+                ranges.append((self._hashes[i - 1], self._hashes[i]))
+        return ranges
+
+
+@dataclass
+class Job:
+    id: int
+    key: str
+    event: str
+    payload: Dict[str, Any]
+    attempts: int
+    owner: Optional[str] = None
+    # Progress saved by earlier attempts (save_progress), so a retry can skip side effects already done
+    progress: Dict[str, Any] = field(default_factory=dict)
+
+
+class JobQueue:
+    """
+    Leased job queue shared by the nodes. A node leases the queued jobs whose key hashes to it on the
+    ring of live nodes, and must renew the lease within the visibility timeout; jobs whose lease
+    lapses (the node died or hung) are leased again, on whichever node owns the key by then.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, heartbeat_ttl: float = NODE_HEARTBEAT_TTL):
+        """
+        Args:
+            path: SQLite file backing the queue
+            visibility_timeout: Lease duration in seconds
+            max_attempts: Leases of a job before it is marked failed
+            heartbeat_ttl: Seconds without a heartbeat after which a node leaves the ring
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.heartbeat_ttl = heartbeat_ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                key_hash INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                progress TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_expires)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, updated_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+        return self._conn
+
+    def enqueue(self, event: str, payload: Dict, key: str = None) -> int:
+        """Adds a job and returns its ID."""
+        now = time.time()
+        key = key or shard_key(payload)
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO jobs (key, key_hash, event, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, _hash(key), event, json.dumps(payload), now, now))
+        metrics.increment("job_queue_enqueued_total")
+        return cursor.lastrowid
+
+    def heartbeat(self, node_id: str):
+        with self._lock:
+            self._connection().execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat_at) VALUES (?, ?)", (node_id, time.time()))
+
+    def leave(self, node_id: str):
+        """Removes the node from the ring, so its repositories move to the other nodes right away."""
+        with self._lock:
+            self._connection().execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def live_nodes(self) -> List[str]:
+        with self._lock:
+            rows = self._connection().execute("SELECT node_id FROM nodes WHERE heartbeat_at > ? ORDER BY node_id",
+                                              (time.time() - self.heartbeat_ttl,)).fetchall()
+        return [row[0] for row in rows]
+
+    def lease(self, node_id: str, limit: int = 1) -> List[Job]:
+        """
+        Leases up to limit jobs owned by the node on the current ring
+
+        Args:
+            node_id: The leasing node, which must be sending heartbeats
+            limit: Maximum number of jobs leased
+
+        Returns:
+            The leased jobs, oldest first
+        """
+        ranges = HashRing(self.live_nodes()).ranges_for(node_id)
+        if not ranges:
+            return []
+        # Only the jobs of the node's part of the ring are scanned, jobs of other nodes never fill the scan
+        owned, params = [], []
+        for low, high in ranges:
+            bounds = ([("key_hash >= ?", low)] if low is not None else []) + ([("key_hash < ?", high)] if high is not None else [])
+            owned.append(" AND ".join(condition for condition, _ in bounds))
+            params.extend(value for _, value in bounds)
+        now = time.time()
+        leased = []
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"""SELECT id, key, event, payload, attempts, progress FROM jobs
+                        WHERE (status = 'queued' OR (status = 'leased' AND lease_expires < ?))
+                        AND (({") OR (".join(owned)}))
+                        ORDER BY id LIMIT ?""", (now, *params, LEASE_SCAN_LIMIT)).fetchall()
+                for job_id, key, event, payload, attempts, progress in rows:
+                    if len(leased) >= limit:
+                        break
+                    if attempts >= self.max_attempts:
+                        conn.execute("UPDATE jobs SET status = 'failed', owner = NULL, updated_at = ? WHERE id = ?", (now, job_id))
+                        log_error(f"Job {job_id} failed after {attempts} leases")
+                        continue
+                    conn.execute("""UPDATE jobs SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1,
+                                    updated_at = ? WHERE id = ?""", (node_id, now + self.visibility_timeout, now, job_id))
+                    leased.append(Job(job_id, key, event, json.loads(payload), attempts + 1, node_id, json.loads(progress or "{}")))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if leased:
+            metrics.increment("job_queue_leased_total", len(leased))
+        return leased
+
+    def renew(self, job_id: int, node_id: str) -> bool:
+        """Extends the lease of a job; False if the node no longer holds it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (now + self.visibility_timeout, now, job_id, node_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, node_id: str) -> bool:
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET status = 'done', owner = NULL, updated_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (time.time(), job_id, node_id))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, node_id: str, error: str) -> bool:
+        """Returns the job to the queue to be retried, up to max_attempts leases."""
+        with self._lock:
+            cursor = self._connection().execute(
+                """UPDATE jobs SET status = 'queued', owner = NULL, lease_expires = NULL, error = ?, updated_at = ?
+                   WHERE id = ? AND owner = ? AND status = 'leased'""", (error, time.time(), job_id, node_id))
+        return cursor.rowcount == 1
+
+    def save_progress(self, job: Job) -> bool:
+        """Stores job.progress for the later attempts of the job; False if the node no longer holds it."""
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (json.dumps(job.progress), time.time(), job.id, job.owner))
+        return cursor.rowcount == 1
+
+    def prune(self, retention_seconds: float = JOB_RETENTION_SECONDS) -> int:
+        """Deletes the done and failed jobs finished more than retention_seconds ago and returns how many."""
+        cutoff = time.time() - retention_seconds
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class QueueWorker:
+    """
+    Runs the jobs a node leases on a pool of threads, sending heartbeats and renewing the leases of
+    running jobs from a background thread
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Job], None], node_id: str = NODE_ID, concurrency: int = 2,
+                 poll_interval: float = 1.0):
+        """
+        Args:
+            queue: The shared job queue
+            handler: Runs a job, raising on failure
+            node_id: Identifier of this node on the hash ring
+            concurrency: Jobs run at the same time
+            poll_interval: Seconds between lease attempts when idle
+        """
+        self.queue = queue
+        self.handler = handler
+        self.node_id = node_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._running: Dict[int, Job] = {}
+        self._running_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _keep_alive(self):
+        # Heartbeats and renewals well within their timeouts
+        interval = min(self.queue.heartbeat_ttl, self.queue.visibility_timeout) / 3
+        pruned_at = 0.0
+        while not self._stop.wait(interval):
+            self.queue.heartbeat(self.node_id)
+            if time.monotonic() - pruned_at > PRUNE_INTERVAL:
+                pruned_at = time.monotonic()
+                self.queue.prune()
+            with self._running_lock:
+                running = list(self._running)
+            for job_id in running:
+                if not self.queue.renew(job_id, self.node_id):
+                    log_error(f"Lost the lease of job {job_id}, it may run again on another node")
+
+    def _run(self, job: Job):
+        try:
+            with log_context(job=job.id, shard=job.key):
+                self.handler(job)
+            self.queue.complete(job.id, self.node_id)
+        except Exception as error:
+            log_error(f"Job {job.id} failed", error)
+            self.queue.fail(job.id, self.node_id, str(error))
+        finally:
+            with self._running_lock:
+                self._running.pop(job.id, None)
+
+    def run(self):
+        """Leases and runs jobs until stop() is called, then waits for the running jobs."""
+        self.queue.heartbeat(self.node_id)
+        keep_alive = threading.Thread(target=self._keep_alive, name="job-keep-alive", daemon=True)
+        keep_alive.start()
+        log_info("Node %s consuming jobs with %d threads", self.node_id, self.concurrency)
+        threads = []
+        try:
+            while not self._stop.is_set():
+                with self._running_lock:
+                    free = self.concurrency - len(self._running)
+                jobs = self.queue.lease(self.node_id, free) if free > 0 else []
+                for job in jobs:
+                    with self._running_lock:
+                        self._running[job.id] = job
+                    thread = threading.Thread(target=self._run, args=(job,), name=f"job-{job.id}")
+                    thread.start()
+                    threads.append(thread)
+                threads = [t for t in threads if t.is_alive()]
+                if not jobs:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            for thread in threads:
+                thread.join()
+            self._stop.set()
+            self.queue.leave(self.node_id)
+            log_info("Node %s stopped consuming jobs", self.node_id)
+
+    def stop(self):
+        self._stop.set()
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Type
+from pydantic import BaseModel, ValidationError
+from config.constants import PROJECT_ROOT
+from utils import metrics
+from utils.logging_utils import log_error
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, ".cache", "llm_cache.sqlite3"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() in ("true", "1")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+LLM_CACHE_BYPASS_TASKS = [t.strip() for t in os.getenv("LLM_CACHE_BYPASS_TASKS", "").split(",") if t.strip()]
+
+
+def canonicalize_messages(messages) -> str:
+    """
+    Renders chat messages into a canonical JSON string so that equivalent prompts hash identically.
+    Line endings and trailing whitespace are normalized.
+    """
+    canonical = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content, sort_keys=True)
+        content = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").split("\n")).strip()
+        canonical.append({"role": message.type, "content": content})
+    return json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def schema_version(output_model: Type[BaseModel]) -> str:
+    """Short hash of the output model's JSON schema, so cached outputs are invalidated when the model changes."""
+    schema = json.dumps(output_model.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:12]
+
+
+def make_cache_key(task_name: str, backend: str, model: str, version: str, messages) -> str:
+    """
+    Builds the cache key from (task name, backend, model, output schema version, canonical prompt hash).
+    The backend keeps the outputs of local backends (fake, replay, recording) apart from real provider ones.
+    """
+    prompt_hash = hashlib.sha256(canonicalize_messages(messages).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{task_name}\0{backend}\0{model}\0{version}\0{prompt_hash}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Disk-backed cache of validated structured LLM outputs with TTL and size-based eviction."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, bypass_tasks: Iterable[str] = ()):
+        """
+        Args:
+            path: SQLite file backing the cache (":memory:" for a process-local cache).
+            ttl_seconds: Entries older than this are treated as misses and removed.
+            max_entries: Least recently used entries are evicted above this size.
+            bypass_tasks: Task names that should never read or write the cache.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bypass_tasks = set(bypass_tasks)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                task TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+
+    def bypass(self, task_name: str, enabled: bool = True):
+        """Turn cache bypass on or off for a task."""
+        if enabled:
+            self.bypass_tasks.add(task_name)
+        else:
+            self.bypass_tasks.discard(task_name)
+
+    def is_bypassed(self, task_name: str) -> bool:
+        return task_name in self.bypass_tasks
+
+    def get(self, task_name: str, key: str, output_model: Type[BaseModel]) -> Optional[BaseModel]:
+        """Returns the cached output for the key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                row = None
+            if row:
+                with self._conn:
+                    self._conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        if row is None:
+            metrics.increment("llm_cache_misses_total", task=task_name)
+            return None
+        try:
+            response = output_model.model_validate_json(row[0])
+        except ValidationError as e:
+            log_error(f"Discarding invalid cached response for task '{task_name}'", e)
+            self.delete(key)
+            metrics.increment("llm_cache_misses_total", task=task_name)
+            return None
+        metrics.increment("llm_cache_hits_total", task=task_name)
+        return response
+
+    def set(self, task_name: str, key: str, response: BaseModel, output_model: Type[BaseModel]):
+        """Validates the response against the output model and stores it."""
+        validated = response if isinstance(response, output_model) else output_model.model_validate(response)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, task, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, task_name, validated.model_dump_json(), now, now))
+        self.evict()
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+
+    def evict(self):
+        """Removes expired entries, then the least recently used entries above max_entries."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_responses WHERE key IN (SELECT key FROM llm_responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,))
+                metrics.increment("llm_cache_evictions_total", count - self.max_entries)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_responses")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+    def stats(self, task_name: str) -> dict:
+        """Returns hit/miss counts and the hit rate for a task."""
+        hits = metrics.get_counter("llm_cache_hits_total", task=task_name)
+        misses = metrics.get_counter("llm_cache_misses_total", task=task_name)
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """Returns the process-wide response cache, or None when caching is disabled."""
+    global _response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = LLMResponseCache(bypass_tasks=LLM_CACHE_BYPASS_TASKS)
+    return _response_cache
+
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's SQLite connection, it opens its own
+    global _response_cache
+    _response_cache = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
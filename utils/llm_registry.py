@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Dict, Type
+import httpx
+from pydantic import BaseModel
+from utils.llm_cache import get_response_cache
+from utils.llm_resilience import ResilientCaller
+from utils.llm_utils import LLMHandler, build_task_config
+from utils.logging_utils import log_error
+
+# Connection pool shared by every pooled client so TLS sessions are reused between calls
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=300)
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# Backend used when a caller does not ask for one, e.g. LLM_BACKEND=replay with
+# LLM_BACKEND_CONFIG='{"cassette_dir": "cassettes", "latency_ms": [200, 800]}' to run offline
+DEFAULT_LLM_BACKEND = os.getenv("LLM_BACKEND", "ChatOpenAI")
+DEFAULT_BACKEND_CONFIG = json.loads(os.getenv("LLM_BACKEND_CONFIG", "{}"))
+
+_lock = threading.Lock()
+_handlers: Dict[tuple, LLMHandler] = {}
+_task_configs: Dict[str, Dict[str, Any]] = {}
+_http_clients: Dict[str, Any] = {}
+
+
+def _client_key(llm_type: str, model_config: Dict[str, Any]) -> tuple:
+    """Builds the pool key (backend, model, config) for a client."""
+    config = json.dumps(model_config, sort_keys=True, default=repr)
+    return (llm_type, model_config.get("model"), config)
+
+
+def get_http_clients():
+    """
+    Returns the process-wide keep-alive HTTP clients (sync and async), creating them on first use.
+    """
+    if not _http_clients:
+        with _lock:
+            if not _http_clients:
+                _http_clients["async"] = httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+                _http_clients["sync"] = httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+    return _http_clients["sync"], _http_clients["async"]
+
+
+def register_task(task_name: str, prompt_template: str, input_model: Type[BaseModel], output_model: Type[BaseModel], **kwargs):
+    """
+    Registers a task configuration once for every pooled handler.
+    Args:
+        task_name (str): The name of the task.
+        prompt_template (str): The prompt template for the task.
+        input_model (Type[BaseModel]): Pydantic model for input data validation.
+        output_model (Type[BaseModel]): Pydantic model for output data validation.
+        **kwargs: Any additional task-specific parameters.
+    """
+    task_config = build_task_config(prompt_template, input_model, output_model, **kwargs)
+    with _lock:
+        _task_configs[task_name] = task_config
+
+
+def get_task_config(task_name: str) -> Dict[str, Any]:
+    """Returns the registered configuration for a task, or None if it is unknown."""
+    return _task_configs.get(task_name)
+
+
+def get_llm_handler(llm_type: str = None, model_config: Dict[str, Any] = None) -> LLMHandler:
+    """
+    Returns the pooled handler for the given backend and model configuration, creating it on first use.
+    Handlers share the registered task configurations, the keep-alive HTTP clients and the response cache.
+    Each handler has its own circuit breaker, so one unhealthy backend or model does not block the others.
+    Args:
+        llm_type (str): Backend to use (e.g., ChatOpenAI), defaults to DEFAULT_LLM_BACKEND.
+        model_config (dict): Configuration options for the selected LLM, merged over DEFAULT_BACKEND_CONFIG.
+    """
+    llm_type = llm_type or DEFAULT_LLM_BACKEND
+    model_config = {**DEFAULT_BACKEND_CONFIG, **(model_config or {})}
+    key = _client_key(llm_type, model_config)
+    handler = _handlers.get(key)
+    if handler is not None:
+        return handler
+
+    if 'ChatOpenAI' in (llm_type, model_config.get("inner_backend")):
+        http_client, http_async_client = get_http_clients()
+        model_config.setdefault("http_client", http_client)
+        model_config.setdefault("http_async_client", http_async_client)
+
+    with _lock:
+        handler = _handlers.get(key)
+        if handler is None:
+            handler = LLMHandler(llm_type=llm_type, model_config=model_config, task_config=_task_configs,
+                                 response_cache=get_response_cache(),
+                                 resilience=ResilientCaller(f"{llm_type}/{model_config.get('model')}"))
+            _handlers[key] = handler
+    return handler
+
+
+def clear_registry():
+    """Drops every pooled handler and closes the shared HTTP clients."""
+    with _lock:
+        _handlers.clear()
+        sync_client = _http_clients.pop("sync", None)
+        async_client = _http_clients.pop("async", None)
+    if sync_client is not None:
+        sync_client.close()
+    if async_client is not None:
+        _close_async_client(async_client)
+
+
+def _close_async_client(client: httpx.AsyncClient):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Called from async code: close on its loop without blocking it
+        loop.create_task(client.aclose())
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception as error:
+        # Connections opened on an event loop that has since closed cannot be shut down cleanly
+        log_error("Error closing the async HTTP client", error)
@@ -0,0 +1,282 @@
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+from utils import metrics, tracing
+from utils.logging_utils import log_info, log_error
+
+# Provider errors worth retrying, matched by class name so the provider SDKs stay optional
+RETRYABLE_ERROR_NAMES = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+                         "ServiceUnavailableError", "Timeout", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError"}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a task's deadline passes before the LLM answered"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the LLM while the circuit breaker is open"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code == 429 or (isinstance(status_code, int) and status_code >= 500)
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def backoff(self, attempt: int, rng: random.Random) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry attempt"""
+        return rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+@dataclass
+class TaskPolicy:
+    deadline: float = 120.0  # seconds for the whole call, retries included
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    hedge: bool = False  # send a duplicate request once the call is slower than the task's p95
+
+
+TASK_POLICIES = {
+    "summarize_pr": TaskPolicy(deadline=240, hedge=True),
+    "review_shard": TaskPolicy(deadline=180, hedge=True),
+    "review_reduce": TaskPolicy(deadline=90, hedge=True),
+    "test_gating": TaskPolicy(deadline=90, hedge=True),
+    "test_update": TaskPolicy(deadline=300),
+    "fix_test": TaskPolicy(deadline=180),
+}
+DEFAULT_TASK_POLICY = TaskPolicy()
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per task"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, task_name: str, seconds: float):
+        with self._lock:
+            self._samples[task_name].append(seconds)
+
+    def percentile(self, task_name: str, q: float) -> Optional[float]:
+        """Returns the q-quantile latency, or None until enough samples were recorded."""
+        with self._lock:
+            samples = sorted(self._samples[task_name])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout` seconds,
+    then lets a single trial call through (half-open) to decide whether to close again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            log_info("Circuit breaker '%s' is now %s", self.name, state)
+            metrics.increment("llm_circuit_transitions_total", breaker=self.name, state=state)
+            self.state = state
+
+    def allow(self):
+        """Raises CircuitOpenError if calls should not reach the backend right now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+                self._trial_in_flight = False
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_in_flight):
+                metrics.increment("llm_circuit_rejections_total", breaker=self.name)
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+# Threads for deadline-bound and hedged sync calls. A call that misses its deadline keeps its
+# thread until the HTTP client's own timeout fires, but nobody waits for it anymore.
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+class ResilientCaller:
+    """Runs LLM calls under per-task deadlines, jittered retries, optional hedging and a circuit breaker"""
+
+    def __init__(self, name: str, policies: Dict[str, TaskPolicy] = None, breaker: CircuitBreaker = None,
+                 tracker: LatencyTracker = None, hedge_quantile: float = 0.95, seed: int = None):
+        """
+        Args:
+            name: Name used for the breaker and metrics (e.g. "ChatOpenAI/gpt-4o-mini")
+            policies: Task policies, defaults to TASK_POLICIES
+            breaker: Circuit breaker shared by every task of this caller
+            tracker: Latency tracker that drives hedging
+            hedge_quantile: Latency quantile after which a duplicate request is sent
+            seed: Seed for the retry jitter
+        """
+        self.name = name
+        self.policies = TASK_POLICIES if policies is None else policies
+        self.breaker = breaker or CircuitBreaker(name)
+        self.tracker = tracker or LatencyTracker()
+        self.hedge_quantile = hedge_quantile
+        self._rng = random.Random(seed)
+
+    def policy(self, task_name: str) -> TaskPolicy:
+        return self.policies.get(task_name, DEFAULT_TASK_POLICY)
+
+    def _hedge_delay(self, task_name: str, policy: TaskPolicy) -> Optional[float]:
+        return self.tracker.percentile(task_name, self.hedge_quantile) if policy.hedge else None
+
+    def _record_outcome(self, task_name: str, error: Optional[BaseException], started: float):
+        if error is None:
+            self.breaker.record_success()
+            self.tracker.record(task_name, time.monotonic() - started)
+            metrics.increment("llm_requests_total", task=task_name, outcome="success")
+            return
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # The backend answered (e.g. with output that failed validation), so it is healthy
+            self.breaker.record_success()
+        outcome = "deadline" if isinstance(error, DeadlineExceeded) else type(error).__name__
+        metrics.increment("llm_requests_total", task=task_name, outcome=outcome)
+
+    def call(self, task_name: str, fn: Callable[[], object]):
+        """Calls fn() (a blocking LLM request) under the task's policy and returns its result."""
+        policy = self.policy(task_name)
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(policy.retry.max_attempts):
+            self.breaker.allow()
+            started = time.monotonic()
+            try:
+                result = self._call_hedged(task_name, fn, deadline - started, self._hedge_delay(task_name, policy))
+                self._record_outcome(task_name, None, started)
+                return result
+            except Exception as error:
+                self._record_outcome(task_name, error, started)
+                delay = self._retry_delay(task_name, policy, attempt, error, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def acall(self, task_name: str, fn: Callable[[], Awaitable[object]]):
+        """Async variant of call; fn() returns a fresh awaitable for each attempt."""
+        policy = self.policy(task_name)
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(policy.retry.max_attempts):
+            self.breaker.allow()
+            started = time.monotonic()
+            try:
+                result = await self._acall_hedged(task_name, fn, deadline - started, self._hedge_delay(task_name, policy))
+                self._record_outcome(task_name, None, started)
+                return result
+            except Exception as error:
+                self._record_outcome(task_name, error, started)
+                delay = self._retry_delay(task_name, policy, attempt, error, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, task_name: str, policy: TaskPolicy, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """Returns how long to wait before the next attempt, or None if the error should be raised."""
+        if not is_retryable(error) or isinstance(error, DeadlineExceeded) or attempt + 1 >= policy.retry.max_attempts:
+            return None
+        delay = policy.retry.backoff(attempt, self._rng)
+        if time.monotonic() + delay >= deadline:
+            return None
+        log_error(f"Retrying '{task_name}' after {type(error).__name__} (attempt {attempt + 1})", error)
+        metrics.increment("llm_retries_total", task=task_name)
+        return delay
+
+    def _call_hedged(self, task_name: str, fn, timeout: float, hedge_after: Optional[float]):
+        if timeout <= 0:
+            raise DeadlineExceeded(f"Deadline for '{task_name}' exceeded")
+        end = time.monotonic() + timeout
+        futures = [_executor.submit(tracing.wrap(fn))]
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                metrics.increment("llm_hedged_requests_total", task=task_name)
+                futures.append(_executor.submit(tracing.wrap(fn)))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.increment("llm_deadline_exceeded_total", task=task_name)
+                raise DeadlineExceeded(f"Deadline for '{task_name}' exceeded")
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        metrics.increment("llm_hedge_wins_total", task=task_name)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _acall_hedged(self, task_name: str, fn, timeout: float, hedge_after: Optional[float]):
+        if timeout <= 0:
+            raise DeadlineExceeded(f"Deadline for '{task_name}' exceeded")
+        end = time.monotonic() + timeout
+        tasks = [asyncio.ensure_future(fn())]
+        try:
+            if hedge_after is not None and hedge_after < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                if not done:
+                    metrics.increment("llm_hedged_requests_total", task=task_name)
+                    tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.increment("llm_deadline_exceeded_total", task=task_name)
+                    raise DeadlineExceeded(f"Deadline for '{task_name}' exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1 and task is tasks[1]:
+                            metrics.increment("llm_hedge_wins_total", task=task_name)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -1,44 +1,60 @@
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
 from pydantic import BaseModel, ValidationError
-from typing import Any, Dict, Type
-import os
-from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Type
+import threading
+import time
+from utils import metrics, tracing
+from utils.context_packer import count_tokens
+from utils.llm_backends import create_llm
+from utils.llm_cache import make_cache_key, schema_version
+from utils.prompt_serializer import CompiledTemplate, serialize_input
 
-load_dotenv()
 
-OPENAI_API_KEY= os.getenv("OPENAI_API_KEY")
-MODEL_API_KEYS = {
-    "ChatOpenAI": OPENAI_API_KEY
-}
+def build_task_config(prompt_template: str, input_model: Type[BaseModel], output_model: Type[BaseModel], **kwargs) -> Dict[str, Any]:
+    """
+    Builds a task configuration, compiling the prompt template once so it can be reused across calls.
+    Args:
+        prompt_template (str): The prompt template for the task.
+        input_model (Type[BaseModel]): Pydantic model for input data validation.
+        output_model (Type[BaseModel]): Pydantic model for output data validation.
+        **kwargs: Any additional task-specific parameters.
+    """
+    return {
+        'prompt_template': prompt_template,
+        'prompt': CompiledTemplate(prompt_template),
+        'input_model': input_model,
+        'output_model': output_model,
+        'schema_version': schema_version(output_model),
+        **kwargs
+    }
 
 
 class LLMHandler:
-    def __init__(self, llm_type='ChatOpenAI', model_config=None, task_config=None):
+    def __init__(self, llm_type='ChatOpenAI', model_config=None, task_config=None, llm=None, response_cache=None, resilience=None):
         """
         Initialize the LLMHandler with a specific LLM type (Chat-based), model configuration, and task configuration.
         Args:
             llm_type (str): Type of the LLM to use (e.g., ChatOpenAI).
             model_config (dict): Configuration options for the selected LLM.
             task_config (dict): Configuration for task-specific behavior, such as prompts and data types.
+            llm: An already constructed LLM client to use instead of building a new one.
+            response_cache (LLMResponseCache): Cache of structured outputs; tasks registered with cache=False skip it.
+            resilience (ResilientCaller): Applies deadlines, retries, hedging and the circuit breaker to LLM calls.
         """
         self.llm_type = llm_type
         self.model_config = model_config or {}
-        self.task_config = task_config or {}
-        self.llm = self.initialize_llm()
+        self.task_config = task_config if task_config is not None else {}
+        self.llm = llm or self.initialize_llm()
+        self.response_cache = response_cache
+        self.resilience = resilience
+        self._structured_llms = {}
+        self._structured_lock = threading.Lock()
 
     def initialize_llm(self):
         """
-        Initializes the LLM based on the chosen type and configuration.
+        Initializes the LLM with the backend registered for the chosen type (see utils.llm_backends).
         """
-        if "api_key" not in self.model_config:
-            self.model_config["api_key"]= MODEL_API_KEYS[self.llm_type]
-
-        if self.llm_type == 'ChatOpenAI':
-            return ChatOpenAI(**self.model_config)
-        else:
-            raise ValueError(f"Unsupported LLM type: {self.llm_type}")
+        return create_llm(self.llm_type, self.model_config)
 
     def set_task_config(self, task_name: str, prompt_template: str, input_model: Type[BaseModel], output_model: Type[BaseModel], **kwargs):
         """
@@ -50,20 +66,40 @@ class LLMHandler:
             output_model (Type[BaseModel]): Pydantic model for output data validation.
             **kwargs: Any additional task-specific parameters.
         """
-        self.task_config[task_name] = {
-            'prompt_template': prompt_template,
-            'input_model': input_model,
-            'output_model': output_model,
-            **kwargs
-        }
+        self.task_config[task_name] = build_task_config(prompt_template, input_model, output_model, **kwargs)
 
-    def generate_response(self, task_name: str, conversation_history: list = None, **input_data: Dict[str, Any]) -> str:
+    def get_structured_llm(self, output_model: Type[BaseModel], streaming: bool = False):
         """
-        Generates a response for the given task using the configured LLM, ensuring input/output typing.
+        Returns the LLM bound to the given output model, binding it only on first use.
+        Args:
+            output_model (Type[BaseModel]): Pydantic model the response should be parsed into.
+            streaming (bool): Bind to the model's JSON schema instead, so streamed chunks are parsed into partial dicts.
+        OpenAI models are bound with include_raw, so the provider's token usage can be recorded (see unwrap_response).
+        """
+        key = (output_model, streaming)
+        structured_llm = self._structured_llms.get(key)
+        if structured_llm is None:
+            with self._structured_lock:
+                structured_llm = self._structured_llms.get(key)
+                if structured_llm is None:
+                    if streaming:
+                        structured_llm = self.llm.with_structured_output(output_model.model_json_schema())
+                    elif self.llm_type == 'ChatOpenAI':
+                        structured_llm = self.llm.with_structured_output(output_model, include_raw=True)
+                    else:
+                        structured_llm = self.llm.with_structured_output(output_model)
+                    self._structured_llms[key] = structured_llm
+        return structured_llm
+
+    def prepare_request(self, task_name: str, conversation_history: list = None, **input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validates the input and builds the messages for a task, looking the request up in the response cache.
         Args:
             task_name (str): The name of the task for which a response should be generated.
             conversation_history (list): List of previous messages in the conversation (if any).
             **input_data: Data to be fed into the LLM for generating the response.
+        Returns:
+            dict with the output model, messages, cache key and the cached response (if any).
         """
         task_details = self.task_config.get(task_name)
         if not task_details:
@@ -82,9 +118,9 @@ class LLMHandler:
         except ValidationError as e:
             raise ValueError(f"Invalid input data for task '{task_name}': {e}")
 
-        # Construct the prompt using the input data
-        prompt = PromptTemplate(template=prompt_template, input_variables=input_data.keys())
-        formatted_prompt = prompt.format(**input_data)
+        # Construct the prompt from the compactly serialized input
+        prompt = task_details.get('prompt') or CompiledTemplate(prompt_template)
+        formatted_prompt = prompt.render(**serialize_input(validated_input))
 
         # Create messages for chat-based models
         messages = [SystemMessage(content="You are a helpful assistant.")]
@@ -93,15 +129,187 @@ class LLMHandler:
         
         messages.append(HumanMessage(content=formatted_prompt))
 
-        # Get response from the LLM (ChatOpenAI)
-        structured_llm = self.llm.with_structured_output(output_model)
-        response = structured_llm.invoke(messages)
+        # Serve identical requests from the response cache
+        cache_key = None
+        cached_response = None
+        if self.response_cache is not None and task_details.get('cache', True) and not self.response_cache.is_bypassed(task_name):
+            cache_key = make_cache_key(task_name, self.llm_type, self.model_config.get("model"), task_details['schema_version'], messages)
+            cached_response = self.response_cache.get(task_name, cache_key, output_model)
 
-        # Validate the output using the output model
-        # try:
-        #     validated_output = output_model(**response)
-        # except ValidationError as e:
-        #     raise ValueError(f"Invalid output data from task '{task_name}': {e}")
+        return {
+            'output_model': output_model,
+            'messages': messages,
+            'cache_key': cache_key,
+            'cached_response': cached_response,
+        }
+
+    def finish_response(self, task_name: str, request: Dict[str, Any], response):
+        """
+        Stores a fresh response in the response cache and returns it.
+        Args:
+            task_name (str): The name of the task the response was generated for.
+            request (dict): The prepared request from prepare_request.
+            response: The structured response from the LLM.
+        """
+        if request['cache_key'] is not None:
+            self.response_cache.set(task_name, request['cache_key'], response, request['output_model'])
 
         # Return the response text (or process as needed)
         return response
+
+    @staticmethod
+    def unwrap_response(response):
+        """
+        Splits a response bound with include_raw into the parsed output and the raw message.
+        Returns:
+            Tuple of (parsed output, raw message or None).
+        """
+        if isinstance(response, dict) and "parsed" in response and "raw" in response:
+            if response.get("parsing_error") is not None:
+                raise response["parsing_error"]
+            return response["parsed"], response["raw"]
+        return response, None
+
+    def record_usage(self, task_name: str, request: Dict[str, Any], latency: float, response=None, raw=None):
+        """
+        Records the latency and token usage of an LLM call. Token counts come from the provider's usage
+        metadata when the backend returns it and are estimated from the messages and the output otherwise.
+        Args:
+            task_name (str): The name of the task the call was made for.
+            request (dict): The prepared request from prepare_request.
+            latency (float): Seconds the call took.
+            response: The structured response, or None if the call failed.
+            raw: The raw message with usage metadata, if available.
+        """
+        model = self.model_config.get("model") or self.llm_type
+        metrics.observe("llm_request_seconds", latency, task=task_name, model=model, outcome="ok" if response is not None else "error")
+        if response is None:
+            tracing.add_span("llm", latency, task=task_name, model=model, outcome="error")
+            return
+        usage = getattr(raw, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens") or sum(count_tokens(m.content) for m in request['messages'])
+        if usage.get("output_tokens"):
+            completion_tokens = usage["output_tokens"]
+        else:
+            completion_tokens = count_tokens(response.model_dump_json() if isinstance(response, BaseModel) else str(response))
+        metrics.increment("llm_prompt_tokens_total", prompt_tokens, task=task_name, model=model)
+        metrics.increment("llm_completion_tokens_total", completion_tokens, task=task_name, model=model)
+        tracing.add_span("llm", latency, task=task_name, model=model, outcome="ok",
+                         prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def generate_response(self, task_name: str, conversation_history: list = None, **input_data: Dict[str, Any]) -> str:
+        """
+        Generates a response for the given task using the configured LLM, ensuring input/output typing.
+        Args:
+            task_name (str): The name of the task for which a response should be generated.
+            conversation_history (list): List of previous messages in the conversation (if any).
+            **input_data: Data to be fed into the LLM for generating the response.
+        """
+        request = self.prepare_request(task_name, conversation_history, **input_data)
+        if request['cached_response'] is not None:
+            return request['cached_response']
+
+        # Get response from the LLM (ChatOpenAI)
+        structured_llm = self.get_structured_llm(request['output_model'])
+        started = time.perf_counter()
+        try:
+            if self.resilience is not None:
+                response = self.resilience.call(task_name, lambda: structured_llm.invoke(request['messages']))
+            else:
+                response = structured_llm.invoke(request['messages'])
+            response, raw = self.unwrap_response(response)
+        except Exception:
+            self.record_usage(task_name, request, time.perf_counter() - started)
+            raise
+        self.record_usage(task_name, request, time.perf_counter() - started, response, raw)
+        return self.finish_response(task_name, request, response)
+
+    async def agenerate_response(self, task_name: str, conversation_history: list = None, **input_data: Dict[str, Any]):
+        """
+        Async variant of generate_response, using the LLM's async invoke so independent calls can overlap.
+        Args:
+            task_name (str): The name of the task for which a response should be generated.
+            conversation_history (list): List of previous messages in the conversation (if any).
+            **input_data: Data to be fed into the LLM for generating the response.
+        """
+        request = self.prepare_request(task_name, conversation_history, **input_data)
+        if request['cached_response'] is not None:
+            return request['cached_response']
+
+        structured_llm = self.get_structured_llm(request['output_model'])
+        started = time.perf_counter()
+        try:
+            if self.resilience is not None:
+                response = await self.resilience.acall(task_name, lambda: structured_llm.ainvoke(request['messages']))
+            else:
+                response = await structured_llm.ainvoke(request['messages'])
+            response, raw = self.unwrap_response(response)
+        except Exception:
+            self.record_usage(task_name, request, time.perf_counter() - started)
+            raise
+        self.record_usage(task_name, request, time.perf_counter() - started, response, raw)
+        return self.finish_response(task_name, request, response)
+
+    def stream_response(self, task_name: str, on_partial: Callable[[Dict[str, Any]], None], conversation_history: list = None, **input_data: Dict[str, Any]):
+        """
+        Generates a response while streaming it, calling on_partial with the partially parsed output as it arrives.
+        Args:
+            task_name (str): The name of the task for which a response should be generated.
+            on_partial (Callable): Called with a dict holding every field parsed so far.
+            conversation_history (list): List of previous messages in the conversation (if any).
+            **input_data: Data to be fed into the LLM for generating the response.
+        Returns:
+            The complete response, validated with the task's output model.
+        """
+        request = self.prepare_request(task_name, conversation_history, **input_data)
+        if request['cached_response'] is not None:
+            return request['cached_response']
+
+        # Partial output is already visible, so streams are not retried, but they respect the circuit breaker
+        if self.resilience is not None:
+            self.resilience.breaker.allow()
+        structured_llm = self.get_structured_llm(request['output_model'], streaming=True)
+        partial = None
+        started = time.perf_counter()
+        try:
+            for partial in structured_llm.stream(request['messages']):
+                if partial:
+                    on_partial(partial)
+        except Exception:
+            self.record_usage(task_name, request, time.perf_counter() - started)
+            if self.resilience is not None:
+                self.resilience.breaker.record_failure()
+            raise
+        if self.resilience is not None:
+            self.resilience.breaker.record_success()
+        response = request['output_model'].model_validate(partial or {})
+        self.record_usage(task_name, request, time.perf_counter() - started, response)
+        return self.finish_response(task_name, request, response)
+
+    async def astream_response(self, task_name: str, on_partial: Callable[[Dict[str, Any]], None], conversation_history: list = None, **input_data: Dict[str, Any]):
+        """
+        Async variant of stream_response.
+        """
+        request = self.prepare_request(task_name, conversation_history, **input_data)
+        if request['cached_response'] is not None:
+            return request['cached_response']
+
+        if self.resilience is not None:
+            self.resilience.breaker.allow()
+        structured_llm = self.get_structured_llm(request['output_model'], streaming=True)
+        partial = None
+        started = time.perf_counter()
+        try:
+            async for partial in structured_llm.astream(request['messages']):
+                if partial:
+                    on_partial(partial)
+        except Exception:
+            self.record_usage(task_name, request, time.perf_counter() - started)
+            if self.resilience is not None:
+                self.resilience.breaker.record_failure()
+            raise
+        if self.resilience is not None:
+            self.resilience.breaker.record_success()
+        response = request['output_model'].model_validate(partial or {})
+        self.record_usage(task_name, request, time.perf_counter() - started, response)
+        return self.finish_response(task_name, request, response)
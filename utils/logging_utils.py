@@ -1,16 +1,206 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", 4000))
+# At most LOG_RATE_LIMIT records per message template and level in each window; errors are never sampled
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW_SECONDS = float(os.getenv("LOG_RATE_WINDOW_SECONDS", 10))
 
-def log_info(message: str):
-    """Log an info message."""
-    logging.info(message)
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 
-def log_debug(message: str):
-    """Log a debug message."""
-    logging.debug(message)
+_log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Adds fields (e.g. repo, pr, stage) to every record logged in this context, including its tasks and threads."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def truncate(text: str, limit: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    """Caps the size of a logged payload, keeping its beginning."""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class ContextFilter(logging.Filter):
+    """Attaches the logging context of the calling thread or task to the record"""
+
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Samples noisy messages: records sharing a message template and level beyond `limit` per window
+    are dropped, and the next record let through carries the number that was suppressed.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW_SECONDS):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._windows: Dict[tuple, list] = {}  # key -> [window start, count, suppressed]
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._windows) >= self.MAX_KEYS:
+                    self._windows.clear()
+                suppressed = state[2] if state is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the logging context as top-level fields"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "context", None) or {})
+        if getattr(record, "suppressed", 0):
+            data["suppressed"] = record.suppressed
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The plain text format, followed by the logging context"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = dict(getattr(record, "context", None) or {})
+        if getattr(record, "suppressed", 0):
+            fields["suppressed"] = record.suppressed
+        if fields:
+            text += " [" + " ".join(f"{k}={v}" for k, v in fields.items()) + "]"
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background listener thread. Messages are formatted and truncated in the
+    calling thread; when the queue is full the record is dropped rather than blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_message_chars: int = LOG_MAX_MESSAGE_CHARS):
+        super().__init__(log_queue)
+        self.max_message_chars = max_message_chars
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = record.message = truncate(record.msg, self.max_message_chars)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+_config = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None):
+    """
+    Routes the root logger through a bounded queue drained by a listener thread, replacing the
+    handler of a previous call.
+
+    Args:
+        level: Minimum level logged
+        fmt: "json" for structured records, "text" for the plain format
+        stream: Destination of the records, defaults to stderr
+    """
+    global _handler, _listener, _config
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _config = (level, fmt, stream)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(RateLimitFilter())
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _listener.start()
+
+
+def stop_logging():
+    """Writes out the queued records and stops the listener thread. Runs at exit."""
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    """The listener thread does not survive fork, so forked workers start their own queue and listener."""
+    global _listener
+    _listener = None
+    configure_logging(*_config)
+
+
+configure_logging()
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def log_info(message: str, *args):
+    """Log an info message. Arguments are %-formatted only if the record is emitted."""
+    logging.info(message, *args)
+
+def log_debug(message: str, *args):
+    """Log a debug message. Arguments are %-formatted only if the record is emitted."""
+    logging.debug(message, *args)
 
 def log_error(message: str, error: Exception = None):
     """Log an error message."""
-    logging.error(f"{message}: {error}")
+    logging.error(message if error is None else f"{message}: {error}")
@@ -0,0 +1,150 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+_histograms: Dict[Tuple[str, tuple], "_Histogram"] = {}
+
+# Latency buckets in seconds, from fast GitHub calls to long LLM and pytest runs
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+def _label_key(labels: Dict[str, str]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Increment a counter, optionally qualified by labels (e.g. task="summarize_pr")."""
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] += value
+
+
+def get_counter(name: str, **labels) -> float:
+    """Return the current value of a counter."""
+    return _counters.get((name, _label_key(labels)), 0)
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+    """Record a value (e.g. a latency in seconds) in a histogram."""
+    key = (name, _label_key(labels))
+    index = bisect_left(buckets, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(buckets)
+        if index < len(buckets):
+            histogram.counts[index] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+
+def get_histogram(name: str, **labels) -> Dict[str, float]:
+    """Return the count and sum of a histogram."""
+    histogram = _histograms.get((name, _label_key(labels)))
+    if histogram is None:
+        return {"count": 0, "sum": 0.0}
+    return {"count": histogram.count, "sum": histogram.sum}
+
+
+def timed(name: str, **labels):
+    """
+    Decorator recording the duration of each call of a function or coroutine function in the
+    histogram `name`, with an extra outcome label ("ok" or "error").
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[Tuple[str, tuple], float]:
+    """Return a copy of every counter."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Clear every counter and histogram."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Render every counter and histogram in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in _histograms.items())
+
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), (buckets, counts, total, count) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from config.constants import CONFIG_DIR
+from utils import metrics
+from utils.context_packer import count_tokens
+from utils.logging_utils import log_info, log_error
+
+# JSON file with {"default": {task: [rules]}, "repos": {"owner/repo": {task: [rules]}}}
+MODEL_ROUTING_CONFIG = os.getenv("MODEL_ROUTING_CONFIG", os.path.join(CONFIG_DIR, "model_routing.json"))
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Rules are tried in order and the first one whose limits fit the call wins. A rule without
+# limits matches everything, so each list should end with one.
+DEFAULT_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+    # Deciding whether a handful of small changes needs tests is easy
+    "test_gating": [
+        {"model": "gpt-4.1-nano", "max_tokens": 6000, "max_files": 3},
+        {"model": "gpt-4o-mini", "max_tokens": 100000},
+        {"model": "gpt-4.1-mini"},
+    ],
+    # Single-call reviews stay under review_prompt.SINGLE_CALL_TOKEN_LIMIT, larger PRs are sharded
+    "summarize_pr": [{"model": "gpt-4o-mini"}],
+    # A file over the shard budget gets a shard of its own, and the reduce call sees every analysis
+    # of a huge PR: both can need the larger context window
+    "review_shard": [
+        {"model": "gpt-4o-mini", "max_tokens": 100000},
+        {"model": "gpt-4.1-mini"},
+    ],
+    "review_reduce": [
+        {"model": "gpt-4o-mini", "max_tokens": 100000},
+        {"model": "gpt-4.1-mini"},
+    ],
+    "test_update": [
+        {"model": "gpt-4o-mini", "max_tokens": 100000},
+        {"model": "gpt-4.1-mini"},
+    ],
+    # A fix that failed once is retried with a stronger model
+    "fix_test": [
+        {"model": "gpt-4o-mini", "max_attempt": 1},
+        {"model": "gpt-4o"},
+    ],
+}
+
+# Repository ("owner/repo") the current pull request belongs to, used for per-repo routing
+current_repo: ContextVar[Optional[str]] = ContextVar("current_repo", default=None)
+
+
+@contextmanager
+def repo_context(full_name: str):
+    """Routes the LLM calls made inside the block with the rules of `full_name`."""
+    token = current_repo.set(full_name)
+    try:
+        yield
+    finally:
+        current_repo.reset(token)
+
+
+@dataclass
+class RouteRule:
+    model: str
+    max_tokens: Optional[int] = None
+    max_files: Optional[int] = None
+    max_attempt: Optional[int] = None
+    model_config: Dict[str, Any] = field(default_factory=dict)  # extra options, e.g. temperature
+
+    def matches(self, tokens: int, files: int, attempt: int) -> bool:
+        return ((self.max_tokens is None or tokens <= self.max_tokens)
+                and (self.max_files is None or files <= self.max_files)
+                and (self.max_attempt is None or attempt <= self.max_attempt))
+
+    def describe(self) -> str:
+        limits = [f"{name} {value}" for name, value in (("tokens <=", self.max_tokens), ("files <=", self.max_files),
+                                                         ("attempt <=", self.max_attempt)) if value is not None]
+        return ", ".join(limits) or "fallback"
+
+
+@dataclass
+class ModelRoute:
+    """The model chosen for one call and the inputs the decision was based on"""
+    task_name: str
+    model: str
+    reason: str
+    tokens: int
+    files: int
+    attempt: int
+    repo: Optional[str] = None
+    extra_config: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def model_config(self) -> Dict[str, Any]:
+        return {**self.extra_config, "model": self.model}
+
+    def record_result(self, latency: float, response=None, error: Exception = None):
+        """
+        Logs how the routed call went: latency, prompt tokens and (estimated) completion tokens. The
+        metrics are recorded by llm_utils (llm_request_seconds, llm_*_tokens_total), per task and model.
+        """
+        completion_tokens = 0
+        if isinstance(response, BaseModel):
+            completion_tokens = count_tokens(response.model_dump_json())
+        outcome = "error" if error is not None else "success"
+        log_info("'%s' on %s finished in %.2fs (%s): %d prompt tokens, ~%d completion tokens",
+                 self.task_name, self.model, latency, outcome, self.tokens, completion_tokens)
+
+    @contextmanager
+    def track(self):
+        """
+        Times the calls made inside the block; assign the response to the yielded dict's
+        "response" key to include its size in the log.
+        """
+        result = {}
+        started = time.perf_counter()
+        try:
+            yield result
+        except Exception as error:
+            self.record_result(time.perf_counter() - started, error=error)
+            raise
+        self.record_result(time.perf_counter() - started, result.get("response"))
+
+
+def _parse_rules(rules: List[Dict[str, Any]]) -> List[RouteRule]:
+    return [RouteRule(**rule) for rule in rules]
+
+
+class ModelRouter:
+    """Picks the model for each LLM call from the task, its input size and the retry attempt"""
+
+    def __init__(self, routes: Dict[str, List[Dict[str, Any]]] = None, repo_routes: Dict[str, Dict[str, List[Dict[str, Any]]]] = None,
+                 default_model: str = DEFAULT_MODEL):
+        """
+        Args:
+            routes: Rules per task, merged over DEFAULT_ROUTES
+            repo_routes: Rules per task for specific repositories ("owner/repo"), replacing the task's default rules
+            default_model: Model for tasks without rules
+        """
+        merged = {**DEFAULT_ROUTES, **(routes or {})}
+        self.routes = {task: _parse_rules(rules) for task, rules in merged.items()}
+        self.repo_routes = {repo: {task: _parse_rules(rules) for task, rules in tasks.items()}
+                            for repo, tasks in (repo_routes or {}).items()}
+        self.default_model = default_model
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModelRouter":
+        """Loads the routing configuration from a JSON file, falling back to the defaults if it is missing."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            return cls(config.get("default"), config.get("repos"), config.get("default_model", DEFAULT_MODEL))
+        except (OSError, ValueError, TypeError) as error:
+            log_error(f"Invalid model routing config {path}, using the defaults", error)
+            return cls()
+
+    def rules_for(self, task_name: str, repo: Optional[str] = None) -> List[RouteRule]:
+        if repo and task_name in self.repo_routes.get(repo, {}):
+            return self.repo_routes[repo][task_name]
+        return self.routes.get(task_name, [])
+
+    def route(self, task_name: str, tokens: int, files: int = 0, attempt: int = 1, repo: str = None) -> ModelRoute:
+        """
+        Chooses the model for a call
+
+        Args:
+            task_name: The registered prompt task
+            tokens: Tokens of the packed prompt input
+            files: Number of changed files in the prompt
+            attempt: 1 for the first call, higher for retries of the same work (e.g. test fixes)
+            repo: Repository ("owner/repo"), defaults to the current repo_context
+
+        Returns:
+            ModelRoute with the model and the reason it was picked
+        """
+        repo = repo or current_repo.get()
+        rule = next((r for r in self.rules_for(task_name, repo) if r.matches(tokens, files, attempt)), None)
+        if rule is None:
+            route = ModelRoute(task_name, self.default_model, "no matching rule", tokens, files, attempt, repo)
+        else:
+            route = ModelRoute(task_name, rule.model, rule.describe(), tokens, files, attempt, repo, dict(rule.model_config))
+        log_info("Routing '%s' (%d tokens, %d files, attempt %d%s) to %s: %s",
+                 task_name, tokens, files, attempt, f", repo {repo}" if repo else "", route.model, route.reason)
+        metrics.increment("llm_route_decisions_total", task=task_name, model=route.model)
+        return route
+
+
+def count_input_tokens(*groups) -> int:
+    """Counts the tokens of the text fields of prompt input records (e.g. changed files and tests)."""
+    total = 0
+    for records in groups:
+        for record in records or []:
+            values = record.model_dump().values() if isinstance(record, BaseModel) else [record]
+            total += sum(count_tokens(value) for value in values if isinstance(value, str))
+    return total
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Returns the process-wide router, loading MODEL_ROUTING_CONFIG on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_file(MODEL_ROUTING_CONFIG)
+    return _router
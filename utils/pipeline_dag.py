@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils import metrics, tracing
+from utils.logging_utils import log_context, log_info, log_error
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_SKIPPED = "skipped"
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage. `func` receives a dict with the results of its dependencies and may be a
+    coroutine function (awaited on the loop) or a plain function (run in a worker thread).
+    """
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    always_run: bool = False  # run even when a dependency failed; failed dependencies are missing from the inputs
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str
+    start: float = 0.0
+    end: float = 0.0
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class RunReport:
+    """Outcome of a DAG run with the critical path (the chain of stages that determined the total time)"""
+    results: Dict[str, StageResult]
+    critical_path: List[str] = field(default_factory=list)
+    duration: float = 0.0
+
+    def ok(self, stage_name: str) -> bool:
+        return self.results[stage_name].status == STATUS_OK
+
+    def value(self, stage_name: str, default=None):
+        result = self.results.get(stage_name)
+        return result.value if result and result.status == STATUS_OK else default
+
+    def format_critical_path(self) -> str:
+        return " -> ".join(f"{name} ({self.results[name].duration:.2f}s)" for name in self.critical_path)
+
+
+def _run_in_daemon_thread(func: Callable, *args) -> asyncio.Future:
+    """
+    Runs a blocking function on a new daemon thread and returns a future for its result. Unlike the
+    loop's default executor, which asyncio.run joins before returning, nothing waits for the thread
+    once the future is abandoned, so a stage timeout bounds the run.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = contextvars.copy_context()
+
+    def resolve(value, error):
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def target():
+        value, error = None, None
+        try:
+            value = context.run(func, *args)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(resolve, value, error)
+        except RuntimeError:
+            # The loop has closed since the stage timed out
+            pass
+
+    threading.Thread(target=target, name=f"stage-{getattr(func, '__name__', 'sync')}", daemon=True).start()
+    return future
+
+
+class DAGExecutor:
+    """Runs stages concurrently with asyncio, starting each stage as soon as its dependencies finish"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {unknown}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task], origin: float) -> StageResult:
+        dep_results = [await tasks[dep] for dep in stage.deps]
+        failed = [r.name for r in dep_results if r.status != STATUS_OK]
+        if failed and not stage.always_run:
+            now = time.perf_counter() - origin
+            return StageResult(stage.name, STATUS_SKIPPED, now, now)
+
+        inputs = {r.name: r.value for r in dep_results if r.status == STATUS_OK}
+        start = time.perf_counter() - origin
+        with tracing.span(f"stage:{stage.name}", stage=stage.name) as stage_span, log_context(stage=stage.name):
+            try:
+                if inspect.iscoroutinefunction(stage.func):
+                    call = stage.func(inputs)
+                else:
+                    # After a timeout the thread is abandoned: it may finish in the background, but
+                    # neither the pipeline nor the loop shutdown waits for it
+                    call = _run_in_daemon_thread(stage.func, inputs)
+                value = await asyncio.wait_for(call, timeout=stage.timeout)
+                return StageResult(stage.name, STATUS_OK, start, time.perf_counter() - origin, value)
+            except asyncio.TimeoutError as e:
+                log_error(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+                stage_span.set(outcome=STATUS_TIMEOUT)
+                return StageResult(stage.name, STATUS_TIMEOUT, start, time.perf_counter() - origin, error=e)
+            except Exception as e:
+                log_error(f"Stage '{stage.name}' failed", e)
+                stage_span.set(outcome=STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+                return StageResult(stage.name, STATUS_FAILED, start, time.perf_counter() - origin, error=e)
+
+    async def run(self) -> RunReport:
+        """Runs every stage and returns the report once all stages have finished."""
+        origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(self._run_stage(self.stages[name], tasks, origin))
+        results = {name: await task for name, task in tasks.items()}
+        for result in results.values():
+            if result.status != STATUS_SKIPPED:
+                metrics.observe("pipeline_stage_seconds", result.duration, stage=result.name, status=result.status)
+
+        report = RunReport(results=results, critical_path=self.critical_path(results), duration=time.perf_counter() - origin)
+        metrics.observe("pipeline_run_seconds", report.duration)
+        log_info("Pipeline finished in %.2fs, critical path: %s", report.duration, report.format_critical_path())
+        return report
+
+    def run_sync(self) -> RunReport:
+        """Runs the DAG on a fresh event loop from synchronous code."""
+        return asyncio.run(self.run())
+
+    def critical_path(self, results: Dict[str, StageResult]) -> List[str]:
+        """
+        Walks back from the stage that finished last, following at each step the dependency that
+        finished last (the one the stage was waiting on).
+        """
+        ran = [r for r in results.values() if r.status != STATUS_SKIPPED]
+        if not ran:
+            return []
+        path = [max(ran, key=lambda r: r.end).name]
+        while True:
+            deps = [results[dep] for dep in self.stages[path[-1]].deps if results[dep].status != STATUS_SKIPPED]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda r: r.end).name)
+        return list(reversed(path))
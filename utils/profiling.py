@@ -0,0 +1,226 @@
+import cProfile
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from config.constants import PROJECT_ROOT
+from utils.logging_utils import log_info, log_error
+from utils.shared_store import get_shared_store
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(PROJECT_ROOT, ".cache", "profiles"))
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", 20))  # profiled runs kept on disk
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MEMORY_FRAMES = 25
+PROFILE_MEMORY_TOP = 50
+# Pending requests left unclaimed are dropped after this long
+PROFILE_REQUEST_TTL_SECONDS = int(os.getenv("PROFILE_REQUEST_TTL_SECONDS", 24 * 3600))
+# Requests live in the shared store: the admin request arming them and the profiled webhook may
+# reach different worker processes
+PROFILE_REQUESTS_NAMESPACE = "profile_requests"
+
+MODE_CPROFILE = "cprofile"
+MODE_SAMPLING = "sampling"
+PROFILE_MODES = (MODE_CPROFILE, MODE_SAMPLING)
+
+
+@dataclass
+class ProfileRequest:
+    """Profiles the next `runs` pipeline runs matching the repository and PR (None matches any)"""
+    repo: Optional[str] = None
+    pr: Optional[int] = None
+    runs: int = 1
+    mode: str = MODE_SAMPLING
+    memory: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+
+    def matches(self, repo: str, pr: int) -> bool:
+        return (self.repo is None or self.repo == repo) and (self.pr is None or self.pr == pr)
+
+
+def request_profile(repo: str = None, pr: int = None, runs: int = 1, mode: str = MODE_SAMPLING, memory: bool = False) -> ProfileRequest:
+    """Arms profiling for the next runs of a repository, of one PR, or of any PR."""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+    if runs < 1:
+        raise ValueError("runs must be at least 1")
+    profile_request = ProfileRequest(repo=repo, pr=pr, runs=runs, mode=mode, memory=memory)
+    get_shared_store().set(PROFILE_REQUESTS_NAMESPACE, profile_request.id, json.dumps(asdict(profile_request)),
+                           PROFILE_REQUEST_TTL_SECONDS)
+    log_info("Profiling armed: %s", profile_request)
+    return profile_request
+
+
+def pending_requests() -> List[ProfileRequest]:
+    """The requests of every worker process, oldest first."""
+    return [ProfileRequest(**json.loads(value)) for value in get_shared_store().items(PROFILE_REQUESTS_NAMESPACE).values()]
+
+
+def cancel_requests():
+    get_shared_store().clear(PROFILE_REQUESTS_NAMESPACE)
+
+
+def claim(repo: str, pr: int) -> Optional[ProfileRequest]:
+    """Takes one run from the first request matching a pipeline run, if any."""
+    store = get_shared_store()
+    for profile_request in pending_requests():
+        if not profile_request.matches(repo, pr):
+            continue
+        claimed = []
+
+        def take_run(value):
+            # Another process may have taken the last run since the request was listed
+            if value is None:
+                return None
+            claimed.append(ProfileRequest(**json.loads(value)))
+            claimed[0].runs -= 1
+            return json.dumps(asdict(claimed[0])) if claimed[0].runs > 0 else None
+
+        store.update(PROFILE_REQUESTS_NAMESPACE, profile_request.id, take_run, PROFILE_REQUEST_TTL_SECONDS)
+        if claimed:
+            return claimed[0]
+    return None
+
+
+class StackSampler:
+    """
+    Low overhead profiler sampling the stacks of every thread from a background thread, so the
+    worker threads of a pipeline run are covered too. Writes collapsed stacks (flamegraph input).
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _write_memory_report(path: str, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+    stats = after.compare_to(before, "lineno")
+    current, peak = tracemalloc.get_traced_memory()
+    with open(path, "w") as f:
+        f.write(f"traced memory: current={current} peak={peak} bytes\n")
+        f.write(f"top {PROFILE_MEMORY_TOP} allocation sites by growth during the run:\n")
+        for stat in stats[:PROFILE_MEMORY_TOP]:
+            f.write(f"{stat}\n")
+
+
+def enforce_retention(directory: str = PROFILE_DIR, keep: int = PROFILE_RETENTION):
+    """Removes the oldest run directories beyond `keep`."""
+    if not os.path.isdir(directory):
+        return
+    runs = sorted(entry.path for entry in os.scandir(directory) if entry.is_dir())
+    for path in runs[:max(0, len(runs) - keep)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def list_artifacts(directory: str = PROFILE_DIR) -> List[Dict]:
+    """The metadata of the profiled runs on disk, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    artifacts = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name, reverse=True):
+        try:
+            with open(os.path.join(entry.path, "meta.json")) as f:
+                artifacts.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return artifacts
+
+
+@contextmanager
+def profile_run(repo: str, pr: int, directory: str = PROFILE_DIR):
+    """
+    Profiles the enclosed pipeline run if a pending request matches it. Unprofiled runs only pay
+    one read of the shared store (a few microseconds, against runs of seconds): requests have to
+    be read there since the admin request arming them may have reached another worker process.
+    cProfile mode profiles the calling thread (the pipeline's event loop), sampling mode every
+    thread. Artifacts are written to a per-run directory under `directory`.
+
+    Yields:
+        The claimed ProfileRequest, or None
+    """
+    profile_request = claim(repo, pr)
+    if profile_request is None:
+        yield None
+        return
+
+    run_dir = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{repo.replace('/', '__')}-pr{pr}-{uuid.uuid4().hex[:6]}")
+    os.makedirs(run_dir, exist_ok=True)
+    started_tracing = profile_request.memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_MEMORY_FRAMES)
+    before = tracemalloc.take_snapshot() if profile_request.memory else None
+    profiler = None
+    if profile_request.mode == MODE_CPROFILE:
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except ValueError as error:
+            # Only one cProfile can be active per process, e.g. when two profiled runs overlap
+            log_error("cProfile unavailable, sampling instead", error)
+            profiler = None
+    if profiler is None:
+        profiler = StackSampler()
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        yield profile_request
+    finally:
+        duration = time.perf_counter() - start
+        try:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+                profiler.dump_stats(os.path.join(run_dir, "profile.pstats"))
+            else:
+                profiler.stop()
+                profiler.write(os.path.join(run_dir, "stacks.txt"))
+            if before is not None:
+                _write_memory_report(os.path.join(run_dir, "memory.txt"), before, tracemalloc.take_snapshot())
+            meta = {"request_id": profile_request.id, "repo": repo, "pr": pr, "mode": profile_request.mode,
+                    "memory": profile_request.memory, "runs_left": profile_request.runs, "duration": duration, "path": run_dir}
+            with open(os.path.join(run_dir, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=2)
+            log_info("Profiled PR #%s in %s (%s, %.2fs): %s", pr, repo, profile_request.mode, duration, run_dir)
+        except Exception as error:
+            log_error(f"Error writing profile artifacts to {run_dir}", error)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            enforce_retention(directory)
@@ -0,0 +1,97 @@
+from string import Formatter
+from typing import Any, List
+from pydantic import BaseModel
+
+# Fields used as the heading of a serialized record, in order of preference
+HEADER_FIELDS = ("filename", "file_path")
+
+# Single-line values up to this length are written inline in the record heading
+INLINE_VALUE_LIMIT = 80
+
+
+class CompiledTemplate:
+    """
+    A prompt template parsed once into literal and field segments, so rendering is a single join.
+    Uses the same `{field}` syntax as str.format / PromptTemplate.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self.segments = []
+        self.input_variables = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(template):
+            if literal:
+                self.segments.append((True, literal))
+            if field_name is not None:
+                if format_spec or conversion or not field_name.isidentifier():
+                    raise ValueError(f"Unsupported template field '{{{field_name}}}'")
+                self.segments.append((False, field_name))
+                if field_name not in self.input_variables:
+                    self.input_variables.append(field_name)
+
+    def render(self, **values: str) -> str:
+        missing = [name for name in self.input_variables if name not in values]
+        if missing:
+            raise KeyError(f"Missing template variables: {missing}")
+        return "".join(text if is_literal else str(values[text]) for is_literal, text in self.segments)
+
+    format = render
+
+
+def _serialize_record(record: BaseModel) -> str:
+    """
+    Renders a model as a heading with its short fields, followed by a raw block per long field:
+
+        ## utils/file_utils.py (status: modified)
+        --- patch
+        @@ -1,2 +1,3 @@
+        ...
+    """
+    fields = {name: getattr(record, name) for name in type(record).model_fields}
+    header = next((str(fields.pop(name)) for name in HEADER_FIELDS if fields.get(name) is not None), None)
+    inline, blocks = [], []
+    for name, value in fields.items():
+        if value is None or value == [] or value == "":
+            continue
+        if isinstance(value, list):
+            blocks.append(f"--- {name}\n" + serialize_list(value))
+        elif isinstance(value, str) and ("\n" in value or len(value) > INLINE_VALUE_LIMIT):
+            blocks.append(f"--- {name}\n{value.rstrip()}")
+        else:
+            inline.append(f"{name}: {value}")
+    heading = "## " + (header or type(record).__name__)
+    if inline:
+        heading += f" ({', '.join(inline)})"
+    return "\n".join([heading] + blocks)
+
+
+def serialize_list(values: List[Any]) -> str:
+    """Renders a list of plain values as bullets and a list of models as records."""
+    if not values:
+        return "(none)"
+    if all(isinstance(v, BaseModel) for v in values):
+        return "\n\n".join(_serialize_record(v) for v in values)
+    return "\n".join(f"- {serialize_value(v)}" for v in values)
+
+
+def serialize_value(value: Any) -> str:
+    """
+    Renders a prompt input value as compact, deterministic text. Raw text is written as is (no
+    escaped newlines or Python reprs), so patches and file content stay readable and diff-friendly.
+    """
+    if value is None:
+        return "(none)"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, BaseModel):
+        return _serialize_record(value)
+    if isinstance(value, dict):
+        return "\n".join(f"{k}: {serialize_value(v)}" for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return serialize_list(list(value))
+    return str(value)
+
+
+def serialize_input(validated_input: BaseModel) -> dict:
+    """Serializes every field of a validated prompt input model for template rendering."""
+    return {name: serialize_value(getattr(validated_input, name)) for name in type(validated_input).model_fields}
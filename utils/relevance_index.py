@@ -0,0 +1,225 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from config.constants import PROJECT_ROOT
+from utils.logging_utils import log_info, log_error
+
+TEST_INDEX_DIR = os.getenv("TEST_INDEX_DIR", os.path.join(PROJECT_ROOT, ".cache", "test_index"))
+TEST_INDEX_TOP_K = int(os.getenv("TEST_INDEX_TOP_K", 8))
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Terms from paths, imports and test names describe what a test covers better than its body
+NAME_WEIGHT = 3
+
+STOP_WORDS = {
+    "and", "as", "assert", "class", "def", "false", "for", "from", "if", "import", "in", "is", "none",
+    "not", "or", "py", "return", "self", "test", "tests", "the", "true", "with",
+}
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_TEST_NAME_RE = re.compile(r"^\s*(?:async\s+)?def\s+(test\w*)|^\s*class\s+(Test\w*)", re.MULTILINE)
+_DEFINITION_RE = re.compile(r"^[+ ]?\s*(?:async\s+)?(?:def|class)\s+(\w+)", re.MULTILINE)
+
+
+def split_identifier(identifier: str) -> List[str]:
+    """Splits snake_case and camelCase identifiers into lowercase terms, keeping the whole identifier too."""
+    parts = [p.lower() for chunk in identifier.split("_") for p in _SUBWORD_RE.findall(chunk)]
+    terms = [identifier.lower()] if len(parts) > 1 else []
+    return [t for t in terms + parts if len(t) > 1 and t not in STOP_WORDS]
+
+
+def tokenize(text: str) -> List[str]:
+    """Extracts the identifier terms of a piece of code."""
+    return [term for identifier in _IDENTIFIER_RE.findall(text or "") for term in split_identifier(identifier)]
+
+
+def _path_terms(path: str) -> List[str]:
+    return tokenize(os.path.splitext(path)[0].replace("/", " "))
+
+
+def document_terms(path: str, content: str) -> Counter:
+    """Term frequencies of a test file, weighting its path, imports and test names."""
+    terms = Counter(tokenize(content))
+    weighted = _path_terms(path)
+    for line in (content or "").splitlines():
+        if line.lstrip().startswith(("import ", "from ")):
+            weighted.extend(tokenize(line))
+    for match in _TEST_NAME_RE.finditer(content or ""):
+        weighted.extend(tokenize(match.group(1) or match.group(2)))
+    for term in weighted:
+        terms[term] += NAME_WEIGHT
+    return terms
+
+
+def query_terms(updated_files: List[Dict]) -> Counter:
+    """Terms describing a change: the changed module paths and the identifiers on changed and defined lines."""
+    terms = Counter()
+    for f in updated_files:
+        for term in _path_terms(f["filename"]):
+            terms[term] += NAME_WEIGHT
+        patch = f.get("patch") or ""
+        changed = "\n".join(line[1:] for line in patch.splitlines() if line[:1] in "+-" and not line.startswith(("+++", "---")))
+        terms.update(tokenize(changed))
+        for name in _DEFINITION_RE.findall(patch):
+            for term in split_identifier(name):
+                terms[term] += NAME_WEIGHT
+    return terms
+
+
+@dataclass
+class IndexedTest:
+    path: str
+    sha: str
+    content: str
+    terms: Dict[str, int]
+
+    @property
+    def length(self) -> int:
+        return sum(self.terms.values())
+
+
+class RelevanceIndex:
+    """
+    BM25 index over a repository's test files. Documents are keyed by blob SHA, so moving the index
+    to a new commit only tokenizes (and downloads) the test files that changed.
+    """
+
+    def __init__(self, commit: str = None, tests: Dict[str, IndexedTest] = None):
+        self.commit = commit
+        self.tests: Dict[str, IndexedTest] = tests or {}
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        self.document_frequency = Counter(term for test in self.tests.values() for term in test.terms)
+        self.average_length = (sum(t.length for t in self.tests.values()) / len(self.tests)) if self.tests else 0.0
+
+    def update(self, commit: str, blobs: Dict[str, str], fetch_content: Callable[[str, str], Optional[str]]) -> int:
+        """
+        Moves the index to a commit
+
+        Args:
+            commit: Commit SHA the blobs belong to
+            blobs: Blob SHA per test file path at that commit
+            fetch_content: Called as fetch_content(path, sha) for new or changed files
+
+        Returns:
+            Number of files that were fetched and tokenized
+        """
+        tests = {}
+        fetched = 0
+        for path, sha in sorted(blobs.items()):
+            existing = self.tests.get(path)
+            if existing is not None and existing.sha == sha:
+                tests[path] = existing
+                continue
+            try:
+                content = fetch_content(path, sha)
+            except Exception as error:
+                log_error(f"Error fetching test file {path}", error)
+                continue
+            if content is None:
+                continue
+            fetched += 1
+            tests[path] = IndexedTest(path, sha, content, dict(document_terms(path, content)))
+        self.commit = commit
+        self.tests = tests
+        self._refresh_stats()
+        return fetched
+
+    def score(self, terms: Counter) -> Dict[str, float]:
+        """BM25 score of every test for the query terms."""
+        total = len(self.tests)
+        scores = {}
+        for path, test in self.tests.items():
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * test.length / (self.average_length or 1))
+            for term in terms:
+                frequency = test.terms.get(term)
+                if not frequency:
+                    continue
+                df = self.document_frequency[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            scores[path] = score
+        return scores
+
+    def top_k(self, updated_files: List[Dict], k: int = TEST_INDEX_TOP_K) -> List[Dict]:
+        """
+        Returns the k tests most relevant to the changed files, as {"filename", "content"} dicts.
+        Tests without any matching term are never returned.
+        """
+        scores = self.score(query_terms(updated_files))
+        ranked = sorted((path for path, score in scores.items() if score > 0), key=lambda p: (-scores[p], p))[:k]
+        return [{"filename": path, "content": self.tests[path].content} for path in ranked]
+
+    def all_tests(self) -> List[Dict]:
+        return [{"filename": path, "content": test.content} for path, test in sorted(self.tests.items())]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"commit": self.commit, "tests": {p: {"sha": t.sha, "content": t.content, "terms": t.terms} for p, t in self.tests.items()}}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RelevanceIndex":
+        """Loads a saved index, returning an empty one if the file is missing or unreadable."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            tests = {p: IndexedTest(p, t["sha"], t["content"], t["terms"]) for p, t in data["tests"].items()}
+            return cls(data.get("commit"), tests)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            log_error(f"Discarding unreadable test index {path}", error)
+            return cls()
+
+
+_indexes: Dict[str, RelevanceIndex] = {}
+_index_locks: Dict[str, threading.Lock] = {}
+_index_locks_lock = threading.Lock()
+
+
+def index_path(repo: str) -> str:
+    return os.path.join(TEST_INDEX_DIR, repo.replace("/", "__") + ".json")
+
+
+def load_test_index(repo: str, commit: str, list_blobs: Callable[[], Dict[str, str]],
+                    fetch_content: Callable[[str, str], Optional[str]]) -> RelevanceIndex:
+    """
+    Returns the test index of a repository at a commit, updating the cached index incrementally.
+    Indexes are kept in memory and on disk under TEST_INDEX_DIR.
+
+    Args:
+        repo: Repository ("owner/repo")
+        commit: Commit SHA to index
+        list_blobs: Returns the blob SHA per test file path at the commit; only called when the cached index is for another commit
+        fetch_content: Called as fetch_content(path, sha) for test files that are new or changed
+    """
+    with _index_locks_lock:
+        lock = _index_locks.setdefault(repo, threading.Lock())
+    with lock:
+        path = index_path(repo)
+        cached = _indexes.get(repo) or RelevanceIndex.load(path)
+        _indexes[repo] = cached
+        if cached.commit == commit:
+            return cached
+        # Update a copy, pipelines still using the cached index keep a consistent view
+        index = RelevanceIndex(cached.commit, dict(cached.tests))
+        fetched = index.update(commit, list_blobs(), fetch_content)
+        _indexes[repo] = index
+        log_info("Indexed %d test files of %s at %s (%d fetched)", len(index.tests), repo, commit[:7], fetched)
+        index.save(path)
+        return index
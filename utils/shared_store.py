@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+from config.constants import PROJECT_ROOT
+
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH", os.path.join(PROJECT_ROOT, ".cache", "shared.sqlite3"))
+# Pages of the store mapped into memory by every process, so hot reads skip the read syscalls
+SHARED_STORE_MMAP_BYTES = int(os.getenv("SHARED_STORE_MMAP_BYTES", 64 * 2 ** 20))
+# Expired entries are removed on a write at most this often per process
+SHARED_STORE_PURGE_SECONDS = float(os.getenv("SHARED_STORE_PURGE_SECONDS", 300))
+
+
+class SharedStore:
+    """
+    Small key-value store with expiry, shared by the worker processes of a node through one SQLite
+    file (WAL journal, memory-mapped reads). Connections are opened per process, so a store created
+    before the workers fork stays usable in each of them.
+    """
+
+    def __init__(self, path: str = SHARED_STORE_PATH, mmap_bytes: int = SHARED_STORE_MMAP_BYTES,
+                 purge_seconds: float = SHARED_STORE_PURGE_SECONDS):
+        """
+        Args:
+            path: SQLite file backing the store (":memory:" for a process-local store)
+            mmap_bytes: Size of the memory-mapped part of the file
+            purge_seconds: Minimum interval between purges of the expired entries on write
+        """
+        self.path = path
+        self.mmap_bytes = mmap_bytes
+        self.purge_seconds = purge_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._purged_at = time.monotonic()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            # A connection inherited through fork must not be used, open a new one
+            if self.path != ":memory:":
+                # The store holds the installation token: only the owner may read it. SQLite gives
+                # the -wal and -shm files the permissions of the database file.
+                os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+                os.chmod(self.path, 0o600)
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._pid = os.getpid()
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+                self._conn.execute("""CREATE TABLE IF NOT EXISTS shared_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key))""")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_shared_entries_expiry ON shared_entries (expires_at)")
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Returns the value stored under the key, or None if it is missing or expired."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM shared_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO shared_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                             (namespace, key, value, time.time() + ttl_seconds))
+        self._maybe_purge()
+
+    def add(self, namespace: str, key: str, ttl_seconds: float, value: str = "") -> bool:
+        """
+        Stores the key only if it is missing or expired, atomically across processes
+
+        Returns:
+            True if the key was added, False if another caller holds it
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_entries WHERE namespace = ? AND key = ? AND expires_at <= ?", (namespace, key, now))
+                cursor = conn.execute("INSERT OR IGNORE INTO shared_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                                      (namespace, key, value, now + ttl_seconds))
+        self._maybe_purge()
+        return cursor.rowcount == 1
+
+    def update(self, namespace: str, key: str, func: Callable[[Optional[str]], Optional[str]], ttl_seconds: float) -> Optional[str]:
+        """
+        Replaces the value of a key with func(current value), atomically across processes. func gets
+        None for a missing or expired key and returns None to delete it. An existing key keeps its
+        expiry, a new one expires after ttl_seconds.
+
+        Returns:
+            The new value
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                # Take the write lock before reading, so no other process updates the key in between
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT value FROM shared_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                                   (namespace, key, now)).fetchone()
+                value = func(row[0] if row else None)
+                if value is None:
+                    conn.execute("DELETE FROM shared_entries WHERE namespace = ? AND key = ?", (namespace, key))
+                elif row is not None:
+                    conn.execute("UPDATE shared_entries SET value = ? WHERE namespace = ? AND key = ?", (value, namespace, key))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO shared_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                                 (namespace, key, value, now + ttl_seconds))
+        return value
+
+    def items(self, namespace: str) -> Dict[str, str]:
+        """Returns the unexpired values of a namespace by key, in the order they expire."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM shared_entries WHERE namespace = ? AND expires_at > ? ORDER BY expires_at, key",
+                (namespace, time.time())).fetchall()
+        return dict(rows)
+
+    def clear(self, namespace: str):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_entries WHERE namespace = ?", (namespace,))
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge(self):
+        """Removes the expired entries."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM shared_entries WHERE expires_at <= ?", (time.time(),))
+            self._purged_at = time.monotonic()
+
+    def _maybe_purge(self):
+        # Keys such as delivery IDs are written once and never read again after they expire
+        if time.monotonic() - self._purged_at >= self.purge_seconds:
+            self.purge()
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_shared_store() -> SharedStore:
+    global _shared_store
+    if _shared_store is None:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = SharedStore()
+    return _shared_store
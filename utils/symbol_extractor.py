@@ -0,0 +1,158 @@
+import ast
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from utils.diff_utils import changed_lines
+
+# Lines of context kept around changes outside of any function or class
+MODULE_CONTEXT_LINES = 3
+
+
+@dataclass
+class Symbol:
+    """A function or class defined in a file"""
+    name: str  # qualified, e.g. "PRTestAgent.run_tests"
+    kind: str  # "def" or "class"
+    start: int  # first line, including decorators
+    end: int
+    signature: str
+    calls: Set[str] = field(default_factory=set)
+    children: List["Symbol"] = field(default_factory=list)
+
+    @property
+    def short_name(self) -> str:
+        return self.name.rsplit(".", 1)[-1]
+
+
+def _signature(node, lines: List[str]) -> str:
+    """The def/class header of a node, collapsed onto one line."""
+    header = []
+    last = node.body[0].lineno - 1 if node.body[0].lineno > node.lineno else node.lineno
+    for line in lines[node.lineno - 1:last]:
+        header.append(line.strip())
+        if line.split("#", 1)[0].rstrip().endswith(":"):
+            break
+    return " ".join(header)
+
+
+def _called_names(node) -> Set[str]:
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            if isinstance(child.func, ast.Name):
+                names.add(child.func.id)
+            elif isinstance(child.func, ast.Attribute):
+                names.add(child.func.attr)
+    return names
+
+
+def collect_symbols(tree: ast.AST, lines: List[str]) -> List[Symbol]:
+    """Returns every function and class of a parsed module, outer symbols before the ones nested in them."""
+    symbols = []
+
+    def visit(node, prefix, parent):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                symbol = Symbol(name=f"{prefix}{child.name}", kind="class" if isinstance(child, ast.ClassDef) else "def",
+                                start=start, end=child.end_lineno, signature=_signature(child, lines),
+                                calls=_called_names(child))
+                symbols.append(symbol)
+                if parent is not None:
+                    parent.children.append(symbol)
+                visit(child, f"{symbol.name}.", symbol)
+            else:
+                visit(child, prefix, parent)
+
+    visit(tree, "", None)
+    return symbols
+
+
+def _innermost_owners(symbols: List[Symbol], line_count: int) -> List[Optional[Symbol]]:
+    """Maps each line to the innermost symbol containing it; nested symbols are painted over their parents."""
+    owners: List[Optional[Symbol]] = [None] * (line_count + 1)
+    for symbol in symbols:
+        for line in range(symbol.start, min(symbol.end, line_count) + 1):
+            owners[line] = symbol
+    return owners
+
+
+def _render_symbol(symbol: Symbol, lines: List[str]) -> str:
+    """Full source of a function; classes keep their own statements and the signatures of their methods."""
+    if symbol.kind == "def" or not symbol.children:
+        body = lines[symbol.start - 1:symbol.end]
+    else:
+        body = []
+        skipped = set()
+        for child in symbol.children:
+            skipped.update(range(child.start, child.end + 1))
+        for line_number in range(symbol.start, symbol.end + 1):
+            child = next((c for c in symbol.children if c.start == line_number), None)
+            if child is not None:
+                indent = lines[line_number - 1][:len(lines[line_number - 1]) - len(lines[line_number - 1].lstrip())]
+                body.append(f"{indent}{child.signature} ...")
+            elif line_number not in skipped:
+                body.append(lines[line_number - 1])
+    return f"# lines {symbol.start}-{symbol.end}: {symbol.kind} {symbol.name}\n" + "\n".join(body)
+
+
+def _module_ranges(line_numbers: List[int], line_count: int) -> List[tuple]:
+    ranges = []
+    for line in line_numbers:
+        start, end = max(1, line - MODULE_CONTEXT_LINES), min(line_count, line + MODULE_CONTEXT_LINES)
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def extract_changed_symbols(content: str, patch: str) -> Optional[str]:
+    """
+    Builds a compact context for the changes of a Python file: the source of each function or class
+    enclosing a changed line, plus the signatures of the functions they call and of the functions
+    calling them within the file. Changes outside any symbol are kept with a few lines of context.
+
+    Args:
+        content: Post-change file content
+        patch: The file's patch
+
+    Returns:
+        The context text, or None if the content does not parse as Python or nothing changed
+    """
+    if not content or not patch:
+        return None
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+    lines = content.splitlines()
+    symbols = collect_symbols(tree, lines)
+    owners = _innermost_owners(symbols, len(lines))
+
+    changed: Dict[str, Symbol] = {}
+    module_lines = []
+    for line in changed_lines(patch):
+        line = min(line, len(lines))
+        if line < 1:
+            continue
+        owner = owners[line]
+        if owner is None:
+            module_lines.append(line)
+        else:
+            changed.setdefault(owner.name, owner)
+    if not changed and not module_lines:
+        return None
+
+    sections = [_render_symbol(symbol, lines) for symbol in sorted(changed.values(), key=lambda s: s.start)]
+    sections += [f"# lines {start}-{end}\n" + "\n".join(lines[start - 1:end]) for start, end in _module_ranges(module_lines, len(lines))]
+
+    changed_names = {symbol.short_name for symbol in changed.values()}
+    called = set().union(*(symbol.calls for symbol in changed.values())) if changed else set()
+    callees = [s for s in symbols if s.short_name in called and s.name not in changed]
+    callers = [s for s in symbols if s.kind == "def" and s.calls & changed_names and s.name not in changed
+               and not any(s.name.startswith(f"{c}.") for c in changed)]
+    if callees:
+        sections.append("# Called by the changed code\n" + "\n".join(f"{s.signature}  # line {s.start}" for s in callees))
+    if callers:
+        sections.append("# Calling the changed code\n" + "\n".join(f"{s.signature}  # line {s.start}" for s in callers))
+    return "\n...\n".join(sections)
@@ -0,0 +1,140 @@
+"""
+Renders a recorded PR pipeline trace as a waterfall with its critical path.
+
+    python -m utils.trace_view [--file .cache/traces.jsonl] [--trace ID | --repo owner/repo --pr 12]
+
+Without --trace, the most recent trace matching --repo/--pr is shown.
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+from utils.tracing import TRACE_EXPORT_PATH
+
+WATERFALL_WIDTH = 60
+
+# Attributes shown next to span names, in this order
+SHOWN_ATTRIBUTES = ("endpoint", "task", "model", "prompt_tokens", "completion_tokens", "test_file", "outcome", "error")
+
+
+def load_traces(path: str) -> Dict[str, List[Dict]]:
+    """Groups the spans of a JSONL trace file by trace ID, skipping unreadable lines."""
+    traces = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+            except (ValueError, KeyError, TypeError):
+                continue
+    return dict(traces)
+
+
+def find_root(spans: List[Dict]) -> Optional[Dict]:
+    return next((s for s in spans if s.get("parent_id") is None), None)
+
+
+def select_trace(traces: Dict[str, List[Dict]], trace_id: str = None, repo: str = None, pr: int = None) -> Optional[List[Dict]]:
+    """Returns the spans of a trace by ID, or of the latest trace whose root matches the repo and PR."""
+    if trace_id is not None:
+        return traces.get(trace_id)
+    candidates = []
+    for spans in traces.values():
+        root = find_root(spans)
+        if root is None:
+            continue
+        attributes = root.get("attributes", {})
+        if repo is not None and attributes.get("repo") != repo:
+            continue
+        if pr is not None and str(attributes.get("pr")) != str(pr):
+            continue
+        candidates.append((root["start"], spans))
+    return max(candidates, key=lambda c: c[0])[1] if candidates else None
+
+
+def _children(spans: List[Dict]) -> Dict[Optional[str], List[Dict]]:
+    children = defaultdict(list)
+    for span in spans:
+        children[span.get("parent_id")].append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s["start"])
+    return children
+
+
+def critical_path(spans: List[Dict]) -> List[Dict]:
+    """
+    The chain of spans that determined the trace's duration: from the root, repeatedly the child
+    that finished last, since the parent could not finish before it.
+    """
+    root = find_root(spans)
+    if root is None:
+        return []
+    children = _children(spans)
+    path = [root]
+    while children.get(path[-1]["span_id"]):
+        path.append(max(children[path[-1]["span_id"]], key=lambda s: s["end"]))
+    return path
+
+
+def _label(span: Dict) -> str:
+    attributes = span.get("attributes", {})
+    shown = [f"{key}={attributes[key]}" for key in SHOWN_ATTRIBUTES if attributes.get(key) is not None]
+    return f"{span['name']} {' '.join(shown)}".rstrip()
+
+
+def render(spans: List[Dict], width: int = WATERFALL_WIDTH) -> str:
+    """Renders the critical path and a waterfall of every span, children indented under their parent."""
+    root = find_root(spans)
+    if root is None:
+        return "Trace has no root span"
+    origin = root["start"]
+    total = max(s["end"] for s in spans) - origin or 1e-9
+    on_path = {s["span_id"] for s in critical_path(spans)}
+    attributes = root.get("attributes", {})
+    lines = [f"Trace {root['trace_id']} {attributes.get('repo', '')}#{attributes.get('pr', '')} "
+             f"head={str(attributes.get('head_sha') or '')[:7]} {root['duration']:.2f}s", "", "Critical path:"]
+    for depth, span in enumerate(critical_path(spans)):
+        lines.append(f"  {'  ' * depth}{_label(span)}  {span['duration']:.2f}s")
+    lines += ["", "Waterfall:"]
+
+    children = _children(spans)
+
+    def visit(span, depth):
+        offset = span["start"] - origin
+        begin = int(offset / total * width)
+        length = max(1, round(span["duration"] / total * width))
+        bar = (" " * begin + ("#" if span["span_id"] in on_path else "=") * length)[:width].ljust(width)
+        marker = "!" if span.get("status") == "error" else " "
+        lines.append(f"  {offset:7.2f}s {span['duration']:7.2f}s |{bar}|{marker}{'  ' * depth}{_label(span)}")
+        for child in children.get(span["span_id"], []):
+            visit(child, depth + 1)
+
+    visit(root, 0)
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Render a PR pipeline trace")
+    parser.add_argument("--file", default=TRACE_EXPORT_PATH, help="JSONL file written by the trace exporter")
+    parser.add_argument("--trace", help="Trace ID")
+    parser.add_argument("--repo", help="Repository (owner/repo) of the PR run")
+    parser.add_argument("--pr", type=int, help="Pull request number")
+    parser.add_argument("--width", type=int, default=WATERFALL_WIDTH, help="Width of the waterfall bars")
+    args = parser.parse_args(argv)
+
+    try:
+        traces = load_traces(args.file)
+    except OSError as error:
+        print(f"Cannot read {args.file}: {error}", file=sys.stderr)
+        return 1
+    spans = select_trace(traces, args.trace, args.repo, args.pr)
+    if not spans:
+        print("No matching trace", file=sys.stderr)
+        return 1
+    print(render(spans, args.width))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import contextvars
+import fcntl
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from config.constants import PROJECT_ROOT
+from utils.logging_utils import log_error
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "True").lower() in ("true", "1")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", os.path.join(PROJECT_ROOT, ".cache", "traces.jsonl"))
+# The export file is rotated above this size, keeping TRACE_EXPORT_BACKUPS older files (traces.jsonl.1, ...)
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", 50 * 2 ** 20))
+TRACE_EXPORT_BACKUPS = int(os.getenv("TRACE_EXPORT_BACKUPS", 3))
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class _TraceBuffer:
+    """Collects the finished spans of a trace until its root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.flushed = False
+        self.lock = threading.Lock()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    thread: str = ""
+    _buffer: Optional[_TraceBuffer] = field(default=None, repr=False)
+
+    sampled = True
+
+    def set(self, **attributes):
+        """Adds attributes to the span (e.g. token counts once a call returned)."""
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+            "start": self.start, "end": self.end, "duration": self.duration, "status": self.status,
+            "thread": self.thread, "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for spans of unsampled traces and calls made outside of any trace"""
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class JSONLExporter:
+    """
+    Appends finished spans to a JSON lines file, one trace at a time, rotating it by size. The file is
+    shared by the pre-fork worker processes, so appends and rotations also hold a lock on `path`.lock.
+    """
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, max_bytes: int = TRACE_EXPORT_MAX_BYTES,
+                 backups: int = TRACE_EXPORT_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _rotate(self):
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        try:
+            # Opened for each export: a lock file descriptor inherited over fork would share its lock
+            with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a") as f:
+                    f.write(lines)
+        except OSError as error:
+            log_error(f"Error exporting {len(spans)} spans to {self.path}", error)
+
+
+_exporter: Optional[JSONLExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> JSONLExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = JSONLExporter()
+    return _exporter
+
+
+def set_exporter(exporter: Optional[JSONLExporter]):
+    """Replaces the process-wide exporter (None restores the default on next use)."""
+    global _exporter
+    _exporter = exporter
+
+
+def current_span():
+    """Returns the active span, or a no-op span outside of sampled traces."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def _finish(span: Span, error: Optional[BaseException], end: float = None):
+    span.end = end or time.time()
+    if error is not None:
+        span.status = "error"
+        span.attributes.setdefault("error", f"{type(error).__name__}: {error}")
+    buffer = span._buffer
+    with buffer.lock:
+        if buffer.flushed:
+            # The root already ended (e.g. a timed-out worker thread), export the straggler on its own
+            late = True
+        else:
+            late = False
+            buffer.spans.append(span)
+            if span.parent_id is None:
+                buffer.flushed = True
+    if late:
+        get_exporter().export([span])
+    elif span.parent_id is None:
+        get_exporter().export(buffer.spans)
+
+
+@contextmanager
+def _open_span(name: str, buffer: _TraceBuffer, parent_id: Optional[str], attributes: Dict[str, Any]):
+    span = Span(name=name, trace_id=buffer.trace_id, span_id=_new_id(), parent_id=parent_id, start=time.time(),
+                attributes=attributes, thread=threading.current_thread().name, _buffer=buffer)
+    token = _current_span.set(span)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(span, error)
+
+
+@contextmanager
+def start_trace(name: str, sample_rate: float = None, **attributes):
+    """
+    Starts a trace with a root span. The sampling decision is made here and applies to every span of
+    the trace; unsampled traces and spans cost a context variable lookup.
+
+    Args:
+        name: Name of the root span
+        sample_rate: Fraction of traces to record, defaults to TRACE_SAMPLE_RATE
+        **attributes: Attributes of the root span (e.g. repo, pr, head_sha)
+    """
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if not TRACE_ENABLED or random.random() >= rate:
+        token = _current_span.set(_NOOP_SPAN)
+        try:
+            yield _NOOP_SPAN
+        finally:
+            _current_span.reset(token)
+        return
+    with _open_span(name, _TraceBuffer(_new_id()), None, attributes) as span:
+        yield span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Opens a child span of the active span; a no-op outside of sampled traces."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield _NOOP_SPAN
+        return
+    with _open_span(name, parent._buffer, parent.span_id, attributes) as child:
+        yield child
+
+
+def add_span(name: str, duration: float, **attributes):
+    """Records an already finished child span that ended now and lasted `duration` seconds."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    end = time.time()
+    child = Span(name=name, trace_id=parent.trace_id, span_id=_new_id(), parent_id=parent.span_id, start=end - duration,
+                 attributes=attributes, thread=threading.current_thread().name, _buffer=parent._buffer)
+    _finish(child, None, end)
+
+
+def traced(name: str, **attributes):
+    """Decorator running each call of a function or coroutine function in a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(fn: Callable) -> Callable:
+    """
+    Binds a callable to a copy of the current context, so spans opened in another thread (e.g. in a
+    ThreadPoolExecutor) nest under the active span. asyncio tasks and asyncio.to_thread do this already.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
@@ -0,0 +1,59 @@
+"""
+Consumes the webhook jobs of the shared queue on this node (JOB_QUEUE_ENABLED). Each repository is
+owned by one node on the consistent hash ring of live nodes, so its blob cache, test index and mirror
+stay warm there; repositories move when nodes join or leave.
+
+    NODE_ID=node-a python -m webhook.job_worker --concurrency 4
+
+SIGTERM or SIGINT stops leasing, lets the running jobs finish and leaves the ring.
+"""
+import argparse
+import os
+import signal
+import sys
+from typing import List
+from agents.pr_pipeline import PRPipeline
+from utils.job_queue import NODE_ID, Job, QueueWorker, get_job_queue
+from utils.logging_utils import log_error, log_info
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 2))
+
+
+def handle_job(job: Job):
+    """
+    Runs the pipeline of a queued pull request event; raises so that a failed review is retried.
+    Test generation commits to the PR branch and posts a comment, so it runs on the first attempt
+    only: retries only redo the review, whose comment is edited in place.
+    """
+    if job.event != "pull_request":
+        log_info("Ignoring job %d for event %s", job.id, job.event)
+        return
+    generate_tests = job.payload.get("action") == "opened" and not job.progress.get("tests_started")
+    if generate_tests:
+        # Saved before the run, so a node dying mid-run does not commit the tests twice either
+        job.progress["tests_started"] = True
+        get_job_queue().save_progress(job)
+    elif job.attempts > 1:
+        log_info("Retrying only the review of job %d", job.id)
+    review_success, test_success, _ = PRPipeline(job.payload, generate_tests=generate_tests).run()
+    if not test_success:
+        log_error(f"Test generation failed for job {job.id}")
+    if not review_success:
+        raise RuntimeError("PR review failed")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the queued webhook jobs owned by this node")
+    parser.add_argument("--node-id", default=NODE_ID, help="Identifier of this node on the hash ring")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="Jobs run at the same time")
+    args = parser.parse_args(argv)
+
+    worker = QueueWorker(get_job_queue(), handle_job, node_id=args.node_id, concurrency=args.concurrency)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    worker.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
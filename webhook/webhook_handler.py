@@ -1,7 +1,8 @@
 import json
 from flask import Blueprint, request, jsonify
 from utils.github_utils import save_webhook_data
-from agents.pr_base_agent import PRCommentAgent, PRTestAgent
+from agents.pr_pipeline import PRPipeline
+from utils.job_queue import JOB_QUEUE_ENABLED, get_job_queue, shard_key
 from utils.logging_utils import log_info, log_error
 
 webhook_blueprint = Blueprint("webhook", __name__)
@@ -18,18 +19,22 @@ def process_webhook(event, data):
         save_webhook_data(data)  # Save webhook data for debugging
 
         action = data.get("action")
-        if event == "pull_request" and action == "opened":
-            log_info("Handling PR opened event.")
+        if event == "pull_request" and action in ("opened", "synchronize"):
+            log_info(f"Handling PR {action} event.")
+
+            if JOB_QUEUE_ENABLED:
+                # The node owning the repository on the hash ring runs it (webhook/job_worker.py)
+                job_id = get_job_queue().enqueue(event, data)
+                log_info("Queued job %d for %s", job_id, shard_key(data))
+                return jsonify({"message": "Queued", "job": job_id}), 202
             
-            # Run PR Comment Agent first
-            comment_success = PRCommentAgent().handle_pull_request_opened(data)
+            # Review and test generation run as one DAG, so independent stages overlap. New pushes
+            # (including the generated test commits) only re-review the files whose content changed.
+            comment_success, test_success, _ = PRPipeline(data, generate_tests=action == "opened").run()
             if not comment_success:
                 log_error("PR Comment Agent failed to complete successfully")
                 return jsonify({"message": "PR review failed"}), 500
             
-            # Only proceed with test generation if comment agent succeeds
-            log_info("Generating tests for the PR.")
-            test_success = PRTestAgent().handle_pull_request_for_test_agent(data)
             if not test_success:
                 log_error("Test Generation Agent failed to complete successfully")
                 return jsonify({"message": "Test generation failed"}), 500